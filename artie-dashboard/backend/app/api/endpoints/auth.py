@@ -3,16 +3,21 @@ Authentication API endpoints: signup, login, token refresh
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import timedelta
 
-from backend.app.database import get_db
+from backend.app.core.telemetry import timed
+from backend.app.database import get_async_db
 from backend.app.models import User
+from backend.app.services import principal_cache
+from backend.app.services.principal_cache import Principal, principal_claims
 from backend.app.auth import (
-    verify_password,
-    get_password_hash,
+    PasswordHashBusy,
+    hash_password_async,
+    verify_and_update_async,
     create_access_token,
     create_refresh_token,
     decode_token,
@@ -53,12 +58,25 @@ class TokenResponse(BaseModel):
     user: UserResponse
 
 
+def _hash_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in attempts in progress, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
 # Dependency to get current user from token
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current user from JWT token"""
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """
+    Get current user from JWT token.
+
+    Served from signed claims (AUTH_STATELESS_CLAIMS) or the principal cache
+    when possible; the database is only read on a cache miss.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -73,7 +91,7 @@ async def get_current_user(
     if email is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == email).first()
+    user = principal_cache.from_claims(payload) or await principal_cache.get_principal(db, email)
     if user is None:
         raise credentials_exception
     
@@ -81,8 +99,8 @@ async def get_current_user(
 
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: Principal = Depends(get_current_user)
+) -> Principal:
     """Get current active user"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -91,13 +109,14 @@ async def get_current_active_user(
 
 # Endpoints
 @router.post("/signup", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
-async def signup(user_data: UserSignup, db: Session = Depends(get_db)):
+@timed("auth.signup")
+async def signup(user_data: UserSignup, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     
     # Check if user already exists
-    existing_user = db.query(User).filter(
+    existing_user = (await db.execute(select(User).where(
         (User.email == user_data.email) | (User.username == user_data.username)
-    ).first()
+    ))).scalars().first()
     
     if existing_user:
         raise HTTPException(
@@ -106,7 +125,10 @@ async def signup(user_data: UserSignup, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    try:
+        hashed_password = await hash_password_async(user_data.password)
+    except PasswordHashBusy:
+        raise _hash_pool_busy()
     new_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -117,12 +139,12 @@ async def signup(user_data: UserSignup, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # Create tokens
     access_token = create_access_token(
-        data={"sub": new_user.email, "role": new_user.role}
+        data=principal_claims(new_user)
     )
     refresh_token = create_refresh_token(
         data={"sub": new_user.email}
@@ -136,18 +158,25 @@ async def signup(user_data: UserSignup, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=TokenResponse)
+@timed("auth.login")
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login user and return tokens"""
     
     # Find user by username or email
-    user = db.query(User).filter(
+    user = (await db.execute(select(User).where(
         (User.username == form_data.username) | (User.email == form_data.username)
-    ).first()
-    
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    ))).scalars().first()
+    
+    verified, new_hash = False, None
+    if user:
+        try:
+            verified, new_hash = await verify_and_update_async(form_data.password, user.hashed_password)
+        except PasswordHashBusy:
+            raise _hash_pool_busy()
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -160,9 +189,14 @@ async def login(
             detail="Inactive user account"
         )
     
+    # Stored hash used an older cost factor: keep the one computed at BCRYPT_ROUNDS
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    
     # Create tokens
     access_token = create_access_token(
-        data={"sub": user.email, "role": user.role}
+        data=principal_claims(user)
     )
     refresh_token = create_refresh_token(
         data={"sub": user.email}
@@ -176,15 +210,17 @@ async def login(
 
 
 @router.get("/me", response_model=UserResponse)
+@timed("auth.me")
 async def get_current_user_info(
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """Get current user information"""
     return UserResponse.from_orm(current_user)
 
 
 @router.post("/refresh", response_model=TokenResponse)
-async def refresh_access_token(refresh_token: str, db: Session = Depends(get_db)):
+@timed("auth.refresh")
+async def refresh_access_token(refresh_token: str, db: AsyncSession = Depends(get_async_db)):
     """Refresh access token using refresh token"""
     
     payload = decode_token(refresh_token)
@@ -195,7 +231,7 @@ async def refresh_access_token(refresh_token: str, db: Session = Depends(get_db)
         )
     
     email = payload.get("sub")
-    user = db.query(User).filter(User.email == email).first()
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     
     if not user or not user.is_active:
         raise HTTPException(
@@ -205,7 +241,7 @@ async def refresh_access_token(refresh_token: str, db: Session = Depends(get_db)
     
     # Create new access token
     new_access_token = create_access_token(
-        data={"sub": user.email, "role": user.role}
+        data=principal_claims(user)
     )
     
     return TokenResponse(
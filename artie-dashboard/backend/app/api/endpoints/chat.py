@@ -1,6 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from pydantic import BaseModel
-from backend.app.services.llm_service import propose_widgets
+from backend.app.core.concurrency import cancel_on_disconnect
+from backend.app.services.llm_service import apropose_widgets
 
 router = APIRouter()
 
@@ -13,6 +14,8 @@ class ChatReq(BaseModel):
 
 
 @router.post("/chat/propose")
-def chat_propose(req: ChatReq):
-    out = propose_widgets(req.domain, req.intent, req.columns, req.hints)
+async def chat_propose(req: ChatReq, request: Request):
+    out = await cancel_on_disconnect(
+        request, apropose_widgets(req.domain, req.intent, req.columns, req.hints)
+    )
     return {"proposals": out}
@@ -1,8 +1,11 @@
 from fastapi import APIRouter
 
+from backend.app.core.telemetry import timed
+
 router = APIRouter()
 
 
 @router.get("/dashboard")
+@timed("dashboard.get")
 def get_dashboard():
     return {"widgets": []}
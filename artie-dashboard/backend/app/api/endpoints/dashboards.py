@@ -2,15 +2,19 @@
 Dashboard API endpoints for dashboard management
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 from typing import List, Optional, Any, Dict
 from datetime import datetime
 
-# Commented out until PostgreSQL is set up
-# from backend.app.database import get_db
-# from backend.app.models import Dashboard, Widget, User
-# from backend.app.api.endpoints.auth import get_current_active_user
+from backend.app.core.telemetry import timed
+from backend.app.database import get_async_db
+from backend.app.models import Dashboard, Widget
+from backend.app.api.endpoints.auth import get_current_active_user
+from backend.app.api.endpoints.widgets import WidgetResponse
+from backend.app.services.principal_cache import Principal
 
 router = APIRouter(prefix="/api/dashboards", tags=["dashboards"])
 
@@ -47,257 +51,217 @@ class DashboardResponse(BaseModel):
 
 
 class DashboardWithWidgets(DashboardResponse):
-    widgets: List[Dict[str, Any]] = []
+    widgets: List[WidgetResponse] = []
 
 
-# Endpoints (Currently returning mock data until PostgreSQL is set up)
+# Shown for a role until the user saves a dashboard of their own (id 0: not stored)
+DEFAULT_DASHBOARDS = {
+    "CEO": ("Executive Dashboard", "Complete business overview with all key metrics"),
+    "CFO": ("Financial Dashboard", "Financial metrics and analysis"),
+    "Manager": ("Operations Dashboard", "Team and operations metrics"),
+    "Employee": ("Personal Dashboard", "Personal performance and tasks"),
+}
 
-@router.post("/", response_model=DashboardResponse, status_code=status.HTTP_201_CREATED)
-async def create_dashboard(dashboard: DashboardCreate):
-    """
-    Create a new dashboard for the current user
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    Currently returns mock data for testing.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # new_dashboard = Dashboard(
-    #     user_id=current_user.id,
-    #     role=dashboard.role,
-    #     name=dashboard.name,
-    #     description=dashboard.description,
-    #     layout=dashboard.layout,
-    #     is_default=dashboard.is_default,
-    # )
-    # db.add(new_dashboard)
-    # db.commit()
-    # db.refresh(new_dashboard)
-    # return new_dashboard
-    
-    # Mock response for now
+# Widget columns copied when cloning a dashboard
+WIDGET_FIELDS = (
+    "title", "type", "chart_type", "data", "config", "vega_spec",
+    "position_x", "position_y", "width", "height",
+)
+
+
+def canonical_role(role: str) -> str:
+    """Known roles in their stored spelling ("ceo" -> "CEO", "manager" -> "Manager")"""
+    for known in DEFAULT_DASHBOARDS:
+        if known.lower() == role.strip().lower():
+            return known
+    return role
+
+
+def get_default_dashboard_for_role(role: str, user_id: int) -> Dict[str, Any]:
+    if role not in DEFAULT_DASHBOARDS:
+        raise HTTPException(status_code=404, detail=f"No dashboard found for role: {role}")
+    name, description = DEFAULT_DASHBOARDS[role]
+    now = datetime.utcnow()
     return {
-        "id": 1,
-        "user_id": 1,
-        "role": dashboard.role,
-        "name": dashboard.name,
-        "description": dashboard.description,
-        "layout": dashboard.layout,
-        "is_default": dashboard.is_default,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
+        "id": 0,
+        "user_id": user_id,
+        "role": role,
+        "name": name,
+        "description": description,
+        "layout": None,
+        "is_default": True,
+        "created_at": now,
+        "updated_at": now,
+        "widgets": [],
     }
 
 
+async def _get_owned_dashboard(
+    db: AsyncSession, dashboard_id: int, user: Principal, with_widgets: bool = False
+) -> Dashboard:
+    query = select(Dashboard).where(Dashboard.id == dashboard_id, Dashboard.user_id == user.id)
+    if with_widgets:
+        # Widgets come with the dashboard (one extra IN query), never per widget
+        query = query.options(selectinload(Dashboard.widgets))
+    dashboard = (await db.execute(query)).scalars().first()
+    if not dashboard:
+        raise HTTPException(status_code=404, detail="Dashboard not found")
+    return dashboard
+
+
+async def _clear_other_defaults(db: AsyncSession, dashboard: Dashboard) -> None:
+    """Keep at most one default dashboard per user and role"""
+    await db.execute(
+        update(Dashboard)
+        .where(
+            Dashboard.user_id == dashboard.user_id,
+            Dashboard.role == dashboard.role,
+            Dashboard.id != dashboard.id,
+            Dashboard.is_default.is_(True),
+        )
+        .values(is_default=False)
+    )
+
+
+
+
+# Endpoints
+
+@router.post("/", response_model=DashboardResponse, status_code=status.HTTP_201_CREATED)
+@timed("dashboards.create_dashboard")
+async def create_dashboard(
+    dashboard: DashboardCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Create a new dashboard for the current user"""
+    new_dashboard = Dashboard(
+        user_id=current_user.id,
+        role=canonical_role(dashboard.role),
+        name=dashboard.name,
+        description=dashboard.description,
+        layout=dashboard.layout,
+        is_default=dashboard.is_default,
+    )
+    db.add(new_dashboard)
+    await db.flush()
+    if new_dashboard.is_default:
+        await _clear_other_defaults(db, new_dashboard)
+    await db.commit()
+    return new_dashboard
+
+
 @router.get("/", response_model=List[DashboardResponse])
-async def get_user_dashboards():
-    """
-    Get all dashboards for the current user
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    Currently returns empty list.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # dashboards = db.query(Dashboard).filter(Dashboard.user_id == current_user.id).all()
-    # return dashboards
-    
-    return []
+@timed("dashboards.get_user_dashboards")
+async def get_user_dashboards(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Get all dashboards for the current user"""
+    dashboards = (await db.execute(
+        select(Dashboard).where(Dashboard.user_id == current_user.id).order_by(Dashboard.id)
+    )).scalars().all()
+    return dashboards
 
 
 @router.get("/role/{role}", response_model=DashboardWithWidgets)
-async def get_role_dashboard(role: str):
+@timed("dashboards.get_role_dashboard")
+async def get_role_dashboard(
+    role: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
     """
-    Get the default dashboard for a specific role
-    If no dashboard exists, returns a default configuration
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
+    Get the current user's dashboard for a role, with its widgets
+
+    The default dashboard wins, then the most recently updated one. If the
+    user has none for the role, returns the role's default configuration.
     """
-    # TODO: Uncomment once PostgreSQL is set up
-    # dashboard = db.query(Dashboard).filter(
-    #     Dashboard.role == role,
-    #     Dashboard.is_default == True
-    # ).first()
-    
-    # if not dashboard:
-    #     # Return default dashboard configuration for role
-    #     return get_default_dashboard_for_role(role)
-    
-    # # Get widgets for this dashboard
-    # widgets = db.query(Widget).filter(Widget.dashboard_id == dashboard.id).all()
-    
-    # return {
-    #     **dashboard.__dict__,
-    #     "widgets": [w.__dict__ for w in widgets]
-    # }
-    
-    # Mock response with default configurations
-    default_dashboards = {
-        "CEO": {
-            "id": 1,
-            "user_id": 1,
-            "role": "CEO",
-            "name": "Executive Dashboard",
-            "description": "Complete business overview with all key metrics",
-            "layout": None,
-            "is_default": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
-            "widgets": []
-        },
-        "CFO": {
-            "id": 2,
-            "user_id": 1,
-            "role": "CFO",
-            "name": "Financial Dashboard",
-            "description": "Financial metrics and analysis",
-            "layout": None,
-            "is_default": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
-            "widgets": []
-        },
-        "Manager": {
-            "id": 3,
-            "user_id": 1,
-            "role": "Manager",
-            "name": "Operations Dashboard",
-            "description": "Team and operations metrics",
-            "layout": None,
-            "is_default": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
-            "widgets": []
-        },
-        "Employee": {
-            "id": 4,
-            "user_id": 1,
-            "role": "Employee",
-            "name": "Personal Dashboard",
-            "description": "Personal performance and tasks",
-            "layout": None,
-            "is_default": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
-            "widgets": []
-        }
-    }
-    
-    if role.upper() in default_dashboards:
-        return default_dashboards[role.upper()]
-    else:
-        raise HTTPException(status_code=404, detail=f"No dashboard found for role: {role}")
+    role = canonical_role(role)
+    dashboard = (await db.execute(
+        select(Dashboard)
+        .where(Dashboard.user_id == current_user.id, Dashboard.role == role)
+        .order_by(Dashboard.is_default.desc(), Dashboard.updated_at.desc())
+        .limit(1)
+        .options(selectinload(Dashboard.widgets))
+    )).scalars().first()
+
+    if not dashboard:
+        return get_default_dashboard_for_role(role, current_user.id)
+    return dashboard
 
 
 @router.get("/{dashboard_id}", response_model=DashboardWithWidgets)
-async def get_dashboard(dashboard_id: int):
-    """
-    Get a specific dashboard with its widgets
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # dashboard = db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
-    # if not dashboard:
-    #     raise HTTPException(status_code=404, detail="Dashboard not found")
-    
-    # widgets = db.query(Widget).filter(Widget.dashboard_id == dashboard_id).all()
-    
-    # return {
-    #     **dashboard.__dict__,
-    #     "widgets": [w.__dict__ for w in widgets]
-    # }
-    
-    raise HTTPException(status_code=501, detail="PostgreSQL not configured yet")
+@timed("dashboards.get_dashboard")
+async def get_dashboard(
+    dashboard_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Get a specific dashboard with its widgets"""
+    return await _get_owned_dashboard(db, dashboard_id, current_user, with_widgets=True)
 
 
 @router.put("/{dashboard_id}", response_model=DashboardResponse)
-async def update_dashboard(dashboard_id: int, dashboard_update: DashboardUpdate):
-    """
-    Update a dashboard (name, description, layout, is_default)
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # dashboard = db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
-    # if not dashboard:
-    #     raise HTTPException(status_code=404, detail="Dashboard not found")
-    
-    # # Update only provided fields
-    # update_data = dashboard_update.dict(exclude_unset=True)
-    # for field, value in update_data.items():
-    #     setattr(dashboard, field, value)
-    
-    # dashboard.updated_at = datetime.utcnow()
-    # db.commit()
-    # db.refresh(dashboard)
-    # return dashboard
-    
-    raise HTTPException(status_code=501, detail="PostgreSQL not configured yet")
+@timed("dashboards.update_dashboard")
+async def update_dashboard(
+    dashboard_id: int,
+    dashboard_update: DashboardUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Update a dashboard (name, description, layout, is_default)"""
+    dashboard = await _get_owned_dashboard(db, dashboard_id, current_user)
+
+    # Update only provided fields
+    update_data = dashboard_update.dict(exclude_unset=True)
+    for field, value in update_data.items():
+        setattr(dashboard, field, value)
+
+    dashboard.updated_at = datetime.utcnow()
+    if update_data.get("is_default"):
+        await _clear_other_defaults(db, dashboard)
+    await db.commit()
+    return dashboard
 
 
 @router.delete("/{dashboard_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_dashboard(dashboard_id: int):
-    """
-    Delete a dashboard and all its widgets
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # dashboard = db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
-    # if not dashboard:
-    #     raise HTTPException(status_code=404, detail="Dashboard not found")
-    
-    # db.delete(dashboard)  # Cascade will delete widgets automatically
-    # db.commit()
-    # return None
-    
-    raise HTTPException(status_code=501, detail="PostgreSQL not configured yet")
+@timed("dashboards.delete_dashboard")
+async def delete_dashboard(
+    dashboard_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Delete a dashboard and all its widgets"""
+    dashboard = await _get_owned_dashboard(db, dashboard_id, current_user, with_widgets=True)
+    await db.delete(dashboard)  # Cascade will delete widgets automatically
+    await db.commit()
+    return None
 
 
 @router.post("/{dashboard_id}/clone", response_model=DashboardResponse)
-async def clone_dashboard(dashboard_id: int, new_name: Optional[str] = None):
-    """
-    Clone an existing dashboard with all its widgets
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # original = db.query(Dashboard).filter(Dashboard.id == dashboard_id).first()
-    # if not original:
-    #     raise HTTPException(status_code=404, detail="Dashboard not found")
-    
-    # # Create new dashboard
-    # new_dashboard = Dashboard(
-    #     user_id=current_user.id,
-    #     role=original.role,
-    #     name=new_name or f"{original.name} (Copy)",
-    #     description=original.description,
-    #     layout=original.layout,
-    #     is_default=False,
-    # )
-    # db.add(new_dashboard)
-    # db.flush()
-    
-    # # Clone widgets
-    # original_widgets = db.query(Widget).filter(Widget.dashboard_id == dashboard_id).all()
-    # for widget in original_widgets:
-    #     new_widget = Widget(
-    #         dashboard_id=new_dashboard.id,
-    #         user_id=current_user.id,
-    #         title=widget.title,
-    #         type=widget.type,
-    #         chart_type=widget.chart_type,
-    #         data=widget.data,
-    #         config=widget.config,
-    #         vega_spec=widget.vega_spec,
-    #         position_x=widget.position_x,
-    #         position_y=widget.position_y,
-    #         width=widget.width,
-    #         height=widget.height,
-    #     )
-    #     db.add(new_widget)
-    
-    # db.commit()
-    # db.refresh(new_dashboard)
-    # return new_dashboard
-    
-    raise HTTPException(status_code=501, detail="PostgreSQL not configured yet")
+@timed("dashboards.clone_dashboard")
+async def clone_dashboard(
+    dashboard_id: int,
+    new_name: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Clone an existing dashboard with all its widgets"""
+    original = await _get_owned_dashboard(db, dashboard_id, current_user, with_widgets=True)
+
+    new_dashboard = Dashboard(
+        user_id=current_user.id,
+        role=original.role,
+        name=new_name or f"{original.name} (Copy)",
+        description=original.description,
+        layout=original.layout,
+        is_default=False,
+        widgets=[
+            Widget(user_id=current_user.id, **{field: getattr(widget, field) for field in WIDGET_FIELDS})
+            for widget in original.widgets
+        ],
+    )
+    db.add(new_dashboard)
+    await db.commit()
+    return new_dashboard
@@ -0,0 +1,107 @@
+"""
+Dataset registry and query endpoints
+
+The query and preview endpoints negotiate their encoding: row JSON by default, Arrow IPC or
+column-oriented JSON on request (see ``services.columnar``).
+"""
+from typing import Any, Dict, Optional
+
+import pyarrow as pa
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from backend.app.core.concurrency import run_blocking
+from backend.app.services import columnar, dataset_registry
+from backend.app.services.aggregation import QueryError, preview_table, run_query_table
+
+router = APIRouter()
+
+
+class QueryReq(BaseModel):
+    x: str
+    y: Optional[str] = None  # "SUM(amount)", "COUNT(*)" or a bare column
+    group_by: Optional[str] = None
+    aggregate: Optional[str] = None  # overrides the function in y
+    time_grain: Optional[str] = None  # day | week | month | quarter | year
+    limit: Optional[int] = None
+    exact: bool = False  # skip sampling/HyperLogLog on very large datasets
+
+
+def _encode(media_type: str, meta: Dict[str, Any], table: pa.Table) -> bytes:
+    if media_type == columnar.ARROW_MIME:
+        return columnar.encode_arrow(table, meta)
+    return columnar.encode_columnar_json(table, meta)
+
+
+async def _respond(request: Request, fmt: Optional[str], meta: Dict[str, Any], table: pa.Table) -> Response:
+    media_type = columnar.negotiate(request.headers.get("accept"), fmt)
+    headers = {"Vary": "Accept"}
+    if media_type == columnar.JSON_MIME:
+        rows = await run_blocking(columnar.table_rows, table)
+        return JSONResponse({**meta, "rows": rows}, headers=headers)
+    body = await run_blocking(_encode, media_type, meta, table)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+@router.post("/datasets/{dataset_id}/query")
+async def query_dataset(
+    dataset_id: str,
+    req: QueryReq,
+    request: Request,
+    format: Optional[str] = Query(default=None),
+):
+    """Aggregate the full dataset for one widget and return only the grouped points"""
+    try:
+        meta, table = await run_blocking(run_query_table, dataset_id, req.model_dump())
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await _respond(request, format, meta, table)
+
+
+@router.get("/datasets/{dataset_id}/preview")
+async def preview_dataset(
+    dataset_id: str,
+    request: Request,
+    limit: int = Query(default=200, ge=1, le=10000),
+    format: Optional[str] = Query(default=None),
+):
+    """First ``limit`` rows of a dataset"""
+    try:
+        table = await run_blocking(preview_table, dataset_id, limit)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return await _respond(request, format, {"dataset_id": dataset_id}, table)
+
+
+@router.get("/datasets")
+async def list_datasets(
+    owner_id: Optional[int] = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=1000),
+    offset: int = Query(default=0, ge=0),
+):
+    """Registered datasets, most recently used first"""
+    return {"datasets": await run_blocking(dataset_registry.list_datasets, owner_id, limit, offset)}
+
+
+@router.get("/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    """Registry metadata: schema, row counts, size, profile and owner"""
+    meta = await run_blocking(dataset_registry.get, dataset_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return meta
+
+
+@router.delete("/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    """Remove a dataset's files, cached state and registry row"""
+    try:
+        deleted = await run_blocking(dataset_registry.delete, dataset_id)
+    except ValueError:
+        deleted = False  # not a valid dataset id
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return {"dataset_id": dataset_id, "deleted": True}
@@ -0,0 +1,83 @@
+"""
+Runtime metrics endpoints
+
+``/metrics`` serves everything in the Prometheus text format; the JSON
+endpoints under ``/api/metrics`` are for humans.
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from backend.app import auth
+from backend.app.core.telemetry import register_gauge, render_prometheus
+from backend.app.services import aggregation, dataset_registry, document_ingest, principal_cache
+from backend.app.services.duckdb_pool import pool
+from backend.app.services.llm_cache import proposal_cache
+
+router = APIRouter()
+# Mounted without the /api prefix so scrapers find the conventional path
+prometheus_router = APIRouter()
+
+register_gauge("duckdb_active_cursors", "DuckDB cursors currently checked out",
+               lambda: pool.stats()["active_cursors"])
+register_gauge("duckdb_cursor_wait_seconds_total", "Time spent waiting for a DuckDB cursor",
+               lambda: pool.stats()["total_wait_seconds"], "counter")
+register_gauge("llm_cache_lookups_total", "Widget-proposal cache lookups",
+               lambda: {(("result", "hit"),): proposal_cache.hits, (("result", "miss"),): proposal_cache.misses},
+               "counter")
+register_gauge("query_cache_lookups_total", "Aggregation cache lookups",
+               lambda: {(("result", "hit"),): aggregation.stats()["hits"],
+                        (("result", "miss"),): aggregation.stats()["misses"]},
+               "counter")
+register_gauge("document_cache_lookups_total", "Extracted-table cache lookups per PDF page / DOCX table",
+               lambda: {(("result", "hit"),): document_ingest.stats()["hits"],
+                        (("result", "miss"),): document_ingest.stats()["misses"]},
+               "counter")
+
+register_gauge("dataset_hot_handles", "Dataset handles open in the in-memory hot set",
+               lambda: dataset_registry.stats()["handles"])
+register_gauge("dataset_hot_bytes", "Bytes of DataFrames held by hot dataset handles",
+               lambda: dataset_registry.stats()["bytes"])
+register_gauge("dataset_hot_evictions_total", "Dataset handles evicted from the hot set",
+               lambda: dataset_registry.stats()["evictions"], "counter")
+
+register_gauge("password_hash_queue_depth", "Password hash/verify calls waiting for a worker",
+               lambda: auth.hash_pool_stats()["queued"])
+register_gauge("password_hash_active", "Password hash/verify calls running",
+               lambda: auth.hash_pool_stats()["running"])
+register_gauge("password_hash_wait_seconds_total", "Time password hash/verify calls spent queued",
+               lambda: auth.hash_pool_stats()["wait_seconds"], "counter")
+register_gauge("password_hash_rejected_total", "Password hash/verify calls refused because the queue was full",
+               lambda: auth.hash_pool_stats()["rejected"], "counter")
+register_gauge("auth_principal_lookups_total", "Token principal resolutions by source",
+               lambda: {(("result", "hit"),): principal_cache.stats()["hits"],
+                        (("result", "miss"),): principal_cache.stats()["misses"],
+                        (("result", "stateless"),): principal_cache.stats()["stateless"]},
+               "counter")
+register_gauge("auth_principal_invalidations_total", "Principal cache invalidations after user changes",
+               lambda: principal_cache.stats()["invalidations"], "counter")
+register_gauge("password_rehash_total", "Stored password hashes upgraded to the configured cost factor on login",
+               lambda: auth.hash_pool_stats()["rehashed"], "counter")
+
+
+@prometheus_router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus exposition: stage/HTTP latency histograms and runtime gauges"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/duckdb")
+def duckdb_metrics():
+    """Shared DuckDB pool statistics"""
+    return pool.stats()
+
+
+@router.get("/metrics/llm-cache")
+def llm_cache_metrics():
+    """Widget-proposal cache hit/miss counters"""
+    return proposal_cache.stats()
+
+
+@router.get("/metrics/query-cache")
+def query_cache_metrics():
+    """Server-side aggregation cache hit/miss counters"""
+    return aggregation.stats()
@@ -1,7 +1,7 @@
 import os, uuid, shutil
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from backend.app.services.dashboard_generator import generate_quick_viz
+from backend.app.services.dashboard_generator import agenerate_quick_viz
 
 router = APIRouter()
 
@@ -22,5 +22,5 @@ async def upload_file(
     with open(fpath, "wb") as out:
         shutil.copyfileobj(file.file, out)
 
-    widgets = generate_quick_viz(csv_path=fpath, domain=domain, intent=intent)
+    widgets, _, _ = await agenerate_quick_viz(csv_path=fpath, domain=domain, intent=intent)
     return JSONResponse({"dataset_id": os.path.basename(fpath), "widgets": widgets})
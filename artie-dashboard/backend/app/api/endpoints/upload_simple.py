@@ -8,6 +8,12 @@ import uuid
 from pathlib import Path
 import pandas as pd
 
+from backend.app.core.concurrency import run_blocking
+from backend.app.services import dataset_store
+from backend.app.services.aggregation import preview_table
+from backend.app.services.columnar import table_rows
+from backend.app.services.excel_ingest import ingest_workbook
+
 router = APIRouter()
 
 # Create upload directory
@@ -36,6 +42,7 @@ async def upload_simple(
         # Try to read if CSV or XLSX
         widgets = []
         preview = []
+        ingest = None
         
         if file.filename.endswith('.csv'):
             try:
@@ -56,19 +63,19 @@ async def upload_simple(
         
         elif file.filename.endswith(('.xlsx', '.xls')):
             try:
-                # Try to read Excel file - requires openpyxl
-                df = pd.read_excel(file_path)
-                preview = df.head(10).to_dict('records')
+                # Every sheet becomes a table; the first one with data is previewed
+                ingest = await run_blocking(ingest_workbook, str(file_path), dataset_store.new_dataset_id())
+                preview = await run_blocking(lambda: table_rows(preview_table(ingest["dataset_id"], 10)))
                 
                 # Create simple widgets
-                for col in df.columns[:3]:
+                for col in list(preview[0])[:3] if preview else []:
                     widgets.append({
                         "type": "table",
                         "title": f"{col} Data",
                         "subtitle": f"Column: {col}"
                     })
                 
-                print(f"✅ Parsed Excel: {df.shape[0]} rows, {df.shape[1]} cols")
+                print(f"✅ Parsed Excel: {ingest['tables']} sheets, {ingest['rows']} rows in {ingest['seconds']}s")
             except Exception as e:
                 print(f"⚠️ Excel parse failed: {e}")
                 # Still save the file, just don't create widgets
@@ -80,6 +87,7 @@ async def upload_simple(
             "preview": preview,
             "domain": domain,
             "intent": intent,
+            "ingest": ingest,
             "message": "Upload successful (simple mode)"
         })
         
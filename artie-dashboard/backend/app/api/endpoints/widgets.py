@@ -2,18 +2,40 @@
 Widget API endpoints for dashboard widget management
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import JSON, Integer, bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional, Any, Dict
-from datetime import datetime
+from datetime import datetime, timezone
 
-# Commented out until PostgreSQL is set up
-# from backend.app.database import get_db
-# from backend.app.models import Widget, Dashboard, User
-# from backend.app.api.endpoints.auth import get_current_active_user
+from backend.app.core.telemetry import timed
+from backend.app.database import get_async_db
+from backend.app.models import Widget, Dashboard
+from backend.app.api.endpoints.auth import get_current_active_user
+from backend.app.services.principal_cache import Principal
 
 router = APIRouter(prefix="/api/widgets", tags=["widgets"])
 
+# Fields the bulk update may change; a missing or null value keeps the stored one
+BULK_FIELDS = ("position_x", "position_y", "width", "height", "config")
+
+_widgets = Widget.__table__
+
+# One statement for the whole batch, executed with a parameter set per widget.
+# The stored updated_at must still be the one read under lock (optimistic check).
+_BULK_UPDATE = (
+    update(_widgets)
+    .where(_widgets.c.id == bindparam("b_id"), _widgets.c.updated_at == bindparam("b_seen"))
+    .values(
+        position_x=func.coalesce(bindparam("b_position_x", type_=Integer), _widgets.c.position_x),
+        position_y=func.coalesce(bindparam("b_position_y", type_=Integer), _widgets.c.position_y),
+        width=func.coalesce(bindparam("b_width", type_=Integer), _widgets.c.width),
+        height=func.coalesce(bindparam("b_height", type_=Integer), _widgets.c.height),
+        config=func.coalesce(bindparam("b_config", type_=JSON(none_as_null=True)), _widgets.c.config),
+        updated_at=bindparam("b_now"),
+    )
+)
+
 
 # Request/Response models
 class WidgetCreate(BaseModel):
@@ -64,158 +86,179 @@ class WidgetResponse(BaseModel):
         from_attributes = True
 
 
-# Endpoints (Currently returning mock data until PostgreSQL is set up)
+class WidgetBulkUpdate(BaseModel):
+    id: int
+    position_x: Optional[int] = None
+    position_y: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    config: Optional[Dict[str, Any]] = None
+    # updated_at the client last saw; the change is refused if the widget moved on since
+    updated_at: Optional[datetime] = None
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def _get_owned_widget(db: AsyncSession, widget_id: int, user: Principal) -> Widget:
+    widget = (await db.execute(
+        select(Widget).where(Widget.id == widget_id, Widget.user_id == user.id)
+    )).scalars().first()
+    if not widget:
+        raise HTTPException(status_code=404, detail="Widget not found")
+    return widget
+
+
+async def _check_dashboard_owner(db: AsyncSession, dashboard_id: int, user: Principal) -> None:
+    owned = (await db.execute(
+        select(Dashboard.id).where(Dashboard.id == dashboard_id, Dashboard.user_id == user.id)
+    )).first()
+    if not owned:
+        raise HTTPException(status_code=404, detail="Dashboard not found")
+
+
+# Endpoints
 
 @router.post("/", response_model=WidgetResponse, status_code=status.HTTP_201_CREATED)
-async def create_widget(widget: WidgetCreate):
-    """
-    Create a new widget for a dashboard
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    Currently returns mock data for testing.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # new_widget = Widget(
-    #     dashboard_id=widget.dashboard_id,
-    #     user_id=current_user.id,
-    #     title=widget.title,
-    #     type=widget.type,
-    #     chart_type=widget.chart_type,
-    #     data=widget.data,
-    #     config=widget.config,
-    #     vega_spec=widget.vega_spec,
-    #     position_x=widget.position_x,
-    #     position_y=widget.position_y,
-    #     width=widget.width,
-    #     height=widget.height,
-    # )
-    # db.add(new_widget)
-    # db.commit()
-    # db.refresh(new_widget)
-    # return new_widget
-    
-    # Mock response for now
-    return {
-        "id": 1,
-        "dashboard_id": widget.dashboard_id,
-        "user_id": 1,
-        "title": widget.title,
-        "type": widget.type,
-        "chart_type": widget.chart_type,
-        "data": widget.data,
-        "config": widget.config,
-        "vega_spec": widget.vega_spec,
-        "position_x": widget.position_x,
-        "position_y": widget.position_y,
-        "width": widget.width,
-        "height": widget.height,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
-    }
+@timed("widgets.create_widget")
+async def create_widget(
+    widget: WidgetCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Create a new widget on one of the current user's dashboards"""
+    await _check_dashboard_owner(db, widget.dashboard_id, current_user)
+    new_widget = Widget(user_id=current_user.id, **widget.dict())
+    db.add(new_widget)
+    await db.commit()
+    await db.refresh(new_widget)
+    return new_widget
 
 
 @router.get("/dashboard/{dashboard_id}", response_model=List[WidgetResponse])
-async def get_dashboard_widgets(dashboard_id: int):
-    """
-    Get all widgets for a specific dashboard
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    Currently returns empty list.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # widgets = db.query(Widget).filter(Widget.dashboard_id == dashboard_id).all()
-    # return widgets
-    
-    return []
+@timed("widgets.get_dashboard_widgets")
+async def get_dashboard_widgets(
+    dashboard_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Get all widgets for a specific dashboard, in layout order"""
+    await _check_dashboard_owner(db, dashboard_id, current_user)
+    widgets = (await db.execute(
+        select(Widget)
+        .where(Widget.dashboard_id == dashboard_id)
+        .order_by(Widget.position_y, Widget.position_x, Widget.id)
+    )).scalars().all()
+    return widgets
 
 
 @router.get("/{widget_id}", response_model=WidgetResponse)
-async def get_widget(widget_id: int):
-    """
-    Get a specific widget by ID
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # widget = db.query(Widget).filter(Widget.id == widget_id).first()
-    # if not widget:
-    #     raise HTTPException(status_code=404, detail="Widget not found")
-    # return widget
-    
-    raise HTTPException(status_code=501, detail="PostgreSQL not configured yet")
+@timed("widgets.get_widget")
+async def get_widget(
+    widget_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Get a specific widget by ID"""
+    return await _get_owned_widget(db, widget_id, current_user)
 
 
 @router.put("/{widget_id}", response_model=WidgetResponse)
-async def update_widget(widget_id: int, widget_update: WidgetUpdate):
-    """
-    Update a widget (position, size, data, config)
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # widget = db.query(Widget).filter(Widget.id == widget_id).first()
-    # if not widget:
-    #     raise HTTPException(status_code=404, detail="Widget not found")
-    
-    # # Update only provided fields
-    # update_data = widget_update.dict(exclude_unset=True)
-    # for field, value in update_data.items():
-    #     setattr(widget, field, value)
-    
-    # widget.updated_at = datetime.utcnow()
-    # db.commit()
-    # db.refresh(widget)
-    # return widget
-    
-    raise HTTPException(status_code=501, detail="PostgreSQL not configured yet")
+@timed("widgets.update_widget")
+async def update_widget(
+    widget_id: int,
+    widget_update: WidgetUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Update a widget (position, size, data, config)"""
+    widget = await _get_owned_widget(db, widget_id, current_user)
+
+    # Update only provided fields
+    update_data = widget_update.dict(exclude_unset=True)
+    for field, value in update_data.items():
+        setattr(widget, field, value)
+
+    widget.updated_at = datetime.utcnow()
+    await db.commit()
+    return widget
 
 
 @router.delete("/{widget_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_widget(widget_id: int):
-    """
-    Delete a widget
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
-    """
-    # TODO: Uncomment once PostgreSQL is set up
-    # widget = db.query(Widget).filter(Widget.id == widget_id).first()
-    # if not widget:
-    #     raise HTTPException(status_code=404, detail="Widget not found")
-    
-    # db.delete(widget)
-    # db.commit()
-    # return None
-    
-    raise HTTPException(status_code=501, detail="PostgreSQL not configured yet")
+@timed("widgets.delete_widget")
+async def delete_widget(
+    widget_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
+    """Delete a widget"""
+    widget = await _get_owned_widget(db, widget_id, current_user)
+    await db.delete(widget)
+    await db.commit()
+    return None
 
 
 @router.post("/bulk-update")
-async def bulk_update_widgets(updates: List[Dict[str, Any]]):
+@timed("widgets.bulk_update")
+async def bulk_update_widgets(
+    updates: List[WidgetBulkUpdate],
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user),
+):
     """
-    Bulk update widget positions and sizes (useful for drag-and-drop layouts)
-    
+    Bulk update widget positions, sizes and config (useful for drag-and-drop layouts)
+
     Expected format:
     [
-        {"id": 1, "position_x": 0, "position_y": 0, "width": 6, "height": 4},
-        {"id": 2, "position_x": 6, "position_y": 0, "width": 6, "height": 4},
+        {"id": 1, "position_x": 0, "position_y": 0, "width": 6, "height": 4, "updated_at": "..."},
+        {"id": 2, "position_x": 6, "position_y": 0, "width": 6, "height": 4, "updated_at": "..."},
         ...
     ]
-    
-    **Note:** This endpoint will be fully functional once PostgreSQL is set up.
+
+    The batch costs two statements whatever its size: the widgets are read
+    and locked, then a single UPDATE runs once per widget (executemany), all
+    in one transaction. When ``updated_at`` is given and no longer matches,
+    that widget is left alone and reported as ``conflict`` with its current
+    ``updated_at``. Each widget gets a result: ``updated``, ``conflict`` or
+    ``not_found`` (missing or owned by another user).
     """
-    # TODO: Uncomment once PostgreSQL is set up
-    # updated_widgets = []
-    # for update in updates:
-    #     widget = db.query(Widget).filter(Widget.id == update["id"]).first()
-    #     if widget:
-    #         widget.position_x = update.get("position_x", widget.position_x)
-    #         widget.position_y = update.get("position_y", widget.position_y)
-    #         widget.width = update.get("width", widget.width)
-    #         widget.height = update.get("height", widget.height)
-    #         widget.updated_at = datetime.utcnow()
-    #         updated_widgets.append(widget)
-    
-    # db.commit()
-    # return {"updated": len(updated_widgets)}
-    
-    return {"updated": 0, "message": "PostgreSQL not configured yet"}
+    # A widget listed twice takes its last entry
+    by_id = {u.id: u for u in updates}
+    if not by_id:
+        return {"updated": 0, "results": []}
+
+    stored = dict((await db.execute(
+        select(Widget.id, Widget.updated_at)
+        .where(Widget.id.in_(by_id), Widget.user_id == current_user.id)
+        .with_for_update()
+    )).all())
+
+    now = datetime.utcnow()
+    results, params = [], []
+    for widget_id, change in by_id.items():
+        seen = stored.get(widget_id)
+        if widget_id not in stored:
+            results.append({"id": widget_id, "status": "not_found"})
+        elif change.updated_at is not None and _naive_utc(change.updated_at) != seen:
+            results.append({"id": widget_id, "status": "conflict", "updated_at": seen})
+        else:
+            results.append({"id": widget_id, "status": "updated", "updated_at": now})
+            params.append({
+                "b_id": widget_id,
+                "b_seen": seen,
+                "b_now": now,
+                **{f"b_{field}": getattr(change, field) for field in BULK_FIELDS},
+            })
+
+    if params:
+        result = await db.execute(_BULK_UPDATE, params)
+        # The rows are locked on databases that support it; elsewhere a writer may
+        # have slipped in between the read and the update
+        if db.bind.dialect.supports_sane_multi_rowcount and result.rowcount != len(params):
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="Widgets changed during the update, please retry")
+    await db.commit()
+    return {"updated": len(params), "results": results}
@@ -1,31 +1,150 @@
 """
 Authentication utilities: JWT tokens, password hashing
+
+bcrypt is deliberately slow (~100-300ms of CPU per call at cost 12), so the
+async endpoints hash and verify on a small dedicated thread pool (bcrypt
+releases the GIL) instead of on the event loop. The pool's queue is bounded:
+when PASSWORD_HASH_MAX_QUEUE calls are already waiting, ``PasswordHashBusy``
+is raised rather than letting a login burst queue without limit.
 """
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+import bcrypt
 import os
 
+from backend.app.core.config import settings
+from backend.app.core.telemetry import timed
+
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production-please-use-secure-random-string")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # 30 minutes
 REFRESH_TOKEN_EXPIRE_DAYS = 7  # 7 days
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt only reads the first 72 bytes; older bcrypt releases truncated silently,
+# newer ones raise, so truncate explicitly to keep existing hashes verifiable
+BCRYPT_MAX_BYTES = 72
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash",
+)
+_hash_lock = threading.Lock()
+_hash_stats: Dict[str, float] = {
+    "queued": 0,
+    "running": 0,
+    "completed": 0,
+    "rejected": 0,
+    "rehashed": 0,
+    "wait_seconds": 0.0,
+}
+
+
+class PasswordHashBusy(RuntimeError):
+    """The password hashing queue is full"""
+
+
+def _encode(password: str) -> bytes:
+    return password.encode("utf-8")[:BCRYPT_MAX_BYTES]
 
 
 # Password hashing functions
+@timed("auth.verify_password")
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    try:
+        return bcrypt.checkpw(_encode(plain_password), hashed_password.encode("utf-8"))
+    except ValueError:  # not a bcrypt hash
+        return False
 
 
+@timed("auth.hash_password")
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    salt = bcrypt.gensalt(rounds=settings.bcrypt_rounds)
+    return bcrypt.hashpw(_encode(password), salt).decode("utf-8")
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Cost factor of a bcrypt hash (``$2b$12$...``), None when it is not one"""
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True when the hash was made with a different cost factor than BCRYPT_ROUNDS"""
+    return hash_rounds(hashed_password) != settings.bcrypt_rounds
+
+
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password; on success also return a new hash when the stored
+    one uses an outdated cost factor (None otherwise)
+    """
+    if not verify_password(plain_password, hashed_password):
+        return False, None
+    if not needs_rehash(hashed_password):
+        return True, None
+    with _hash_lock:
+        _hash_stats["rehashed"] += 1
+    return True, get_password_hash(plain_password)
+
+
+async def _run_hash(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run ``fn`` on the password pool; raises PasswordHashBusy when the queue is full"""
+    with _hash_lock:
+        if _hash_stats["queued"] >= settings.password_hash_max_queue:
+            _hash_stats["rejected"] += 1
+            raise PasswordHashBusy("Too many password checks in progress")
+        _hash_stats["queued"] += 1
+    submitted = time.perf_counter()
+
+    def work():
+        with _hash_lock:
+            _hash_stats["queued"] -= 1
+            _hash_stats["running"] += 1
+            _hash_stats["wait_seconds"] += time.perf_counter() - submitted
+        try:
+            return fn(*args)
+        finally:
+            with _hash_lock:
+                _hash_stats["running"] -= 1
+                _hash_stats["completed"] += 1
+
+    def on_done(future):
+        # A call cancelled before a worker picked it up never runs ``work``
+        if future.cancelled():
+            with _hash_lock:
+                _hash_stats["queued"] -= 1
+
+    ctx = contextvars.copy_context()
+    future = _hash_executor.submit(functools.partial(ctx.run, work))
+    future.add_done_callback(on_done)
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password_async(password: str) -> str:
+    """``get_password_hash`` on the password pool"""
+    return await _run_hash(get_password_hash, password)
+
+
+async def verify_and_update_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """``verify_and_update`` on the password pool"""
+    return await _run_hash(verify_and_update, plain_password, hashed_password)
+
+
+def hash_pool_stats() -> Dict[str, float]:
+    with _hash_lock:
+        return dict(_hash_stats, workers=settings.password_hash_workers)
 
 
 # JWT token functions
@@ -37,7 +156,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire, "type": "access"})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow(), "type": "access"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -51,6 +170,7 @@ def create_refresh_token(data: dict):
     return encoded_jwt
 
 
+@timed("auth.decode_token")
 def decode_token(token: str) -> dict:
     """Decode and verify JWT token"""
     try:
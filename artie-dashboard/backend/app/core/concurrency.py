@@ -0,0 +1,81 @@
+"""
+Helpers for keeping async endpoints off the event loop's critical path
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+
+from backend.app.core.config import settings
+
+T = TypeVar("T")
+
+# Bounded pool for parsing / DuckDB / pandas work; sized independently of
+# Starlette's default threadpool so heavy uploads cannot starve sync endpoints
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=settings.blocking_workers,
+    thread_name_prefix="blocking",
+)
+
+_process_executor: Optional[ProcessPoolExecutor] = None
+_process_lock = threading.Lock()
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """
+    Shared pool for CPU-bound parsing that would hold the GIL in a thread.
+
+    Created on first use with the ``spawn`` start method: forking a process
+    that already runs DuckDB and executor threads is not safe. A pool broken
+    by a crashed worker is replaced.
+    """
+    global _process_executor
+    with _process_lock:
+        if _process_executor is None or getattr(_process_executor, "_broken", False):
+            _process_executor = ProcessPoolExecutor(
+                max_workers=settings.process_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_executor
+
+
+def shutdown_process_pool() -> None:
+    global _process_executor
+    with _process_lock:
+        if _process_executor is not None:
+            _process_executor.shutdown(wait=False, cancel_futures=True)
+            _process_executor = None
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking callable on the bounded worker pool and await its result"""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. the request's correlation id) into the worker thread
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_blocking_executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T], poll_interval: float = 0.5) -> T:
+    """
+    Await ``awaitable`` but cancel it as soon as the client goes away.
+
+    Raises HTTPException(499) after cancelling, so no further work is done
+    for a response nobody will read.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
@@ -11,6 +11,15 @@ class Settings(BaseSettings):
     # LLM
     groq_api_key: str = Field(default="", alias="GROQ_API_KEY")
     groq_model: str = Field(default="llama-3.1-70b-versatile", alias="GROQ_MODEL")
+    llm_max_concurrency: int = Field(default=4, alias="LLM_MAX_CONCURRENCY")
+    llm_timeout_seconds: float = Field(default=30.0, alias="LLM_TIMEOUT_SECONDS")
+    llm_cache_backend: str = Field(default="memory", alias="LLM_CACHE_BACKEND")  # memory | sqlite | none
+    llm_cache_path: str = Field(default="app/tmp/llm_cache.sqlite3", alias="LLM_CACHE_PATH")
+    llm_cache_ttl_seconds: int = Field(default=24 * 3600, alias="LLM_CACHE_TTL_SECONDS")
+    llm_cache_max_entries: int = Field(default=1024, alias="LLM_CACHE_MAX_ENTRIES")
+    # Heuristic widgets are always built first; the LLM only refines them when enabled
+    # (uploads return the heuristic widgets and refine them in the background)
+    llm_refine_widgets: bool = Field(default=True, alias="LLM_REFINE_WIDGETS")
 
     # Storage
     aws_region: str = Field(default="us-east-1", alias="AWS_REGION")
@@ -22,6 +31,79 @@ class Settings(BaseSettings):
     # DB / cache
     database_url: str = Field(default="sqlite:///./artie.db", alias="DATABASE_URL")
     redis_url: str | None = Field(default=None, alias="REDIS_URL")
+    # Connection pools of the sync and async engines (each gets its own)
+    db_pool_size: int = Field(default=5, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, alias="DB_MAX_OVERFLOW")
+    db_pool_recycle_seconds: int = Field(default=1800, alias="DB_POOL_RECYCLE_SECONDS")
+    db_pool_timeout_seconds: float = Field(default=30.0, alias="DB_POOL_TIMEOUT_SECONDS")
+
+    # Ingest
+    ingest_chunk_bytes: int = Field(default=1024 * 1024, alias="INGEST_CHUNK_BYTES")
+    ingest_memory_limit: str = Field(default="512MB", alias="INGEST_MEMORY_LIMIT")
+
+    # Worker threads for parsing and DuckDB work called from async endpoints
+    blocking_workers: int = Field(default=4, alias="BLOCKING_WORKERS")
+    # Worker processes for CPU-bound parsing (Excel sheets, document pages)
+    process_workers: int = Field(default=4, alias="PROCESS_WORKERS")
+    # "auto" uses calamine when python-calamine is installed, else pandas' default reader
+    excel_engine: str = Field(default="auto", alias="EXCEL_ENGINE")
+    # Downcast numerics, categorise repeated text and parse dates before storing parsed frames
+    optimize_dtypes: bool = Field(default=True, alias="OPTIMIZE_DTYPES")
+    dtype_category_max_ratio: float = Field(default=0.5, alias="DTYPE_CATEGORY_MAX_RATIO")
+    # Extracted tables per PDF page / DOCX table, keyed by content hash
+    document_cache_entries: int = Field(default=4096, alias="DOCUMENT_CACHE_ENTRIES")
+
+    # DuckDB query pool
+    duckdb_memory_limit: str = Field(default="1GB", alias="DUCKDB_MEMORY_LIMIT")
+    duckdb_threads: int = Field(default=4, alias="DUCKDB_THREADS")
+    duckdb_max_cursors: int = Field(default=8, alias="DUCKDB_MAX_CURSORS")
+
+    # Profiling
+    profile_cache_entries: int = Field(default=128, alias="PROFILE_CACHE_ENTRIES")
+    # How preview/hint rows are drawn: "reservoir" (uniform over all parts) or "head"
+    profile_sample_method: str = Field(default="reservoir", alias="PROFILE_SAMPLE_METHOD")
+    # Server-side widget aggregates, keyed by (dataset, spec)
+    query_cache_entries: int = Field(default=1024, alias="QUERY_CACHE_ENTRIES")
+    # Widgets over datasets with at least APPROX_MIN_ROWS rows are estimated from a
+    # uniform sample of APPROX_SAMPLE_ROWS rows unless the query asks for exact results
+    approx_queries: bool = Field(default=True, alias="APPROX_QUERIES")
+    approx_min_rows: int = Field(default=5_000_000, alias="APPROX_MIN_ROWS")
+    approx_sample_rows: int = Field(default=200_000, alias="APPROX_SAMPLE_ROWS")
+
+    # Password hashing: bcrypt cost factor (stored hashes with another cost are
+    # re-hashed on login) and the bounded worker pool that runs it off the event loop
+    bcrypt_rounds: int = Field(default=12, ge=4, le=31, alias="BCRYPT_ROUNDS")
+    password_hash_workers: int = Field(default=2, alias="PASSWORD_HASH_WORKERS")
+    password_hash_max_queue: int = Field(default=64, alias="PASSWORD_HASH_MAX_QUEUE")
+    # Authenticated users cached per token subject; with stateless claims on, access
+    # tokens carry the user's id/role and requests skip the lookup entirely
+    auth_principal_cache_ttl_seconds: int = Field(default=30, alias="AUTH_PRINCIPAL_CACHE_TTL_SECONDS")
+    auth_principal_cache_entries: int = Field(default=4096, alias="AUTH_PRINCIPAL_CACHE_ENTRIES")
+    auth_stateless_claims: bool = Field(default=False, alias="AUTH_STATELESS_CLAIMS")
+
+    # Upload dedup cache
+    upload_cache_entries: int = Field(default=256, alias="UPLOAD_CACHE_ENTRIES")
+    upload_dir_max_bytes: int = Field(default=2 * 1024 ** 3, alias="UPLOAD_DIR_MAX_BYTES")
+
+    # Dataset registry: open handles kept in memory and the on-disk Parquet quota
+    dataset_hot_entries: int = Field(default=64, alias="DATASET_HOT_ENTRIES")
+    dataset_hot_max_bytes: int = Field(default=512 * 1024 ** 2, alias="DATASET_HOT_MAX_BYTES")
+    dataset_dir_max_bytes: int = Field(default=10 * 1024 ** 3, alias="DATASET_DIR_MAX_BYTES")
+
+    # Background upload jobs (in-process queue)
+    upload_job_workers: int = Field(default=2, alias="UPLOAD_JOB_WORKERS")
+    upload_job_history: int = Field(default=500, alias="UPLOAD_JOB_HISTORY")
+    upload_job_poll_seconds: float = Field(default=0.5, alias="UPLOAD_JOB_POLL_SECONDS")
+
+    # Logging (JSON lines, size-rotated)
+    log_level: str = Field(default="INFO", alias="LOG_LEVEL")
+    log_file: str = Field(default="app/tmp/logs/app.log", alias="LOG_FILE")
+    log_max_bytes: int = Field(default=10 * 1024 ** 2, alias="LOG_MAX_BYTES")
+    log_backup_count: int = Field(default=5, alias="LOG_BACKUP_COUNT")
+    log_to_stderr: bool = Field(default=True, alias="LOG_TO_STDERR")
+
+    # Tracing: OTLP/JSON spans, one per line; unset disables the exporter
+    trace_file: str | None = Field(default=None, alias="TRACE_FILE")
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,141 @@
+"""
+Structured, non-blocking logging.
+
+Records from the ``backend`` logger tree are rendered as one JSON object per
+line. Callers only pay for a ``QueueHandler.put``. A background
+``QueueListener`` thread formats the records and writes them to a
+size-rotated file (and optionally stderr). Every record carries the
+current request's correlation id, taken from the ``X-Request-ID`` header or
+generated per request.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from backend.app.core.config import settings
+
+ROOT_DIR = Path(__file__).parent.parent.parent  # backend/
+LOGGER_NAME = "backend"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the correlation id of the request that produced them"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; ``extra=`` fields are included as-is"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text  # rendered before the record was queued
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler`` that keeps the traceback out of ``msg``"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The base class folds the formatted traceback into msg and clears
+        # exc_info, so JsonFormatter would never emit "exc". The message args
+        # and the traceback are still rendered here, on the caller's thread,
+        # but the traceback goes to exc_text.
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging() -> None:
+    """Install the queue handler on the ``backend`` logger (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_path = Path(settings.log_file)
+    if not log_path.is_absolute():
+        log_path = ROOT_DIR / log_path
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    formatter = JsonFormatter()
+    handlers = []
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_path,
+        maxBytes=settings.log_max_bytes,
+        backupCount=settings.log_backup_count,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(formatter)
+    handlers.append(file_handler)
+    if settings.log_to_stderr:
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = StructuredQueueHandler(log_queue)
+    # The id must be read on the caller's thread, before the record is queued
+    queue_handler.addFilter(RequestIdFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(settings.log_level.upper())
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+async def request_id_middleware(request, call_next):
+    """Bind a correlation id to the request context and echo it in the response"""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
@@ -0,0 +1,275 @@
+"""
+Latency instrumentation.
+
+``timed("upload.parse_file")`` works as a context manager (``with`` or
+``async with``) and as a decorator for sync and async functions. Every
+timed block is observed into the ``stage_duration_seconds`` histogram,
+which ``render_prometheus`` exposes in the Prometheus text format.
+
+When ``TRACE_FILE`` is set, each timed block is also written as a span
+(OTLP/JSON field names, one span per line) so traces can be loaded into
+OpenTelemetry tooling. Nested blocks share the trace and record their
+parent span. The trace id is the request's correlation id.
+"""
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import string
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.app.core.config import settings
+from backend.app.core.log import request_id_var
+
+ROOT_DIR = Path(__file__).parent.parent.parent  # backend/
+METRIC_PREFIX = "elas_"
+
+# Seconds; spans sub-millisecond cache hits up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span: ContextVar[Optional[Tuple[str, str]]] = ContextVar("current_span", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """(count, sum) per label tuple; diff two calls to time a single request"""
+        with self._lock:
+            return {labels: (v[2], v[1]) for labels, v in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items()]
+        for labels, (counts, total, count) in sorted(items):
+            base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stage_seconds = Histogram(
+    METRIC_PREFIX + "stage_duration_seconds",
+    "Duration of instrumented stages",
+    ("stage", "status"),
+)
+http_seconds = Histogram(
+    METRIC_PREFIX + "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+
+# name -> (help, type, callback returning {label-tuple-or-(): value})
+_gauges: Dict[str, Tuple[str, str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = {}
+
+
+def register_gauge(name: str, help_text: str, fn: Callable[[], Any], metric_type: str = "gauge") -> None:
+    """
+    Export a value computed at scrape time.
+
+    ``fn`` returns a number, or a dict mapping label tuples such as
+    ``(("state", "queued"),)`` to numbers.
+    """
+    _gauges[METRIC_PREFIX + name] = (help_text, metric_type, fn)
+
+
+def render_prometheus() -> str:
+    lines = stage_seconds.render() + http_seconds.render()
+    for name, (help_text, metric_type, fn) in sorted(_gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        series = value if isinstance(value, dict) else {(): value}
+        for labels, v in series.items():
+            if v is None:
+                continue
+            label_text = ",".join(f'{k}="{_escape(val)}"' for k, val in labels)
+            lines.append(f"{name}{{{label_text}}} {float(v)}" if label_text else f"{name} {float(v)}")
+    return "\n".join(lines) + "\n"
+
+
+_span_logger: Optional[logging.Logger] = None
+_span_listener: Optional[logging.handlers.QueueListener] = None
+_span_lock = threading.Lock()
+
+
+def _spans() -> Optional[logging.Logger]:
+    """Queue-backed writer for the span file, created on first use"""
+    global _span_logger, _span_listener
+    if not settings.trace_file:
+        return None
+    if _span_logger is not None:
+        return _span_logger
+    with _span_lock:
+        if _span_logger is None:
+            path = Path(settings.trace_file)
+            if not path.is_absolute():
+                path = ROOT_DIR / path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=settings.log_max_bytes, backupCount=settings.log_backup_count, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            log_queue: queue.Queue = queue.Queue(-1)
+            logger = logging.getLogger("spans")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            _span_listener = logging.handlers.QueueListener(log_queue, handler)
+            _span_listener.start()
+            _span_logger = logger
+    return _span_logger
+
+
+def shutdown_tracing() -> None:
+    global _span_logger, _span_listener
+    if _span_listener is not None:
+        _span_listener.stop()
+    _span_logger = _span_listener = None
+
+
+def _export(name: str, trace_id: str, span_id: str, parent_id: Optional[str],
+            start_ns: int, end_ns: int, error: Optional[BaseException], attrs: Dict[str, Any]) -> None:
+    writer = _spans()
+    if writer is None:
+        return
+    span = {
+        "traceId": trace_id,
+        "spanId": span_id,
+        "parentSpanId": parent_id or "",
+        "name": name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": start_ns,
+        "endTimeUnixNano": end_ns,
+        "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in attrs.items()],
+        "status": {"code": 2, "message": repr(error)} if error else {"code": 1},
+    }
+    writer.info(json.dumps(span))
+
+
+def _new_trace_id() -> str:
+    """The request's correlation id when it is a valid 32-hex trace id, else a random one"""
+    request_id = request_id_var.get()
+    if request_id and len(request_id) == 32 and all(c in string.hexdigits for c in request_id):
+        return request_id.lower()
+    return os.urandom(16).hex()
+
+
+class timed:
+    """Time a block or function as stage ``name``; extra keyword args become span attributes"""
+
+    def __init__(self, name: str, **attrs: Any):
+        self.name = name
+        self.attrs = attrs
+
+    def _start(self) -> None:
+        parent = _current_span.get()
+        self._trace_id = parent[0] if parent else _new_trace_id()
+        self._parent_id = parent[1] if parent else None
+        self._span_id = os.urandom(8).hex()
+        self._token = _current_span.set((self._trace_id, self._span_id))
+        self._start_ns = time.time_ns()
+        self._t0 = time.perf_counter()
+
+    def _finish(self, error: Optional[BaseException]) -> None:
+        elapsed = time.perf_counter() - self._t0
+        _current_span.reset(self._token)
+        stage_seconds.observe(elapsed, self.name, "error" if error else "ok")
+        if settings.trace_file:
+            _export(self.name, self._trace_id, self._span_id, self._parent_id,
+                    self._start_ns, self._start_ns + int(elapsed * 1e9), error, self.attrs)
+
+    def __enter__(self):
+        self._start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._finish(exc)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def __call__(self, fn: Callable) -> Callable:
+        name, attrs = self.name, self.attrs
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timed(name, **attrs):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(name, **attrs):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+async def timing_middleware(request, call_next):
+    """
+    Observe every request into the HTTP histogram, labelled by route template.
+
+    The request is also the root span, so stages timed while serving it
+    share one trace.
+    """
+    trace_id, span_id = _new_trace_id(), os.urandom(8).hex()
+    token = _current_span.set((trace_id, span_id))
+    start_ns = time.time_ns()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_span.reset(token)
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        http_seconds.observe(elapsed, request.method, path, str(status))
+        if settings.trace_file:
+            _export(f"{request.method} {path}", trace_id, span_id, None, start_ns,
+                    start_ns + int(elapsed * 1e9), None, {"http.status_code": status})
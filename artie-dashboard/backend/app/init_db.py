@@ -1,11 +1,12 @@
 """
 Database initialization script
 - Creates all tables from models
+- Adds indexes introduced since the tables were created
 - Creates default admin user
 """
 from sqlalchemy.orm import Session
 from backend.app.database import engine, SessionLocal, Base
-from backend.app.models import User, Dashboard, Widget, BusinessInfo
+from backend.app.models import User, Dashboard, Widget, BusinessInfo, Dataset
 from backend.app.auth import get_password_hash
 import sys
 
@@ -15,6 +16,12 @@ def init_db():
     print("🔧 Creating database tables...")
     Base.metadata.create_all(bind=engine)
     print("✅ Database tables created successfully!")
+    
+    # create_all skips tables that already exist, and with them any index added later
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    print("✅ Indexes up to date!")
 
 
 def create_default_admin(db: Session):
@@ -27,10 +34,8 @@ def create_default_admin(db: Session):
         print(f"⚠️  Admin user already exists: {admin_email}")
         return existing_admin
     
-    # Create admin user - use bcrypt directly to avoid passlib version issues
-    import bcrypt
-    password_bytes = "admin123".encode('utf-8')
-    hashed_password = bcrypt.hashpw(password_bytes, bcrypt.gensalt()).decode('utf-8')
+    # Create admin user
+    hashed_password = get_password_hash("admin123")
     
     admin = User(
         email=admin_email,
@@ -5,6 +5,7 @@ from backend.app.models.user import User
 from backend.app.models.dashboard import Dashboard
 from backend.app.models.widget import Widget
 from backend.app.models.business_info import BusinessInfo
+from backend.app.models.dataset import Dataset
 
-__all__ = ["User", "Dashboard", "Widget", "BusinessInfo"]
+__all__ = ["User", "Dashboard", "Widget", "BusinessInfo", "Dataset"]
 
@@ -1,7 +1,7 @@
 """
 Dashboard model for storing user dashboard configurations
 """
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.app.database import Base
@@ -10,6 +10,10 @@ from backend.app.database import Base
 class Dashboard(Base):
     """Dashboard model for user configurations"""
     __tablename__ = "dashboards"
+    __table_args__ = (
+        # A user's dashboards for one role (get_role_dashboard)
+        Index("ix_dashboards_user_id_role", "user_id", "role"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -23,4 +27,9 @@ class Dashboard(Base):
     
     # Relationships
     user = relationship("User", back_populates="dashboards")
-    widgets = relationship("Widget", back_populates="dashboard", cascade="all, delete-orphan")
+    widgets = relationship(
+        "Widget",
+        back_populates="dashboard",
+        cascade="all, delete-orphan",
+        order_by="(Widget.position_y, Widget.position_x, Widget.id)",
+    )
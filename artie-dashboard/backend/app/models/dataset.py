@@ -0,0 +1,23 @@
+"""
+Dataset model: registry entry for an ingested upload
+"""
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, JSON
+from datetime import datetime
+from backend.app.database import Base
+
+
+class Dataset(Base):
+    """Metadata for a dataset stored as Parquet under ``app/tmp/datasets``"""
+    __tablename__ = "datasets"
+    
+    id = Column(String(32), primary_key=True)  # dataset_store id
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+    name = Column(String, nullable=False)  # original file name
+    source_type = Column(String, nullable=True)  # csv, xlsx, pdf, ...
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the uploaded bytes
+    row_count = Column(BigInteger, default=0)
+    size_bytes = Column(BigInteger, default=0)
+    tables = Column(JSON, nullable=True)  # {table: {"rows": n, "columns": [{"name", "type"}]}}
+    profile = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,7 +1,7 @@
 """
 Widget model for dashboard components
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.app.database import Base
@@ -10,6 +10,10 @@ from backend.app.database import Base
 class Widget(Base):
     """Widget model for dashboard components"""
     __tablename__ = "widgets"
+    __table_args__ = (
+        # All widgets of a dashboard, already in layout order
+        Index("ix_widgets_dashboard_id_position", "dashboard_id", "position_y", "position_x"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     dashboard_id = Column(Integer, ForeignKey("dashboards.id", ondelete="CASCADE"), nullable=False)
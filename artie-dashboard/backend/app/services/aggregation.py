@@ -0,0 +1,423 @@
+"""
+Server-side widget aggregation.
+
+Turns a widget spec (x, y such as ``SUM(amount)``, optional group_by and
+time grain) into one DuckDB GROUP BY over the full dataset and returns only
+the aggregated points as an Arrow table. Results are cached per
+(dataset, canonical spec).
+
+Datasets above ``APPROX_MIN_ROWS`` are answered approximately unless the
+spec sets ``exact``: sums, counts, means and medians over a uniform sample
+(``sampling``), distinct counts with HyperLogLog. Approximate results carry
+a ``<value>_error`` column with the 95% error half-width.
+"""
+import json
+import math
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+
+from backend.app.core.config import settings
+from backend.app.core.telemetry import timed
+from backend.app.services import column_sketch, dataset_registry, dataset_store, sampling
+from backend.app.services.column_sketch import quote_ident
+from backend.app.services.columnar import table_rows
+from backend.app.services.duckdb_pool import pool
+from backend.app.services.profiler import profile_dataset
+from backend.app.services.streaming_ingest import sql_str
+
+AGGREGATES = {
+    "SUM": "SUM({})",
+    "AVG": "AVG({})",
+    "MIN": "MIN({})",
+    "MAX": "MAX({})",
+    "MEDIAN": "MEDIAN({})",
+    "COUNT": "COUNT({})",
+    "COUNT_DISTINCT": "COUNT(DISTINCT {})",
+}
+# Aggregates whose cached points can absorb appended rows, and how partial results combine
+MERGEABLE = {"SUM": "SUM", "COUNT": "SUM", "MIN": "MIN", "MAX": "MAX"}
+# Aggregates estimated from a uniform sample when approximating; COUNT_DISTINCT uses HyperLogLog
+SAMPLED = ("SUM", "COUNT", "AVG", "MEDIAN")
+# Per-group HyperLogLog registers for approximate distinct counts: ~3.3% standard error
+HLL_P = 10
+# Normal quantile for the 95% error bounds
+Z95 = 1.96
+TIME_GRAINS = ("day", "week", "month", "quarter", "year")
+MAX_POINTS = 5000
+
+_MEASURE = re.compile(r"^\s*([A-Za-z_]+)\s*\(\s*(.*?)\s*\)\s*$")
+
+_cache: "OrderedDict[Tuple[str, str], Tuple[Dict, pa.Table]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+class QueryError(ValueError):
+    """Widget spec that cannot be turned into a query for this dataset"""
+
+
+def parse_measure(y: Optional[str], aggregate: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    Split a y expression into (aggregate, column).
+
+    ``"SUM(amount)"`` → ("SUM", "amount"); ``"COUNT(*)"`` or an empty y →
+    ("COUNT", None); a bare column uses ``aggregate`` (default SUM).
+    """
+    if not y or y.strip() == "*":
+        return "COUNT", None
+    m = _MEASURE.match(y)
+    if m:
+        agg, col = m.group(1).upper(), m.group(2)
+    else:
+        agg, col = (aggregate or "SUM").upper(), y.strip()
+    if aggregate:
+        agg = aggregate.upper()
+    if agg not in AGGREGATES:
+        raise QueryError(f"Unsupported aggregate: {agg}")
+    if col in ("", "*"):
+        if agg != "COUNT":
+            raise QueryError(f"{agg} needs a column")
+        col = None
+    return agg, col
+
+
+def value_name(spec: Dict[str, Any]) -> str:
+    """
+    Name of the value column in the query result for a spec.
+
+    That is the measured column, or ``count``; when x or group_by already
+    use the name, it is prefixed with the aggregate (``count_amount`` for
+    COUNT(amount) by amount), so neither column is lost.
+    """
+    agg, col = parse_measure(spec.get("y"), spec.get("aggregate"))
+    name = col if col is not None else "count"
+    while name in (spec.get("x"), spec.get("group_by")):
+        name = f"{agg.lower()}_{name}"
+    return name
+
+
+def canonical_spec(spec: Dict[str, Any]) -> str:
+    """Stable JSON for a spec so equivalent requests share a cache entry"""
+    agg, col = parse_measure(spec.get("y"), spec.get("aggregate"))
+    canonical = {
+        "x": spec.get("x"),
+        "agg": agg,
+        "col": col,
+        "group_by": spec.get("group_by"),
+        "time_grain": (spec.get("time_grain") or "").lower() or None,
+        "limit": min(int(spec.get("limit") or MAX_POINTS), MAX_POINTS),
+        "exact": bool(spec.get("exact")),
+    }
+    return json.dumps(canonical, sort_keys=True)
+
+
+def approximation_method(agg: str, rows: int, exact: bool = False) -> Optional[str]:
+    """
+    How a query over ``rows`` rows is answered: None (exact), "sample" or "hll".
+
+    Only datasets above ``APPROX_MIN_ROWS`` are approximated. MIN and MAX are
+    always exact since a sample would miss the extremes.
+    """
+    if exact or not sampling.approximated(rows):
+        return None
+    if agg in SAMPLED:
+        return "sample"
+    if agg == "COUNT_DISTINCT":
+        return "hll"
+    return None
+
+
+def _sampled_exprs(agg: str, col: Optional[str], n: int, total: int) -> Tuple[str, str]:
+    """
+    (estimate, 95% error half-width) over a uniform sample of ``n`` of ``total`` rows.
+
+    Totals use the expansion estimator with the domain variance for groups
+    (rows outside a group count as zeros); means use the standard error of
+    the group mean; the median error is half the distribution-free
+    confidence interval between order statistics of the sample.
+    """
+    q = quote_ident(col) if col is not None else None
+    fpc = 1 - n / total
+    if agg in ("SUM", "COUNT"):
+        if agg == "SUM":
+            z = f"COALESCE(CAST({q} AS DOUBLE), 0)"
+        else:
+            z = "1.0" if q is None else f"CAST({q} IS NOT NULL AS DOUBLE)"
+        value = f"SUM({z}) * {total / n}"
+        if agg == "COUNT":
+            value = f"CAST(round({value}) AS BIGINT)"
+        error = (
+            f"{Z95} * {total} * sqrt({fpc} * greatest(SUM({z} * {z}) - SUM({z}) * SUM({z}) / {n}, 0) "
+            f"/ ({n} * {max(n - 1, 1)}))"
+        )
+        return value, error
+    if agg == "AVG":
+        return f"AVG({q})", f"{Z95} * stddev_samp({q}) / sqrt(COUNT({q})) * {math.sqrt(fpc)}"
+    # MEDIAN
+    ordered = f"list_sort(list({q}) FILTER (WHERE {q} IS NOT NULL))"
+    half = f"{Z95} * sqrt(COUNT({q})) / 2"
+    lo = f"CAST(greatest(1, floor(COUNT({q}) / 2 - {half})) AS BIGINT)"
+    hi = f"CAST(least(COUNT({q}), ceil(COUNT({q}) / 2 + {half}) + 1) AS BIGINT)"
+    return f"MEDIAN({q})", f"({ordered}[{hi}] - {ordered}[{lo}]) / 2"
+
+
+def _order_by(columns: Dict[str, Dict], x: str, y_name: str) -> str:
+    # Time series read left to right; everything else shows the largest values first
+    if columns[x]["kind"] == "date":
+        return quote_ident(x)
+    return f"{quote_ident(y_name)} DESC NULLS LAST"
+
+
+def _build_sql(
+    view: str,
+    columns: Dict[str, Dict],
+    spec: Dict[str, Any],
+    method: Optional[str] = None,
+    sample: Tuple[int, int] = (0, 0),
+) -> Tuple[str, str]:
+    """
+    GROUP BY for a widget spec; returns (sql, name of the value column).
+
+    ``method`` "sample" treats ``view`` as a uniform sample of (n, total)
+    ``sample`` rows and "hll" estimates distinct counts with per-group
+    HyperLogLog registers; both add a ``<value>_error`` column holding the
+    95% error half-width.
+    """
+    x, group_by = spec["x"], spec.get("group_by")
+    agg, col = parse_measure(spec.get("y"), spec.get("aggregate"))
+    time_grain = (spec.get("time_grain") or "").lower() or None
+    limit = min(int(spec.get("limit") or MAX_POINTS), MAX_POINTS)
+
+    for name in (x, col, group_by):
+        if name is not None and name not in columns:
+            raise QueryError(f"Unknown column: {name}")
+    if time_grain and time_grain not in TIME_GRAINS:
+        raise QueryError(f"Unsupported time grain: {time_grain}")
+
+    x_expr = quote_ident(x)
+    if columns[x]["kind"] == "date" and columns[x]["dtype"].upper() == "VARCHAR":
+        x_expr = f"TRY_CAST({x_expr} AS TIMESTAMP)"
+    if time_grain:
+        x_expr = f"date_trunc('{time_grain}', {x_expr})"
+
+    y_name = value_name(spec)
+    y, y_error = quote_ident(y_name), quote_ident(f"{y_name}_error")
+
+    select = [f"{x_expr} AS {quote_ident(x)}"]
+    names = [quote_ident(x)]
+    if group_by and group_by != x:
+        select.append(f"{quote_ident(group_by)} AS {quote_ident(group_by)}")
+        names.append(quote_ident(group_by))
+    keys = ", ".join(str(i + 1) for i in range(len(names)))
+    tail = f"ORDER BY {_order_by(columns, x, y_name)} LIMIT {limit + 1}"
+
+    if method == "hll":
+        q, m = quote_ident(col), 1 << HLL_P
+        alpha = 0.7213 / (1 + 1.079 / m)
+        hashed = f"SELECT {', '.join(select)}, hash({q}) AS h FROM {view} WHERE {q} IS NOT NULL"
+        registers = (
+            f"SELECT {', '.join(names)}, h & {m - 1} AS idx, max({column_sketch.rho_sql('h', HLL_P)}) AS r "
+            f"FROM ({hashed}) WHERE h >> {HLL_P} > 0 GROUP BY ALL"
+        )
+        raw = (
+            f"SELECT {', '.join(names)}, {alpha * m * m} / (SUM(pow(2.0, -r)) + {m} - COUNT(*)) AS raw, "
+            f"{m} - COUNT(*) AS zeros FROM ({registers}) GROUP BY {keys}"
+        )
+        estimate = f"CASE WHEN raw <= {2.5 * m} AND zeros > 0 THEN {m} * ln({m} / zeros) ELSE raw END"
+        sql = (
+            f"SELECT {', '.join(names)}, CAST(round({estimate}) AS BIGINT) AS {y}, "
+            f"{estimate} * {Z95 * 1.04 / math.sqrt(m)} AS {y_error} FROM ({raw}) {tail}"
+        )
+        return sql, y_name
+
+    if method == "sample":
+        value_expr, error_expr = _sampled_exprs(agg, col, *sample)
+        select += [f"{value_expr} AS {y}", f"{error_expr} AS {y_error}"]
+    else:
+        select.append(f"{AGGREGATES[agg].format(quote_ident(col) if col is not None else '*')} AS {y}")
+    return f"SELECT {', '.join(select)} FROM {view} GROUP BY {keys} {tail}", y_name
+
+
+def run_query_table(dataset_id: str, spec: Dict[str, Any]) -> Tuple[Dict[str, Any], pa.Table]:
+    """
+    Aggregate a dataset for one widget; returns (metadata, Arrow table).
+
+    Served from cache when the spec was seen before. The table comes straight
+    from DuckDB so columnar encoders never materialise rows.
+    """
+    global _hits, _misses
+    if not spec.get("x"):
+        raise QueryError("x is required")
+    if not dataset_store.exists(dataset_id):
+        raise FileNotFoundError(f"Dataset not found: {dataset_id}")
+
+    key = (dataset_id, canonical_spec(spec))
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            _hits += 1
+            return {**cached[0], "cached": True}, cached[1]
+        _misses += 1
+
+    profile = profile_dataset(dataset_id)
+    columns = {c["name"]: c for c in profile["columns"]}
+    agg = parse_measure(spec.get("y"), spec.get("aggregate"))[0]
+    method = approximation_method(agg, profile["row_count"], bool(spec.get("exact")))
+    view = dataset_registry.view(dataset_id)
+    limit = min(int(spec.get("limit") or MAX_POINTS), MAX_POINTS)
+
+    start = time.perf_counter()
+    with timed("query.aggregate", method=method or "exact"), pool.cursor() as con:
+        sample = (0, 0)
+        if method == "sample":
+            view, n, total = sampling.table_sample(con, dataset_id, settings.approx_sample_rows)
+            sample = (n, total)
+        sql, y_name = _build_sql(view, columns, spec, method, sample)
+        table = con.execute(sql).fetch_arrow_table()
+
+    approximation = None
+    if method is not None:
+        approximation = {
+            "method": method,
+            "confidence": 0.95,
+            "error_column": f"{y_name}_error",
+            "rows": profile["row_count"],
+        }
+        if method == "sample":
+            approximation["sample_rows"] = sample[0]
+    meta = {
+        "dataset_id": dataset_id,
+        "x": spec["x"],
+        "y": y_name,
+        "group_by": spec.get("group_by"),
+        "aggregate": agg,
+        "truncated": table.num_rows > limit,
+        "approximation": approximation,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+    table = table.slice(0, limit)
+    with _cache_lock:
+        _cache[key] = (meta, table)
+        _cache.move_to_end(key)
+        while len(_cache) > settings.query_cache_entries:
+            _cache.popitem(last=False)
+    return {**meta, "cached": False}, table
+
+
+def run_query(dataset_id: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Row-oriented variant of ``run_query_table`` for plain JSON clients"""
+    meta, table = run_query_table(dataset_id, spec)
+    return {**meta, "rows": table_rows(table)}
+
+
+def preview_table(dataset_id: str, limit: int = 200) -> pa.Table:
+    """First ``limit`` rows of a dataset as an Arrow table"""
+    if not dataset_store.exists(dataset_id):
+        raise FileNotFoundError(f"Dataset not found: {dataset_id}")
+    view = dataset_registry.view(dataset_id)
+    with pool.cursor() as con:
+        return con.execute(f"SELECT * FROM {view} LIMIT {int(limit)}").fetch_arrow_table()
+
+
+def invalidate_queries(dataset_id: Optional[str] = None) -> int:
+    """Drop cached aggregates for one dataset, or all of them; returns how many were dropped"""
+    with _cache_lock:
+        keys = [k for k in _cache if dataset_id is None or k[0] == dataset_id]
+        for key in keys:
+            del _cache[key]
+        return len(keys)
+
+
+def _spec_from_key(canonical: str) -> Dict[str, Any]:
+    c = json.loads(canonical)
+    return {
+        "x": c["x"],
+        "y": f"{c['agg']}({c['col'] or '*'})",
+        "group_by": c["group_by"],
+        "time_grain": c["time_grain"],
+        "limit": c["limit"],
+        "exact": c.get("exact", False),
+    }
+
+
+def _merge_points(con, old: pa.Table, delta: pa.Table, agg: str, order: str, limit: int) -> pa.Table:
+    """Re-aggregate cached points with the points of newly appended rows"""
+    name = f"points_{uuid.uuid4().hex}"
+    con.register(f"{name}_old", old)
+    con.register(f"{name}_new", delta)
+    try:
+        keys = ", ".join(quote_ident(c) for c in old.column_names[:-1])
+        y = quote_ident(old.column_names[-1])
+        points = f"(SELECT * FROM {name}_old UNION ALL BY NAME SELECT * FROM {name}_new)"
+        # The union's type covers both sides (BIGINT and DOUBLE points give DOUBLE), so
+        # a wider appended value is kept; the cast only stops SUM promoting it further
+        y_type = con.execute(f"DESCRIBE SELECT {y} FROM {points}").fetchall()[0][1]
+        return con.execute(
+            f"SELECT {keys}, CAST({MERGEABLE[agg]}({y}) AS {y_type}) AS {y} "
+            f"FROM {points} GROUP BY ALL ORDER BY {order} LIMIT {limit + 1}"
+        ).fetch_arrow_table()
+    finally:
+        con.unregister(f"{name}_old")
+        con.unregister(f"{name}_new")
+
+
+def merge_appended(dataset_id: str, parts: List[str]) -> Dict[str, int]:
+    """
+    Bring a dataset's cached aggregates up to date after ``parts`` were appended.
+
+    SUM, COUNT, MIN and MAX points are combined with the same aggregate over
+    the new parts only. Other aggregates and truncated results cannot be
+    combined and are dropped, to be recomputed on the next request.
+    """
+    with _cache_lock:
+        entries = [(k, v) for k, v in _cache.items() if k[0] == dataset_id]
+    if not entries:
+        return {"merged": 0, "dropped": 0}
+
+    columns = {c["name"]: c for c in profile_dataset(dataset_id)["columns"]}
+    delta_scan = f"read_parquet([{', '.join(sql_str(p) for p in parts)}], union_by_name=true)"
+    merged = {}
+    with timed("query.merge_append"), pool.cursor() as con:
+        for key, (meta, table) in entries:
+            if meta["truncated"] or meta.get("approximation") or meta["aggregate"] not in MERGEABLE:
+                continue
+            spec = _spec_from_key(key[1])
+            try:
+                sql, y_name = _build_sql(delta_scan, columns, spec)
+            except QueryError:
+                continue
+            delta = con.execute(sql).fetch_arrow_table()
+            if delta.num_rows > spec["limit"]:
+                continue
+            points = _merge_points(
+                con, table, delta, meta["aggregate"], _order_by(columns, spec["x"], y_name), spec["limit"]
+            )
+            merged[key] = ({**meta, "truncated": points.num_rows > spec["limit"]}, points.slice(0, spec["limit"]))
+
+    with _cache_lock:
+        for key, entry in entries:
+            # Entries replaced meanwhile were computed by a concurrent query; drop those too
+            if key in merged and _cache.get(key) is entry:
+                _cache[key] = merged[key]
+            else:
+                _cache.pop(key, None)
+    return {"merged": len(merged), "dropped": len(entries) - len(merged)}
+
+
+def stats() -> Dict:
+    with _cache_lock:
+        lookups = _hits + _misses
+        return {
+            "entries": len(_cache),
+            "hits": _hits,
+            "misses": _misses,
+            "hit_rate": round(_hits / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,167 @@
+"""
+Mergeable column sketches.
+
+A sketch summarises one Parquet part: row count and, per column, the DuckDB
+type, non-null count, min, max, how many text values parse as timestamps and
+a HyperLogLog register array for the distinct count. Sketches of different
+parts merge without touching the data (counts add, min/max compare, HLL
+registers take the element-wise max), so a table's profile after an append
+only needs the new part scanned.
+
+Each part's sketch is stored beside it as ``part-NNNNN.sketch.json`` and
+computed on first use.
+"""
+import base64
+import json
+import math
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from backend.app.services import dataset_store
+from backend.app.services.streaming_ingest import sql_str
+
+# 2^12 registers: ~1.6% standard error on distinct counts, 4 KB per column
+HLL_P = 12
+HLL_M = 1 << HLL_P
+
+SKETCH_SUFFIX = ".sketch.json"
+
+
+def quote_ident(name: str) -> str:
+    """Quote a column name as a DuckDB identifier"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def json_safe(value: Any) -> Any:
+    """Convert DuckDB/numpy scalars to JSON-serialisable Python values"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    return value
+
+
+def sketch_path(part: Path) -> Path:
+    return part.with_name(part.stem + SKETCH_SUFFIX)
+
+
+def rho_sql(h: str, p: int = HLL_P) -> str:
+    """HLL rank of hash ``h``: trailing zeros of the bits above the register index, plus one"""
+    return f"bit_count(xor({h} >> {p}, ({h} >> {p}) - 1))"
+
+
+def _registers(con, scan: str, names: List[str]) -> Dict[str, bytearray]:
+    """HLL registers per column; one GROUP BY per column, sent as a single statement"""
+    regs = {name: bytearray(HLL_M) for name in names}
+    if not names:
+        return regs
+    # Low bits pick the register. Hashes whose remaining bits are all zero (p = 2^-52) are skipped.
+    selects = [
+        f"SELECT {i} AS c, h & {HLL_M - 1} AS idx, max({rho_sql('h')}) AS rho "
+        f"FROM (SELECT hash({quote_ident(name)}) AS h FROM {scan} WHERE {quote_ident(name)} IS NOT NULL) "
+        f"WHERE h >> {HLL_P} > 0 GROUP BY 2"
+        for i, name in enumerate(names)
+    ]
+    for c, idx, rho in con.execute(" UNION ALL ".join(selects)).fetchall():
+        regs[names[c]][idx] = rho
+    return regs
+
+
+def compute(con, scan: str) -> Dict[str, Any]:
+    """Sketch of everything ``scan`` (a DuckDB table expression) returns"""
+    schema = [(r[0], r[1]) for r in con.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()]
+    exprs = ["COUNT(*)"]
+    for name, dtype in schema:
+        q = quote_ident(name)
+        exprs += [f"COUNT({q})", f"MIN({q})", f"MAX({q})"]
+        if dtype.upper() == "VARCHAR":
+            exprs.append(f"COUNT(TRY_CAST({q} AS TIMESTAMP))")
+        else:
+            exprs.append("NULL")
+    stats = con.execute(f"SELECT {', '.join(exprs)} FROM {scan}").fetchone()
+    regs = _registers(con, scan, [name for name, _ in schema])
+
+    columns = {}
+    for i, (name, dtype) in enumerate(schema):
+        non_null, min_v, max_v, date_hits = stats[1 + i * 4: 5 + i * 4]
+        columns[name] = {
+            "dtype": dtype,
+            "non_null": int(non_null),
+            "min": json_safe(min_v),
+            "max": json_safe(max_v),
+            "date_hits": int(date_hits or 0),
+            "hll": base64.b64encode(bytes(regs[name])).decode(),
+        }
+    return {"rows": int(stats[0]), "columns": columns}
+
+
+def part_sketch(con, part: Path) -> Dict[str, Any]:
+    """Stored sketch of one Parquet part, computed and saved when missing"""
+    path = sketch_path(part)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    sketch = compute(con, f"read_parquet({sql_str(str(part))})")
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(sketch, f)
+    os.replace(tmp, path)
+    return sketch
+
+
+def _pick(a: Any, b: Any, fn) -> Any:
+    if a is None or b is None:
+        return b if a is None else a
+    try:
+        return fn(a, b)
+    except TypeError:
+        return fn(str(a), str(b))
+
+
+def merge(a: Optional[Dict[str, Any]], b: Dict[str, Any]) -> Dict[str, Any]:
+    """Combined sketch of two disjoint sets of rows"""
+    if a is None:
+        return b
+    columns = {name: dict(col) for name, col in a["columns"].items()}
+    for name, col in b["columns"].items():
+        if name not in columns:
+            columns[name] = dict(col)
+            continue
+        into = columns[name]
+        into["non_null"] += col["non_null"]
+        into["date_hits"] += col["date_hits"]
+        into["min"] = _pick(into["min"], col["min"], min)
+        into["max"] = _pick(into["max"], col["max"], max)
+        left, right = base64.b64decode(into["hll"]), base64.b64decode(col["hll"])
+        into["hll"] = base64.b64encode(bytes(map(max, left, right))).decode()
+    return {"rows": a["rows"] + b["rows"], "columns": columns}
+
+
+def table_sketch(con, dataset_id: str, table: str = dataset_store.DEFAULT_TABLE) -> Dict[str, Any]:
+    """Merged sketch of every part of a table; only parts without a stored sketch are scanned"""
+    merged = None
+    for part in sorted(dataset_store.table_dir(dataset_id, table).glob("*.parquet")):
+        merged = merge(merged, part_sketch(con, part))
+    if merged is None:
+        raise FileNotFoundError(f"Dataset not found: {dataset_id}/{table}")
+    return merged
+
+
+def distinct_estimate(hll: str) -> int:
+    """HyperLogLog cardinality estimate, with linear counting for small sets"""
+    regs = base64.b64decode(hll)
+    zeros = regs.count(0)
+    if zeros == HLL_M:
+        return 0
+    alpha = 0.7213 / (1 + 1.079 / HLL_M)
+    estimate = alpha * HLL_M * HLL_M / sum(2.0 ** -r for r in regs)
+    if estimate <= 2.5 * HLL_M and zeros:
+        estimate = HLL_M * math.log(HLL_M / zeros)
+    return int(round(estimate))
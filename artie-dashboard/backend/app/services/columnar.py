@@ -0,0 +1,85 @@
+"""
+Columnar response encodings for tabular endpoints.
+
+Tables come straight from DuckDB as Arrow (``fetch_arrow_table``) and are
+encoded without building per-row dicts:
+
+* ``application/vnd.apache.arrow.stream`` – Arrow IPC stream
+* ``application/vnd.columnar+json`` – ``{"columns": [...], "data": {col: [...]}}`` via orjson
+* ``application/json`` – the row-oriented default, for existing clients
+
+Clients pick one with the ``Accept`` header or a ``?format=arrow|columnar|rows``
+override (useful where headers cannot be set, e.g. Vega-Lite data URLs).
+"""
+import math
+from typing import Any, Dict, List, Optional
+
+import orjson
+import pyarrow as pa
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+COLUMNAR_JSON_MIME = "application/vnd.columnar+json"
+JSON_MIME = "application/json"
+
+FORMATS = {"arrow": ARROW_MIME, "columnar": COLUMNAR_JSON_MIME, "rows": JSON_MIME}
+
+
+def negotiate(accept: Optional[str], format_override: Optional[str] = None) -> str:
+    """Pick a response media type; unknown or missing preferences fall back to row JSON"""
+    if format_override:
+        return FORMATS.get(format_override.lower(), JSON_MIME)
+    for part in (accept or "").split(","):
+        mime = part.split(";")[0].strip().lower()
+        if mime in (ARROW_MIME, COLUMNAR_JSON_MIME):
+            return mime
+    return JSON_MIME
+
+
+def normalize(table: pa.Table) -> pa.Table:
+    """Cast DECIMAL/HUGEINT results (e.g. SUM over integers) to float64 for JS and JSON clients"""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    return table
+
+
+def encode_arrow(table: pa.Table, metadata: Optional[Dict[str, Any]] = None) -> bytes:
+    """Arrow IPC stream; ``metadata`` travels as JSON in the schema metadata"""
+    table = normalize(table)
+    if metadata:
+        table = table.replace_schema_metadata({b"meta": orjson.dumps(metadata, default=str)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _column_values(col: pa.ChunkedArray):
+    # Null-free numeric columns go to orjson as numpy arrays; everything else as Python lists
+    if col.null_count == 0 and (pa.types.is_integer(col.type) or pa.types.is_floating(col.type)):
+        return col.to_numpy()
+    return col.to_pylist()
+
+
+def encode_columnar_json(table: pa.Table, metadata: Optional[Dict[str, Any]] = None) -> bytes:
+    """Column-oriented JSON: one array per column instead of one object per row"""
+    table = normalize(table)
+    payload = {
+        **(metadata or {}),
+        "columns": table.column_names,
+        "row_count": table.num_rows,
+        "data": {name: _column_values(table.column(name)) for name in table.column_names},
+    }
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS, default=str)
+
+
+def table_rows(table: pa.Table) -> List[Dict[str, Any]]:
+    """Row dicts with JSON-safe scalars (dates as ISO strings, NaN as null)"""
+    rows = normalize(table).to_pylist()
+    for row in rows:
+        for key, value in row.items():
+            if isinstance(value, float) and math.isnan(value):
+                row[key] = None
+            elif hasattr(value, "isoformat"):
+                row[key] = value.isoformat()
+    return rows
@@ -1,13 +1,27 @@
-from typing import List, Dict
-import duckdb
+import json
+from typing import List, Dict, Optional, Tuple
 import pandas as pd
 
-from backend.app.services.llm_service import propose_widgets
+from backend.app.core.config import settings
+from backend.app.core.concurrency import run_blocking
+from backend.app.core.telemetry import timed
+from backend.app.services.aggregation import QueryError, value_name
+from backend.app.services.duckdb_pool import pool
+from backend.app.services.profiler import dataset_sample, hints_from_profile, profile_dataset
+from backend.app.services.sampling import reservoir, sample_method
+from backend.app.services.llm_service import apropose_widgets, propose_widgets
+from backend.app.services.widget_recommender import recommend_from_hints, recommend_from_profile
+from backend.app.services.streaming_ingest import sql_str
 
 
-def infer_hints_from_csv(csv_path: str, sample_rows: int = 200) -> Dict:
-    con = duckdb.connect()
-    df = con.execute(f"SELECT * FROM read_csv_auto('{csv_path}') LIMIT {sample_rows}").df()
+def scan_expr(path: str) -> str:
+    """DuckDB table function for an uploaded file (Parquet or delimited text)"""
+    if path.endswith(".parquet"):
+        return f"read_parquet({sql_str(path)})"
+    return f"read_csv_auto({sql_str(path)})"
+
+
+def hints_from_sample(df: pd.DataFrame) -> Dict:
     cols = list(df.columns)
     has_date = any(pd.api.types.is_datetime64_any_dtype(df[c]) or "date" in c.lower() for c in cols)
     measures = [c for c in cols if pd.api.types.is_numeric_dtype(df[c])]
@@ -26,37 +40,137 @@ def infer_hints_from_csv(csv_path: str, sample_rows: int = 200) -> Dict:
     }
 
 
-def vega_from_proposal(proposal: Dict) -> Dict:
+@timed("dashboard.infer_hints")
+def infer_hints_from_csv(csv_path: str, sample_rows: int = 200) -> Dict:
+    # A head sample of a sorted export would only show its first month or region
+    if sample_method() == "head":
+        query = f"SELECT * FROM {scan_expr(csv_path)} LIMIT {int(sample_rows)}"
+    else:
+        query = reservoir(scan_expr(csv_path), sample_rows)
+    with pool.cursor() as con:
+        df = con.execute(query).df()
+    return hints_from_sample(df)
+
+
+def vega_from_proposal(proposal: Dict, data_name: str = "preview") -> Dict:
     chart = proposal.get("chart","bar")
     x = proposal.get("x")
     y = proposal.get("y")
     group_by = proposal.get("group_by")
-    mark = "bar" if chart in ["bar","funnel","treemap"] else "line" if chart=="line" else "area"
-    enc = {
-        "x": {"field": x, "type": "temporal" if x and "date" in x.lower() else "nominal"} if x else None,
-        "y": {"field": y.replace("SUM(","").replace(")","") , "type": "quantitative"} if y else None
-    }
+    # The field the /query points carry the measure in (``amount`` for AVG(amount), ``count`` for COUNT(*))
+    try:
+        y_field = value_name(proposal) if y else None
+    except QueryError:
+        y_field = y
+    if chart == "pie":
+        # Slices: the angle carries the measure, the colour names the category
+        enc = {
+            "theta": {"field": y_field, "type": "quantitative"} if y else None,
+            "color": {"field": x, "type": "nominal"} if x else None,
+        }
+        mark = {"type": "arc"}
+    else:
+        enc = {
+            "x": {"field": x, "type": "temporal" if x and "date" in x.lower() else "nominal"} if x else None,
+            "y": {"field": y_field, "type": "quantitative"} if y else None
+        }
+        mark_type = "bar" if chart in ["bar","funnel","treemap"] else "line" if chart=="line" else "area"
+        mark = {"type": mark_type, "point": chart=="line"}
     enc = {k:v for k,v in enc.items() if v}
     spec = {
         "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
         "description": proposal.get("title","Widget"),
-        "data": {"name": "preview"},
-        "mark": {"type": mark, "point": chart=="line"},
+        "data": {"name": data_name},
+        "mark": mark,
         "encoding": enc
     }
     return spec
 
 
-def generate_quick_viz(csv_path: str, domain: str, intent: str) -> List[Dict]:
-    hints = infer_hints_from_csv(csv_path)
-    cols = list(hints.get("measures",[])) + list(hints.get("categories",[]))
-    props = propose_widgets(domain=domain, intent=intent, columns=cols, hints=hints)
+def query_for_proposal(proposal: Dict, dataset_id: str) -> Optional[Dict]:
+    """Server-side aggregation request for a chart proposal (None for tables)"""
+    if proposal.get("chart") == "table" or not proposal.get("x"):
+        return None
+    return {
+        "url": f"/api/datasets/{dataset_id}/query",
+        "spec": {"x": proposal["x"], "y": proposal.get("y"), "group_by": proposal.get("group_by")},
+    }
+
+
+def _widgets_from_proposals(props: List[Dict], dataset_id: Optional[str] = None) -> List[Dict]:
     widgets = []
     for p in props[:6]:
-        widgets.append({
+        query = query_for_proposal(p, dataset_id) if dataset_id else None
+        widget = {
             "title": p.get("title","Widget"),
             "explanation": p.get("explanation",""),
-            "vega_spec": vega_from_proposal(p),
+            # Charts backed by a stored dataset read aggregated points, not the preview sample
+            "vega_spec": vega_from_proposal(p, "query" if query else "preview"),
             "role": "auto",
-        })
+        }
+        if query:
+            widget["query"] = query
+        widgets.append(widget)
     return widgets
+
+
+@timed("dashboard.recommend")
+def _recommend(csv_path: Optional[str], dataset_id: Optional[str], domain: str, intent: str) -> Tuple[Dict, List[Dict]]:
+    """Hints and heuristic proposals; profiled datasets get the full recommender"""
+    if dataset_id:
+        profile = profile_dataset(dataset_id)
+        draft = recommend_from_profile(profile, dataset_sample(dataset_id), domain, intent)
+        return hints_from_profile(profile), draft
+    hints = infer_hints_from_csv(csv_path)
+    return hints, recommend_from_hints(hints, domain, intent)
+
+
+def _llm_input(domain: str, intent: str, hints: Dict, draft: List[Dict]) -> Tuple[List[str], Dict]:
+    cols = list(hints.get("measures",[])) + list(hints.get("categories",[]))
+    return cols, {"domain": domain, "intent": intent, "columns": cols, "hints": hints, "draft": draft}
+
+
+def generate_quick_viz(
+    csv_path: Optional[str] = None,
+    domain: str = "",
+    intent: str = "",
+    dataset_id: Optional[str] = None,
+    refine: Optional[bool] = None,
+) -> Tuple[List[Dict], Dict, str]:
+    """
+    Propose widgets for an upload; returns (widgets, LLM input, proposals as JSON).
+
+    Heuristic proposals are built first; the LLM refines them only when
+    ``refine`` (default ``LLM_REFINE_WIDGETS``) is on.
+    """
+    refine = settings.llm_refine_widgets if refine is None else refine
+    hints, draft = _recommend(csv_path, dataset_id, domain, intent)
+    cols, groq_input = _llm_input(domain, intent, hints, draft)
+    props = propose_widgets(domain=domain, intent=intent, columns=cols, hints=hints, draft=draft) if refine else draft
+    return _widgets_from_proposals(props, dataset_id), groq_input, json.dumps(props, default=str)
+
+
+async def agenerate_quick_viz(
+    csv_path: Optional[str] = None,
+    domain: str = "",
+    intent: str = "",
+    dataset_id: Optional[str] = None,
+    refine: Optional[bool] = None,
+    fallback: bool = True,
+) -> Tuple[List[Dict], Dict, str]:
+    """
+    Async ``generate_quick_viz``: profiling runs on the worker pool, the LLM call is awaited.
+
+    With ``fallback=False`` a failed refinement raises LLMUnavailable instead
+    of returning the heuristic widgets.
+    """
+    refine = settings.llm_refine_widgets if refine is None else refine
+    hints, draft = await run_blocking(_recommend, csv_path, dataset_id, domain, intent)
+    cols, groq_input = _llm_input(domain, intent, hints, draft)
+    if refine:
+        props = await apropose_widgets(
+            domain=domain, intent=intent, columns=cols, hints=hints, draft=draft, fallback=fallback
+        )
+    else:
+        props = draft
+    return _widgets_from_proposals(props, dataset_id), groq_input, json.dumps(props, default=str)
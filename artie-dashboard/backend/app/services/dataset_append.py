@@ -0,0 +1,215 @@
+"""
+Append and upsert uploads into an existing dataset.
+
+A top-up file is parsed into a staging dataset exactly like a fresh upload;
+``append_dataset`` then moves the staged Parquet parts into the target as new
+partitions instead of re-processing the whole dataset:
+
+* each staged table is checked against the target table of the same name:
+  no unknown columns, and types must match (any numeric types, or any
+  temporal types, count as matching). Columns the new file lacks read back
+  as NULL; tables the target does not have yet are added as they are;
+* ``upsert`` first rewrites only the existing parts that hold rows whose key
+  columns match a staged row, leaving those rows out;
+* the dataset's DuckDB views are re-created over the new parts, whose
+  column types may be wider than the old ones;
+* the profile is rebuilt from per-part sketches, so only new parts are
+  scanned, and cached widget aggregates are merged with the new rows
+  (append) or dropped (upsert, since rows were replaced).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from backend.app.services import (
+    aggregation,
+    column_sketch,
+    dataset_registry,
+    dataset_store,
+    profiler,
+    sampling,
+    upload_cache,
+)
+from backend.app.services.column_sketch import quote_ident
+from backend.app.services.duckdb_pool import pool
+from backend.app.services.streaming_ingest import sql_str
+
+APPEND_MODES = ("append", "upsert")
+
+logger = logging.getLogger(__name__)
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+
+class SchemaMismatch(ValueError):
+    """Staged upload whose columns do not fit the target dataset"""
+
+
+def _dataset_lock(dataset_id: str) -> threading.Lock:
+    """Appends to one dataset run one at a time"""
+    with _locks_lock:
+        return _locks.setdefault(dataset_id, threading.Lock())
+
+
+def is_appending(dataset_id: str) -> bool:
+    """True while an append into ``dataset_id`` is running"""
+    with _locks_lock:
+        lock = _locks.get(dataset_id)
+    return lock is not None and lock.locked()
+
+
+def _schema(con, dataset_id: str, table: str) -> Dict[str, str]:
+    scan = dataset_store.scan_expr(dataset_id, table)
+    return {r[0]: r[1] for r in con.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()}
+
+
+def _type_family(dtype: str) -> str:
+    dtype = dtype.upper()
+    if dtype.startswith(profiler.NUMERIC_TYPES):
+        return "numeric"
+    if dtype.startswith(profiler.TEMPORAL_TYPES):
+        return "temporal"
+    return dtype
+
+
+def check_schema(table: str, existing: Dict[str, str], incoming: Dict[str, str]) -> List[str]:
+    """Reasons the incoming columns cannot be appended to ``existing`` (empty when they can)"""
+    problems = []
+    for name, dtype in incoming.items():
+        if name not in existing:
+            problems.append(f"{table}: unknown column {name!r}")
+        elif _type_family(dtype) != _type_family(existing[name]):
+            problems.append(f"{table}.{name}: {dtype} does not match {existing[name]}")
+    return problems
+
+
+def _remove_matching_rows(con, dataset_id: str, staging_id: str, table: str, keys: List[str]) -> int:
+    """Rewrite parts holding rows whose keys appear in the staged table; returns rows removed"""
+    using = ", ".join(quote_ident(k) for k in keys)
+    staged_keys = f"(SELECT DISTINCT {using} FROM {dataset_store.scan_expr(staging_id, table)})"
+    removed = 0
+    for part in sorted(dataset_store.table_dir(dataset_id, table).glob("*.parquet")):
+        scan = f"read_parquet({sql_str(str(part))})"
+        hits = con.execute(f"SELECT COUNT(*) FROM {scan} SEMI JOIN {staged_keys} k USING ({using})").fetchone()[0]
+        if not hits:
+            continue
+        tmp = part.with_name(part.name + ".tmp")
+        con.execute(
+            f"COPY (SELECT * FROM {scan} ANTI JOIN {staged_keys} k USING ({using})) "
+            f"TO {sql_str(str(tmp))} (FORMAT PARQUET, COMPRESSION ZSTD)"
+        )
+        os.replace(tmp, part)
+        column_sketch.sketch_path(part).unlink(missing_ok=True)
+        sampling.sample_path(part).unlink(missing_ok=True)
+        removed += int(hits)
+    return removed
+
+
+def _move_parts(staging_id: str, dataset_id: str, table: str) -> List[str]:
+    """Move staged parts (and their sketches and samples) into the target table; returns the new paths"""
+    moved = []
+    for part in sorted(dataset_store.table_dir(staging_id, table).glob("*.parquet")):
+        target = dataset_store.next_part_path(dataset_id, table)
+        os.replace(part, target)
+        for sidecar in (column_sketch.sketch_path, sampling.sample_path):
+            if sidecar(part).exists():
+                os.replace(sidecar(part), sidecar(target))
+        moved.append(str(target))
+    return moved
+
+
+def append_dataset(
+    dataset_id: str, staging_id: str, mode: str = "append", keys: Optional[List[str]] = None
+) -> Dict:
+    """
+    Move every table of ``staging_id`` into ``dataset_id`` and drop the staging dataset.
+
+    In ``upsert`` mode existing rows whose ``keys`` match a staged row are
+    replaced. Raises FileNotFoundError for an unknown target and
+    SchemaMismatch when the staged columns do not fit; nothing is changed
+    in either case.
+    """
+    if mode not in APPEND_MODES:
+        raise ValueError(f"Unsupported append mode: {mode}")
+    if mode == "upsert" and not keys:
+        raise SchemaMismatch("upsert needs at least one key column")
+    if not dataset_store.exists(dataset_id):
+        raise FileNotFoundError(f"Dataset not found: {dataset_id}")
+
+    start = time.perf_counter()
+    with _dataset_lock(dataset_id), pool.cursor() as con:
+        existing_tables = set(dataset_store.list_tables(dataset_id))
+        staged_tables = dataset_store.list_tables(staging_id)
+        upsert_tables = set()
+        problems = []
+        for table in staged_tables:
+            if table not in existing_tables:
+                continue
+            existing, incoming = _schema(con, dataset_id, table), _schema(con, staging_id, table)
+            problems += check_schema(table, existing, incoming)
+            if mode == "upsert":
+                if all(k in existing and k in incoming for k in keys):
+                    upsert_tables.add(table)
+                elif table == dataset_store.DEFAULT_TABLE:
+                    problems.append(f"{table}: key columns {keys} missing")
+        if problems:
+            raise SchemaMismatch("; ".join(problems))
+
+        tables = []
+        try:
+            for table in staged_tables:
+                scan = dataset_store.scan_expr(staging_id, table)
+                rows = con.execute(f"SELECT COUNT(*) FROM {scan}").fetchone()[0]
+                replaced = _remove_matching_rows(con, dataset_id, staging_id, table, keys) if table in upsert_tables else 0
+                tables.append({
+                    "table": table,
+                    "new_table": table not in existing_tables,
+                    "rows_added": int(rows),
+                    "rows_replaced": replaced,
+                    "parts": _move_parts(staging_id, dataset_id, table),
+                })
+        finally:
+            # Whatever was moved is now part of the dataset. Views are bound to the
+            # column types they were created with, and the new parts may have
+            # widened them (BIGINT to DOUBLE, say), so they are re-created over the
+            # current files; anything cached from the old files is forgotten.
+            pool.rebind_dataset(dataset_id)
+            handle = dataset_registry.hot_set.peek(dataset_id)
+            if handle is not None:
+                handle.clear_frames()
+            profiler.invalidate_profile(dataset_id)
+            upload_cache.forget_dataset(dataset_id)
+            if len(tables) < len(staged_tables):
+                aggregation.invalidate_queries(dataset_id)
+
+    dataset_registry.delete(staging_id)
+
+    # Only the default table feeds widget aggregates. The rows are in place by
+    # now, so a failed merge drops the cached aggregates instead of failing the append.
+    default = next((t for t in tables if t["table"] == dataset_store.DEFAULT_TABLE), None)
+    if default is None:
+        aggregates = {"merged": 0, "dropped": 0}
+    elif default["rows_replaced"]:
+        aggregates = {"merged": 0, "dropped": aggregation.invalidate_queries(dataset_id)}
+    else:
+        try:
+            aggregates = aggregation.merge_appended(dataset_id, default["parts"])
+        except Exception:
+            logger.warning("could not merge cached aggregates", extra={"dataset_id": dataset_id}, exc_info=True)
+            aggregates = {"merged": 0, "dropped": aggregation.invalidate_queries(dataset_id)}
+
+    for t in tables:
+        t["parts"] = [os.path.basename(p) for p in t["parts"]]
+    return {
+        "dataset_id": dataset_id,
+        "mode": mode,
+        "keys": keys if mode == "upsert" else None,
+        "tables": tables,
+        "rows_added": sum(t["rows_added"] for t in tables),
+        "rows_replaced": sum(t["rows_replaced"] for t in tables),
+        "aggregates": aggregates,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
@@ -0,0 +1,414 @@
+"""
+Dataset registry.
+
+Every ingested dataset gets a ``datasets`` row in the app database with its
+name, owner, source hash, per-table schema and row counts, size on disk and
+profile, so datasets can be listed and found again after a restart.
+
+In memory, ``open_dataset`` hands out a ``DatasetHandle`` from a hot set.
+Handles are lazy: the DuckDB view is created on the first query and a frame
+is read only when ``frame()`` asks for it. The hot set is an LRU bounded by
+``DATASET_HOT_ENTRIES`` handles and ``DATASET_HOT_MAX_BYTES`` of loaded
+frames. Evicting a handle drops its frames, cached profile and cached
+aggregates; its DuckDB views stay until the dataset is deleted, since they
+hold no data and another thread may be about to query them. On disk,
+``enforce_disk_quota`` deletes the least recently used datasets once the
+store exceeds ``DATASET_DIR_MAX_BYTES``, sparing datasets being appended to
+or written within the last ``QUOTA_GRACE_SECONDS``.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy.exc import SQLAlchemyError
+
+from backend.app.core.config import settings
+from backend.app.database import SessionLocal
+from backend.app.models.dataset import Dataset
+from backend.app.services import dataset_store
+from backend.app.services.duckdb_pool import pool
+
+# Access times are written to the database at most this often per dataset
+TOUCH_INTERVAL_SECONDS = 300
+
+# Datasets written this recently are never removed by the disk quota: another
+# request may still be profiling or appending to them
+QUOTA_GRACE_SECONDS = 600
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetHandle:
+    """Lazy accessor for one dataset; holds nothing until something is read"""
+
+    def __init__(self, dataset_id: str):
+        self.id = dataset_id
+        self._frames: Dict[Tuple[str, Optional[Tuple[str, ...]]], pd.DataFrame] = {}
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+    def tables(self) -> List[str]:
+        return dataset_store.list_tables(self.id)
+
+    def view(self, table: str = dataset_store.DEFAULT_TABLE) -> str:
+        """Quoted DuckDB view over the table, created on first use"""
+        return pool.register_dataset(self.id, table)
+
+    def frame(self, table: str = dataset_store.DEFAULT_TABLE, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """The table (or some of its columns) as a DataFrame, kept while the handle is hot"""
+        key = (table, tuple(columns) if columns else None)
+        with self._lock:
+            df = self._frames.get(key)
+        if df is not None:
+            return df
+        df = dataset_store.read_dataframe(self.id, columns=columns, table=table)
+        with self._lock:
+            if key not in self._frames:
+                self._frames[key] = df
+                self.nbytes += int(df.memory_usage(deep=True).sum())
+        hot_set.trim(keep=self.id)
+        return df
+
+    def clear_frames(self) -> None:
+        """Forget loaded frames after the dataset's files changed"""
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+    def release(self) -> None:
+        """
+        Drop what is held in memory for this dataset.
+
+        DuckDB views are left alone (``delete`` drops them): they hold no
+        data, and dropping one while another thread runs a query it just
+        resolved would fail that query.
+        """
+        from backend.app.services import aggregation, profiler
+
+        self.clear_frames()
+        profiler.invalidate_profile(self.id)
+        aggregation.invalidate_queries(self.id)
+
+
+class HotSet:
+    """LRU of open handles, bounded by count and by bytes of loaded frames"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._handles: "OrderedDict[str, DatasetHandle]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, dataset_id: str) -> DatasetHandle:
+        with self._lock:
+            handle = self._handles.get(dataset_id)
+            if handle is None:
+                handle = self._handles[dataset_id] = DatasetHandle(dataset_id)
+            self._handles.move_to_end(dataset_id)
+        self.trim(keep=dataset_id)
+        return handle
+
+    def trim(self, keep: Optional[str] = None) -> None:
+        evicted = []
+        with self._lock:
+            total = sum(h.nbytes for h in self._handles.values())
+            for dataset_id in list(self._handles):
+                if len(self._handles) <= self.max_entries and total <= self.max_bytes:
+                    break
+                if dataset_id == keep:
+                    continue
+                handle = self._handles.pop(dataset_id)
+                total -= handle.nbytes
+                evicted.append(handle)
+            self.evictions += len(evicted)
+        for handle in evicted:
+            handle.release()
+
+    def peek(self, dataset_id: str) -> Optional[DatasetHandle]:
+        """The open handle for a dataset, if any, without touching the LRU order"""
+        with self._lock:
+            return self._handles.get(dataset_id)
+
+    def discard(self, dataset_id: str) -> None:
+        with self._lock:
+            handle = self._handles.pop(dataset_id, None)
+        if handle is not None:
+            handle.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "handles": len(self._handles),
+                "bytes": sum(h.nbytes for h in self._handles.values()),
+                "evictions": self.evictions,
+            }
+
+
+hot_set = HotSet(settings.dataset_hot_entries, settings.dataset_hot_max_bytes)
+
+_touched: Dict[str, float] = {}
+_touch_lock = threading.Lock()
+
+
+def _touch(dataset_id: str) -> None:
+    """Record an access in the database, at most once per ``TOUCH_INTERVAL_SECONDS``"""
+    now = time.monotonic()
+    with _touch_lock:
+        if now - _touched.get(dataset_id, float("-inf")) < TOUCH_INTERVAL_SECONDS:
+            return
+        _touched[dataset_id] = now
+    try:
+        with SessionLocal() as db:
+            db.query(Dataset).filter(Dataset.id == dataset_id).update(
+                {Dataset.last_accessed_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+    except SQLAlchemyError as e:
+        logger.warning("could not record dataset access: %s", e, extra={"dataset_id": dataset_id})
+
+
+def open_dataset(dataset_id: str) -> DatasetHandle:
+    """Handle for a stored dataset; raises FileNotFoundError when it is not on disk"""
+    if not dataset_store.exists(dataset_id):
+        raise FileNotFoundError(f"Dataset not found: {dataset_id}")
+    _touch(dataset_id)
+    return hot_set.get(dataset_id)
+
+
+def view(dataset_id: str, table: str = dataset_store.DEFAULT_TABLE) -> str:
+    """DuckDB view name for a dataset table, opening the dataset in the hot set"""
+    return open_dataset(dataset_id).view(table)
+
+
+# ---------------------------------------------------------------- metadata
+
+def _dir_stats(path: str) -> Tuple[int, float]:
+    """(total bytes, newest modification time) of everything under ``path``"""
+    total, newest = 0, 0.0
+    for root, _, files in os.walk(path):
+        try:
+            newest = max(newest, os.stat(root).st_mtime)
+        except OSError:
+            pass
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += st.st_size
+            newest = max(newest, st.st_mtime)
+    return total, newest
+
+
+def _dir_size(path: str) -> int:
+    return _dir_stats(path)[0]
+
+
+def describe(dataset_id: str) -> Dict[str, Dict[str, Any]]:
+    """Schema and row count of every table, read from Parquet metadata"""
+    out = {}
+    with pool.cursor() as con:
+        for table in dataset_store.list_tables(dataset_id):
+            scan = dataset_store.scan_expr(dataset_id, table)
+            columns = con.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()
+            rows = con.execute(f"SELECT COUNT(*) FROM {scan}").fetchone()[0]
+            out[table] = {
+                "rows": int(rows),
+                "columns": [{"name": c[0], "type": c[1]} for c in columns],
+            }
+    return out
+
+
+def _to_dict(row: Dataset) -> Dict[str, Any]:
+    return {
+        "dataset_id": row.id,
+        "name": row.name,
+        "owner_id": row.owner_id,
+        "source_type": row.source_type,
+        "content_hash": row.content_hash,
+        "row_count": row.row_count,
+        "size_bytes": row.size_bytes,
+        "tables": row.tables,
+        "profile": row.profile,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "last_accessed_at": row.last_accessed_at.isoformat() if row.last_accessed_at else None,
+    }
+
+
+def register(
+    dataset_id: str,
+    name: str,
+    source_type: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    profile: Optional[Dict] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Create or refresh the registry row for a stored dataset.
+
+    Returns the metadata, or None when the database is unavailable; the
+    dataset itself stays usable either way.
+    """
+    tables = describe(dataset_id)
+    now = datetime.utcnow()
+    try:
+        with SessionLocal() as db:
+            row = db.get(Dataset, dataset_id) or Dataset(id=dataset_id, created_at=now)
+            row.name = name
+            row.source_type = source_type
+            row.content_hash = content_hash
+            row.owner_id = owner_id if owner_id is not None else row.owner_id
+            row.tables = tables
+            row.row_count = tables.get(dataset_store.DEFAULT_TABLE, {}).get("rows", 0)
+            row.size_bytes = _dir_size(str(dataset_store.dataset_dir(dataset_id)))
+            row.profile = profile if profile is not None else row.profile
+            row.last_accessed_at = now
+            db.add(row)
+            db.commit()
+            return _to_dict(row)
+    except SQLAlchemyError as e:
+        logger.warning("dataset registry unavailable: %s", e, extra={"dataset_id": dataset_id})
+        return None
+
+
+def refresh(dataset_id: str, profile: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
+    """
+    Update schema, row counts, size and profile after a dataset's files changed.
+
+    Name, owner and source type are kept; the content hash is cleared
+    because the dataset no longer matches the bytes of a single upload.
+    """
+    existing = get_safe(dataset_id)
+    if existing is None:
+        return register(dataset_id, name=dataset_id, profile=profile)
+    return register(
+        dataset_id,
+        name=existing["name"],
+        source_type=existing["source_type"],
+        owner_id=existing["owner_id"],
+        profile=profile,
+    )
+
+
+def get_safe(dataset_id: str) -> Optional[Dict[str, Any]]:
+    """``get`` that reports an unavailable database as a missing row"""
+    try:
+        return get(dataset_id)
+    except SQLAlchemyError as e:
+        logger.warning("dataset registry unavailable: %s", e, extra={"dataset_id": dataset_id})
+        return None
+
+
+def get(dataset_id: str) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        row = db.get(Dataset, dataset_id)
+        return _to_dict(row) if row is not None else None
+
+
+def list_datasets(owner_id: Optional[int] = None, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+    """Most recently used first; profiles are left out to keep listings small"""
+    with SessionLocal() as db:
+        query = db.query(Dataset)
+        if owner_id is not None:
+            query = query.filter(Dataset.owner_id == owner_id)
+        rows = query.order_by(Dataset.last_accessed_at.desc()).offset(offset).limit(limit).all()
+        return [{**_to_dict(r), "profile": None} for r in rows]
+
+
+def find_by_hash(content_hash: str) -> Optional[str]:
+    """A stored dataset parsed from the same bytes, surviving restarts unlike ``upload_cache``"""
+    try:
+        with SessionLocal() as db:
+            rows = (
+                db.query(Dataset.id)
+                .filter(Dataset.content_hash == content_hash)
+                .order_by(Dataset.created_at.desc())
+                .all()
+            )
+    except SQLAlchemyError as e:
+        logger.warning("dataset registry unavailable: %s", e)
+        return None
+    for (dataset_id,) in rows:
+        if dataset_store.exists(dataset_id):
+            return dataset_id
+    return None
+
+
+# ---------------------------------------------------------------- cleanup
+
+def delete(dataset_id: str) -> bool:
+    """Remove a dataset from memory, disk and the registry; False when it did not exist"""
+    from backend.app.services import upload_cache
+
+    path = dataset_store.dataset_dir(dataset_id)
+    hot_set.discard(dataset_id)
+    pool.drop_dataset(dataset_id)
+    upload_cache.forget_dataset(dataset_id)
+    with _touch_lock:
+        _touched.pop(dataset_id, None)
+    existed = path.exists()
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        with SessionLocal() as db:
+            existed = db.query(Dataset).filter(Dataset.id == dataset_id).delete() > 0 or existed
+            db.commit()
+    except SQLAlchemyError as e:
+        logger.warning("could not delete registry row: %s", e, extra={"dataset_id": dataset_id})
+    return existed
+
+
+def enforce_disk_quota(max_bytes: Optional[int] = None, keep: Iterable[str] = ()) -> List[str]:
+    """
+    Delete least recently used datasets until the store fits ``max_bytes``; returns the ids removed.
+
+    ``keep``, datasets with an append in progress and datasets written within
+    ``QUOTA_GRACE_SECONDS`` are never removed.
+    """
+    from backend.app.services import dataset_append
+
+    max_bytes = settings.dataset_dir_max_bytes if max_bytes is None else max_bytes
+    keep = set(keep)
+    entries = []
+    total = 0
+    for entry in os.scandir(dataset_store.DATASET_DIR):
+        if entry.is_dir():
+            size, mtime = _dir_stats(entry.path)
+            entries.append((entry.name, size, mtime))
+            total += size
+    if total <= max_bytes:
+        return []
+
+    try:
+        with SessionLocal() as db:
+            # last_accessed_at is naive UTC; .timestamp() alone would read it as local time
+            accessed = {
+                i: t.replace(tzinfo=timezone.utc).timestamp()
+                for i, t in db.query(Dataset.id, Dataset.last_accessed_at) if t
+            }
+    except SQLAlchemyError:
+        accessed = {}
+
+    recent = time.time() - QUOTA_GRACE_SECONDS
+    removed = []
+    for dataset_id, size, mtime in sorted(entries, key=lambda e: accessed.get(e[0], e[2])):
+        if total <= max_bytes:
+            break
+        if dataset_id in keep or mtime > recent or dataset_append.is_appending(dataset_id):
+            continue
+        delete(dataset_id)
+        total -= size
+        removed.append(dataset_id)
+    if removed:
+        logger.info("dataset quota enforced", extra={"removed": len(removed), "bytes": total})
+    return removed
+
+
+def stats() -> Dict[str, int]:
+    return hot_set.stats()
@@ -0,0 +1,358 @@
+"""
+Table extraction for PDF and DOCX uploads.
+
+Documents are split into units (PDF pages, DOCX tables), each fingerprinted
+by the hash of its raw content (for PDF pages, including the fonts and form
+XObjects the page draws through). Units not seen before are extracted in
+parallel on the shared process pool; the rest come from an LRU cache, so a
+re-uploaded statement with one changed page only re-extracts that page.
+
+Extracted tables whose headers match are merged into one table; a headerless
+table at the top of the next page with the same width is treated as a
+continuation of the previous one. Every merged table is stored under the
+dataset and the one with the most rows becomes the default table. Scanned
+pages without a text layer yield no tables (there is no OCR step).
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+import pandas as pd
+
+from backend.app.core.concurrency import process_pool
+from backend.app.core.config import settings
+from backend.app.core.telemetry import stage_seconds
+from backend.app.services import dataset_store
+from backend.app.services.dtype_optimizer import maybe_optimize, memory_totals
+
+DOCUMENT_EXTS = ["pdf", "docx"]
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+Rows = List[List[str]]
+
+_cache_lock = threading.Lock()
+_unit_cache: "OrderedDict[Tuple[str, str], List[Rows]]" = OrderedDict()
+_cache_hits = 0
+_cache_misses = 0
+
+
+# ---------------------------------------------------------------- units
+
+def _pdf_object_digest(obj: Any, memo: Dict[int, bytes], seen: frozenset = frozenset()) -> bytes:
+    """
+    Hash of a PDF object with every reference resolved: stream bytes,
+    dictionary entries and array items, recursively. Shared objects (fonts,
+    images) are hashed once per document through ``memo``.
+    """
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in memo:
+            return memo[obj.objid]
+        if obj.objid in seen:  # reference cycle (e.g. /Parent)
+            return f"cycle:{obj.objid}".encode()
+        digest = _pdf_object_digest(obj.resolve(), memo, seen | {obj.objid})
+        memo[obj.objid] = digest
+        return digest
+    h = hashlib.sha256()
+    if isinstance(obj, PDFStream):
+        h.update(b"stream")
+        h.update(_pdf_object_digest(obj.attrs, memo, seen))
+        h.update(obj.get_data())
+    elif isinstance(obj, dict):
+        h.update(b"dict")
+        for key in sorted(obj, key=str):
+            h.update(str(key).encode())
+            h.update(_pdf_object_digest(obj[key], memo, seen))
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"list")
+        for item in obj:
+            h.update(_pdf_object_digest(item, memo, seen))
+    else:
+        h.update(repr(obj).encode())
+    return h.digest()
+
+
+def _pdf_units(path: str) -> List[Tuple[int, str]]:
+    """
+    (page number, hash of everything the page draws from) per page.
+
+    Besides the content streams and geometry this covers the page's
+    resources: form XObjects (whose own content may hold the table), images
+    and fonts with their encodings and ToUnicode maps, since all of them
+    change the characters ``extract_tables`` sees.
+    """
+    import pdfplumber
+
+    units = []
+    memo: Dict[int, bytes] = {}
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            digest = hashlib.sha256(repr((page.page_obj.mediabox, page.page_obj.rotate)).encode())
+            for stream in page.page_obj.contents:
+                digest.update(_pdf_object_digest(stream, memo))
+            digest.update(_pdf_object_digest(page.page_obj.resources or {}, memo))
+            units.append((page.page_number, digest.hexdigest()))
+    return units
+
+
+def _docx_units(path: str) -> List[Tuple[bytes, str]]:
+    """(table XML, hash) for every top-level table in the document body"""
+    with zipfile.ZipFile(path) as z:
+        root = ElementTree.fromstring(z.read("word/document.xml"))
+
+    tables: List[ElementTree.Element] = []
+
+    def walk(node: ElementTree.Element) -> None:
+        for child in node:
+            if child.tag == f"{W_NS}tbl":
+                tables.append(child)  # nested tables stay inside their cell text
+            else:
+                walk(child)
+
+    walk(root)
+    units = []
+    for tbl in tables:
+        xml = ElementTree.tostring(tbl)
+        units.append((xml, hashlib.sha256(xml).hexdigest()))
+    return units
+
+
+# ---------------------------------------------------------------- workers
+
+def extract_pdf_pages(path: str, page_numbers: List[int]) -> Dict[int, List[Rows]]:
+    """Tables found on the given pages; runs inside a pool worker"""
+    import pdfplumber
+
+    out = {}
+    with pdfplumber.open(path) as pdf:
+        for n in page_numbers:
+            tables = pdf.pages[n - 1].extract_tables()
+            out[n] = [[[(cell or "").strip() for cell in row] for row in table] for table in tables]
+    return out
+
+
+def _cell_text(tc: ElementTree.Element) -> str:
+    paragraphs = ["".join(t.text or "" for t in p.iter(f"{W_NS}t")) for p in tc.iter(f"{W_NS}p")]
+    return "\n".join(p for p in paragraphs if p).strip()
+
+
+def extract_docx_tables(xml_blobs: List[bytes]) -> List[Rows]:
+    """Cell text of each table; horizontally merged cells keep their grid width"""
+    out = []
+    for xml in xml_blobs:
+        tbl = ElementTree.fromstring(xml)
+        rows = []
+        for tr in tbl.findall(f"{W_NS}tr"):
+            row = []
+            for tc in tr.findall(f"{W_NS}tc"):
+                span = tc.find(f"{W_NS}tcPr/{W_NS}gridSpan")
+                row.append(_cell_text(tc))
+                row.extend([""] * (int(span.get(f"{W_NS}val", 1)) - 1 if span is not None else 0))
+            rows.append(row)
+        out.append(rows)
+    return out
+
+
+def _chunks(items: list, parts: int) -> List[list]:
+    size = max(1, math.ceil(len(items) / parts))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# ---------------------------------------------------------------- cache
+
+def _cache_get(key: Tuple[str, str]) -> Optional[List[Rows]]:
+    global _cache_hits, _cache_misses
+    with _cache_lock:
+        tables = _unit_cache.get(key)
+        if tables is None:
+            _cache_misses += 1
+            return None
+        _cache_hits += 1
+        _unit_cache.move_to_end(key)
+        return tables
+
+
+def _cache_put(key: Tuple[str, str], tables: List[Rows]) -> None:
+    with _cache_lock:
+        _unit_cache[key] = tables
+        _unit_cache.move_to_end(key)
+        while len(_unit_cache) > settings.document_cache_entries:
+            _unit_cache.popitem(last=False)
+
+
+def stats() -> Dict[str, int]:
+    with _cache_lock:
+        return {"entries": len(_unit_cache), "hits": _cache_hits, "misses": _cache_misses}
+
+
+# ---------------------------------------------------------------- merging
+
+def _norm(cell: str) -> str:
+    return re.sub(r"\s+", " ", cell).strip().lower()
+
+
+def _looks_like_header(row: List[str]) -> bool:
+    """Headers are mostly non-empty and non-numeric"""
+    filled = [c for c in row if c.strip()]
+    numeric = [c for c in filled if re.fullmatch(r"[-+(]?[$€£]?[\d.,]+\)?%?", c.strip())]
+    return len(filled) >= max(1, len(row) // 2) and not numeric
+
+
+def merge_tables(units: List[Tuple[int, List[Rows]]]) -> List[Dict[str, Any]]:
+    """
+    Group extracted tables by header.
+
+    ``units`` is (unit number, tables) in document order. Returns groups of
+    ``{"header", "rows", "units"}``.
+    """
+    groups: List[Dict[str, Any]] = []
+    by_header: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    last: Optional[Dict[str, Any]] = None
+    for unit, tables in units:
+        for position, table in enumerate(tables):
+            table = [row for row in table if any(c.strip() for c in row)]
+            if not table:
+                continue
+            key = tuple(_norm(c) for c in table[0])
+            if key in by_header:
+                group, body = by_header[key], table[1:]
+            elif (
+                last is not None and position == 0 and unit == last["units"][-1] + 1
+                and len(table[0]) == len(last["header"]) and not _looks_like_header(table[0])
+            ):
+                # Headerless top-of-page table continuing the previous page
+                group, body = last, table
+            else:
+                group = {"header": table[0], "rows": [], "units": []}
+                groups.append(group)
+                by_header[key] = group
+                body = table[1:]
+            group["rows"].extend(body)
+            if not group["units"] or group["units"][-1] != unit:
+                group["units"].append(unit)
+            last = group
+    return [g for g in groups if g["rows"]]
+
+
+def _column_names(header: List[str]) -> List[str]:
+    names, seen = [], set()
+    for i, cell in enumerate(header):
+        base = re.sub(r"\s+", " ", cell).strip() or f"column_{i + 1}"
+        name, n = base, 2
+        while name in seen:
+            name, n = f"{base}_{n}", n + 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _coerce_numeric(series: pd.Series) -> pd.Series:
+    """Convert text columns such as "1,234.50" or "(12.00)" when every value parses"""
+    cleaned = series.str.replace(r"[,$€£\s]", "", regex=True).str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+    cleaned = cleaned.mask(cleaned == "")
+    converted = pd.to_numeric(cleaned, errors="coerce")
+    if cleaned.notna().any() and converted.notna().sum() == cleaned.notna().sum():
+        return converted
+    return series
+
+
+def to_dataframe(group: Dict[str, Any]) -> pd.DataFrame:
+    columns = _column_names(group["header"])
+    width = len(columns)
+    rows = [(row + [""] * width)[:width] for row in group["rows"]]
+    df = pd.DataFrame(rows, columns=columns)
+    return df.apply(_coerce_numeric)
+
+
+# ---------------------------------------------------------------- entry point
+
+def ingest_document(path: str, file_ext: str, dataset_id: str) -> Dict[str, Any]:
+    """
+    Extract every table of a PDF or DOCX file into ``dataset_id``.
+
+    Raises ValueError when the document contains no tables.
+    """
+    start = time.perf_counter()
+    if file_ext == "pdf":
+        units = _pdf_units(path)
+        keys = [("pdf", digest) for _, digest in units]
+    elif file_ext == "docx":
+        units = _docx_units(path)
+        keys = [("docx", digest) for _, digest in units]
+    else:
+        raise ValueError(f"Unsupported document type: .{file_ext}")
+
+    extracted: Dict[int, List[Rows]] = {}
+    missing = []
+    for i, key in enumerate(keys):
+        tables = _cache_get(key)
+        if tables is None:
+            missing.append(i)
+        else:
+            extracted[i] = tables
+
+    if missing:
+        extract_start = time.perf_counter()
+        if file_ext == "pdf":
+            pages = [units[i][0] for i in missing]
+            chunks = _chunks(pages, settings.process_workers)
+            if len(chunks) == 1:
+                results = [extract_pdf_pages(path, chunks[0])]
+            else:
+                pool = process_pool()
+                results = [f.result() for f in [pool.submit(extract_pdf_pages, path, c) for c in chunks]]
+            by_page = {n: tables for result in results for n, tables in result.items()}
+            new = {i: by_page[units[i][0]] for i in missing}
+        else:
+            chunks = _chunks(missing, settings.process_workers)
+            if len(chunks) == 1:
+                results = [extract_docx_tables([units[i][0] for i in chunks[0]])]
+            else:
+                pool = process_pool()
+                futures = [pool.submit(extract_docx_tables, [units[i][0] for i in c]) for c in chunks]
+                results = [f.result() for f in futures]
+            new = {i: [tables] for chunk, result in zip(chunks, results) for i, tables in zip(chunk, result)}
+        stage_seconds.observe(time.perf_counter() - extract_start, f"document.extract_{file_ext}", "ok")
+        for i, tables in new.items():
+            _cache_put(keys[i], tables)
+        extracted.update(new)
+
+    # Unit numbers drive continuation detection: pages for PDF, table order for DOCX
+    numbered = [(units[i][0] if file_ext == "pdf" else i, extracted[i]) for i in range(len(units))]
+    groups = merge_tables(numbered)
+    if not groups:
+        raise ValueError("No tables found in document")
+
+    primary = max(range(len(groups)), key=lambda g: len(groups[g]["rows"]))
+    tables = []
+    for g, group in enumerate(groups):
+        name = dataset_store.DEFAULT_TABLE if g == primary else f"table_{g + 1}"
+        df, memory = maybe_optimize(to_dataframe(group))
+        dataset_store.write_dataframe(dataset_id, df, table=name)
+        tables.append({
+            "table": name,
+            "columns": list(df.columns),
+            "rows": int(len(df)),
+            "pages" if file_ext == "pdf" else "source_tables": group["units"],
+            "memory": memory,
+        })
+
+    return {
+        "dataset_id": dataset_id,
+        "kind": file_ext,
+        "units": len(units),
+        "cached_units": len(units) - len(missing),
+        "extracted_units": len(missing),
+        "tables": tables,
+        "rows": sum(t["rows"] for t in tables),
+        "memory": memory_totals([t["memory"] for t in tables]),
+        "seconds": round(time.perf_counter() - start, 4),
+    }
@@ -0,0 +1,143 @@
+"""
+Memory-optimised dtypes for parsed DataFrames.
+
+Parsers hand back object/int64/float64 columns, so a region column holds one
+Python string per cell. ``optimize_dataframe`` shrinks a frame before it is
+written to the dataset store:
+
+* integers become int32 when their range allows. That is one width for every
+  file rather than the smallest per file, so the partitions appended to a
+  dataset keep its column types;
+* floats become float32 only when every value round-trips exactly, since
+  amounts must not lose cents, and whole-number floats without gaps become
+  integers;
+* low-cardinality text becomes ``category`` (dictionary-encoded in Parquet);
+* text whose every value parses as a date becomes ``datetime64``; a column
+  with any other value ("pending", "TBD") stays text, so nothing is lost.
+
+Memory before and after (``memory_usage(deep=True)``) is reported per
+column and in total.
+"""
+import re
+import warnings
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from backend.app.core.config import settings
+
+DATE_SAMPLE_ROWS = 200
+
+_NUMERIC_TEXT = re.compile(r"^\s*[-+]?\d+(\.\d+)?\s*$")
+_INT32 = np.iinfo(np.int32)
+
+
+def _downcast_int(s: pd.Series) -> pd.Series:
+    """int32 when every value fits, else the column unchanged"""
+    if s.empty or (_INT32.min <= s.min() and s.max() <= _INT32.max):
+        return s.astype(np.int32)
+    return s
+
+
+def _downcast_float(s: pd.Series) -> pd.Series:
+    values = s.to_numpy()
+    finite = values[~np.isnan(values)]
+    whole = len(finite) and np.array_equal(finite, np.round(finite)) and np.abs(finite).max() < 2 ** 53
+    if whole and not s.hasnans:
+        return _downcast_int(s.astype(np.int64))
+    as32 = values.astype(np.float32)
+    if np.array_equal(as32.astype(np.float64), values, equal_nan=True):
+        return pd.Series(as32, index=s.index, name=s.name)
+    return s
+
+
+def _date_format(s: pd.Series) -> Optional[str]:
+    """strptime format shared by the column's values, or None when they are not dates"""
+    sample = s.dropna().astype(str).head(DATE_SAMPLE_ROWS)
+    if sample.empty or sample.str.match(_NUMERIC_TEXT).all():
+        return None  # bare numbers such as years or ids are not dates
+    fmt = guess_datetime_format(sample.iloc[0])
+    if fmt is None:
+        return None
+    parsed = pd.to_datetime(sample, format=fmt, errors="coerce")
+    return fmt if parsed.notna().all() else None
+
+
+def _optimize_column(s: pd.Series, category_max_ratio: float) -> Tuple[pd.Series, Optional[str]]:
+    """The converted column and a note on what was done (None when left alone)"""
+    if not isinstance(s.dtype, np.dtype):
+        return s, None  # categoricals, nullable and Arrow-backed columns are already compact
+    kind = s.dtype.kind
+    if kind in "iu":
+        out = _downcast_int(s)
+        return out, None if out.dtype == s.dtype else "downcast"
+    if kind == "f":
+        out = _downcast_float(s)
+        return out, None if out.dtype == s.dtype else "downcast"
+    if kind != "O":
+        return s, None
+
+    non_null = s.dropna()
+    if non_null.empty or not all(isinstance(v, str) for v in non_null.head(DATE_SAMPLE_ROWS)):
+        return s, None
+
+    fmt = _date_format(s)
+    if fmt is not None:
+        parsed = pd.to_datetime(s, format=fmt, errors="coerce")
+        # A value that does not parse would become NaT; keep the column as text instead
+        if parsed.notna().sum() == len(non_null):
+            return parsed, f"datetime ({fmt})"
+
+    distinct = non_null.nunique()
+    if distinct <= category_max_ratio * len(non_null):
+        return s.astype("category"), f"category ({distinct} values)"
+    return s, None
+
+
+def optimize_dataframe(
+    df: pd.DataFrame, category_max_ratio: Optional[float] = None
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Return ``df`` with smaller dtypes and a report of the conversions.
+
+    Text columns become categories when distinct values are at most
+    ``category_max_ratio`` of the non-null count (``DTYPE_CATEGORY_MAX_RATIO``).
+    """
+    ratio = settings.dtype_category_max_ratio if category_max_ratio is None else category_max_ratio
+    before = df.memory_usage(deep=True, index=False)
+    result = df.copy(deep=False)
+    changes = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        for i, col in enumerate(df.columns):
+            converted, note = _optimize_column(df.iloc[:, i], ratio)
+            if note:
+                # By position, so duplicate column names are handled too
+                result.isetitem(i, converted)
+                changes[str(col)] = {"from": str(df.iloc[:, i].dtype), "to": str(converted.dtype), "note": note}
+    after = result.memory_usage(deep=True, index=False)
+    return result, {
+        "bytes_before": int(before.sum()),
+        "bytes_after": int(after.sum()),
+        "columns": changes,
+    }
+
+
+def maybe_optimize(df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[Dict[str, Any]]]:
+    """``optimize_dataframe`` when ``OPTIMIZE_DTYPES`` is on, else the frame unchanged"""
+    if not settings.optimize_dtypes:
+        return df, None
+    return optimize_dataframe(df)
+
+
+def memory_totals(reports: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, int]]:
+    """Summed before/after bytes of several reports (None when optimisation was off)"""
+    reports = [r for r in reports if r]
+    if not reports:
+        return None
+    return {
+        "bytes_before": sum(r["bytes_before"] for r in reports),
+        "bytes_after": sum(r["bytes_after"] for r in reports),
+    }
@@ -0,0 +1,131 @@
+"""
+Process-wide DuckDB session manager.
+
+One in-memory DuckDB instance is shared by the whole process. Requests borrow
+a cursor (DuckDB's thread-safe per-thread connection) instead of calling
+``duckdb.connect()`` each time, the number of concurrent cursors is capped,
+and each dataset is registered once as a view that later queries reuse.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set
+
+import duckdb
+
+from backend.app.core.config import settings
+from backend.app.services import dataset_store
+
+
+class DuckDBPool:
+    """Hands out cursors on a shared DuckDB instance"""
+
+    def __init__(self, memory_limit: str, threads: int, max_cursors: int):
+        self.memory_limit = memory_limit
+        self.threads = threads
+        self.max_cursors = max_cursors
+        self._con: Optional[duckdb.DuckDBPyConnection] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_cursors)
+        self._views: Set[str] = set()
+        self._active = 0
+        self._peak_active = 0
+        self._checkouts = 0
+        self._wait_seconds = 0.0
+
+    def _root(self) -> duckdb.DuckDBPyConnection:
+        with self._lock:
+            if self._con is None:
+                con = duckdb.connect(database=":memory:")
+                con.execute(f"SET memory_limit='{self.memory_limit}'")
+                con.execute(f"SET threads={int(self.threads)}")
+                self._con = con
+            return self._con
+
+    @contextmanager
+    def cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Borrow a cursor; blocks while ``max_cursors`` queries are already running"""
+        root = self._root()
+        start = time.perf_counter()
+        self._slots.acquire()
+        with self._lock:
+            self._wait_seconds += time.perf_counter() - start
+            self._checkouts += 1
+            self._active += 1
+            self._peak_active = max(self._peak_active, self._active)
+        cur = root.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+
+    @staticmethod
+    def view_name(dataset_id: str, table: str = dataset_store.DEFAULT_TABLE) -> str:
+        return f'"ds_{dataset_id}_{table}"'
+
+    def register_dataset(self, dataset_id: str, table: str = dataset_store.DEFAULT_TABLE) -> str:
+        """Create the dataset's view on first use and return its quoted name"""
+        name = self.view_name(dataset_id, table)
+        if name in self._views:
+            return name
+        scan = dataset_store.scan_expr(dataset_id, table)
+        root = self._root()
+        with self._lock:
+            if name not in self._views:
+                root.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM {scan}")
+                self._views.add(name)
+        return name
+
+    def rebind_dataset(self, dataset_id: str) -> None:
+        """
+        Re-create the dataset's registered views over its current files.
+
+        A view is bound to the column types it was created with; after parts
+        with wider types are added, querying the old view fails. Each view is
+        replaced in one statement, so no query ever finds it missing.
+        """
+        prefix = f'"ds_{dataset_id}_'
+        root = self._root()
+        with self._lock:
+            for name in [v for v in self._views if v.startswith(prefix)]:
+                scan = dataset_store.scan_expr(dataset_id, name[len(prefix):-1])
+                root.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM {scan}")
+
+    def drop_dataset(self, dataset_id: str) -> None:
+        """Forget every view registered for a dataset"""
+        prefix = f'"ds_{dataset_id}_'
+        root = self._root()
+        with self._lock:
+            for name in [v for v in self._views if v.startswith(prefix)]:
+                root.execute(f"DROP VIEW IF EXISTS {name}")
+                self._views.discard(name)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "memory_limit": self.memory_limit,
+                "threads": self.threads,
+                "max_cursors": self.max_cursors,
+                "active_cursors": self._active,
+                "peak_active_cursors": self._peak_active,
+                "checkouts": self._checkouts,
+                "total_wait_seconds": round(self._wait_seconds, 3),
+                "registered_views": len(self._views),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+            self._views.clear()
+
+
+pool = DuckDBPool(
+    memory_limit=settings.duckdb_memory_limit,
+    threads=settings.duckdb_threads,
+    max_cursors=settings.duckdb_max_cursors,
+)
@@ -0,0 +1,141 @@
+"""
+Multi-sheet Excel ingest.
+
+Every non-empty sheet of a workbook becomes its own table under the dataset.
+Sheets are parsed in parallel on the shared process pool, with calamine (a
+Rust reader) when ``python-calamine`` is installed. Each worker writes its
+sheet's Parquet itself, so only a small summary crosses the process boundary.
+The first non-empty sheet is stored as the default table, which is what
+profiling, previews and widget queries read.
+"""
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from backend.app.core.concurrency import process_pool
+from backend.app.core.config import settings
+from backend.app.core.telemetry import stage_seconds
+from backend.app.services import dataset_store
+from backend.app.services.dtype_optimizer import maybe_optimize, memory_totals
+
+EXCEL_EXTS = ["xlsx", "xls"]
+
+
+def reader_engine() -> Optional[str]:
+    """pandas ``read_excel`` engine to use; None lets pandas pick"""
+    if settings.excel_engine != "auto":
+        return settings.excel_engine or None
+    try:
+        import python_calamine  # noqa: F401
+        return "calamine"
+    except ImportError:
+        return None
+
+
+def list_sheets(path: str, engine: Optional[str] = None) -> List[str]:
+    """Sheet names in workbook order, without reading any cells"""
+    if engine == "calamine":
+        from python_calamine import CalamineWorkbook
+        return list(CalamineWorkbook.from_path(path).sheet_names)
+    with pd.ExcelFile(path, engine=engine) as workbook:
+        return list(workbook.sheet_names)
+
+
+def table_name(sheet: str, taken: set) -> str:
+    """A dataset-store-safe table name for ``sheet``, unique within ``taken``"""
+    base = re.sub(r"[^A-Za-z0-9_\-]+", "_", sheet).strip("_").lower() or "sheet"
+    name, n = base, 2
+    while name in taken:
+        name, n = f"{base}_{n}", n + 1
+    taken.add(name)
+    return name
+
+
+def _tidy(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop blank rows/columns and make mixed-type columns Parquet-safe"""
+    df = df.dropna(how="all").dropna(axis=1, how="all")
+    df = df.rename(columns=lambda c: str(c))
+    for col in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed"):
+            # Numbers and text in one column: store the text form, keep the NaNs
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def ingest_sheet(path: str, sheet: str, engine: Optional[str], dataset_id: str, table: str) -> Dict[str, Any]:
+    """Parse one sheet and store it as ``table``; runs inside a pool worker"""
+    start = time.perf_counter()
+    df = _tidy(pd.read_excel(path, sheet_name=sheet, engine=engine))
+    if not len(df) or not len(df.columns):
+        return {"sheet": sheet, "table": None, "rows": 0, "columns": 0,
+                "seconds": round(time.perf_counter() - start, 4), "status": "empty"}
+    df, memory = maybe_optimize(df)
+    dataset_store.write_dataframe(dataset_id, df, table=table)
+    return {
+        "sheet": sheet,
+        "table": table,
+        "rows": int(len(df)),
+        "columns": int(len(df.columns)),
+        "seconds": round(time.perf_counter() - start, 4),
+        "status": "done",
+        "memory": memory,
+    }
+
+
+def ingest_workbook(path: str, dataset_id: str) -> Dict[str, Any]:
+    """
+    Store every sheet of an Excel workbook under ``dataset_id``.
+
+    Returns per-sheet row counts and timings plus the sheet that became the
+    default table. Raises ValueError when no sheet has data.
+    """
+    start = time.perf_counter()
+    engine = reader_engine()
+    sheets = list_sheets(path, engine)
+    taken = {dataset_store.DEFAULT_TABLE}
+    jobs = [(sheet, table_name(sheet, taken)) for sheet in sheets]
+
+    results: List[Dict[str, Any]] = []
+    if len(jobs) == 1:
+        # Not worth a round trip through the pool
+        sheet, table = jobs[0]
+        try:
+            results.append(ingest_sheet(path, sheet, engine, dataset_id, table))
+        except Exception as e:
+            results.append({"sheet": sheet, "table": None, "status": "failed", "error": str(e)})
+    else:
+        pool = process_pool()
+        futures = [pool.submit(ingest_sheet, path, sheet, engine, dataset_id, table) for sheet, table in jobs]
+        for (sheet, _), future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({"sheet": sheet, "table": None, "status": "failed", "error": str(e)})
+
+    for r in results:
+        if "seconds" in r:
+            stage_seconds.observe(r["seconds"], "excel.sheet", "ok")
+
+    stored = [r for r in results if r["status"] == "done"]
+    if not stored:
+        failed = [r for r in results if r["status"] == "failed"]
+        raise ValueError(failed[0]["error"] if failed else "Workbook has no sheets with data")
+
+    # Sheets are read in workbook order, so the first stored one is what a
+    # single-sheet reader would have shown
+    primary = stored[0]
+    dataset_store.rename_table(dataset_id, primary["table"], dataset_store.DEFAULT_TABLE)
+    primary["table"] = dataset_store.DEFAULT_TABLE
+
+    return {
+        "dataset_id": dataset_id,
+        "engine": engine or "default",
+        "sheets": results,
+        "primary_sheet": primary["sheet"],
+        "tables": len(stored),
+        "rows": sum(r["rows"] for r in stored),
+        "memory": memory_totals([r["memory"] for r in stored]),
+        "seconds": round(time.perf_counter() - start, 4),
+    }
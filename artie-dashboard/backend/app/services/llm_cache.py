@@ -0,0 +1,187 @@
+"""
+Response cache for LLM widget proposals.
+
+Requests are keyed by a hash of their canonical form (normalised domain and
+intent, sorted columns, key-sorted hints, model and prompt), so the same
+question asked twice is answered from memory instead of a Groq round-trip.
+Two backends are available: an in-process LRU and a SQLite file that
+survives restarts and is shared between workers.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.app.core.config import settings
+
+ROOT_DIR = Path(__file__).parent.parent.parent  # backend/
+
+
+def _norm_text(value: str) -> str:
+    return " ".join(str(value).lower().split())
+
+
+def make_key(domain: str, intent: str, columns: List[str], hints: Dict, namespace: str = "") -> str:
+    """Stable hash for a proposal request; semantically equal requests share a key"""
+    canonical = {
+        "ns": namespace,
+        "domain": _norm_text(domain),
+        "intent": _norm_text(intent),
+        "columns": sorted(str(c) for c in columns),
+        "hints": hints,
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Base cache with TTL handling and hit/miss counters"""
+
+    backend = "none"
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _load(self, key: str) -> Optional[Tuple[float, Any]]:
+        return None
+
+    def _store(self, key: str, value: Any) -> None:
+        pass
+
+    def _evict(self, key: str) -> None:
+        pass
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._load(key)
+        if entry is not None and self._expired(entry[0]):
+            self._evict(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        self._store(key, value)
+
+    def size(self) -> int:
+        return 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": self.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+class MemoryLRUCache(LLMCache):
+    """Bounded in-process LRU; values are stored as JSON so callers never share objects"""
+
+    backend = "memory"
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+        return entry[0], json.loads(entry[1])
+
+    def _store(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time(), json.dumps(value, default=str))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def _evict(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def size(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteCache(LLMCache):
+    """On-disk cache in a single SQLite file, trimmed to ``max_entries`` oldest-first"""
+
+    backend = "sqlite"
+
+    def __init__(self, ttl_seconds: int, max_entries: int, path: str):
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._con.commit()
+
+    def _load(self, key):
+        with self._lock:
+            row = self._con.execute(
+                "SELECT created_at, value FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def _store(self, key, value):
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), time.time()),
+            )
+            self._con.execute(
+                "DELETE FROM llm_cache WHERE key NOT IN "
+                "(SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._con.commit()
+
+    def _evict(self, key):
+        with self._lock:
+            self._con.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._con.commit()
+
+    def size(self):
+        with self._lock:
+            return self._con.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+def build_cache() -> LLMCache:
+    backend = settings.llm_cache_backend.lower()
+    if backend == "sqlite":
+        path = Path(settings.llm_cache_path)
+        if not path.is_absolute():
+            path = ROOT_DIR / path
+        return SQLiteCache(settings.llm_cache_ttl_seconds, settings.llm_cache_max_entries, str(path))
+    if backend == "memory":
+        return MemoryLRUCache(settings.llm_cache_ttl_seconds, settings.llm_cache_max_entries)
+    return LLMCache(settings.llm_cache_ttl_seconds)
+
+
+proposal_cache = build_cache()
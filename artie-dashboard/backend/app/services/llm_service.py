@@ -1,11 +1,14 @@
 
-from typing import List, Dict
-import json, re
+from typing import List, Dict, Optional
+import asyncio, json, logging, re
 
 from langchain_groq import ChatGroq
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from backend.app.core.config import settings
+from backend.app.core.telemetry import timed
+from backend.app.services.llm_cache import make_key, proposal_cache
+from backend.app.services.widget_recommender import recommend_from_hints
 
 
 # Initialize Groq-backed chat LLM
@@ -16,27 +19,53 @@ _llm = ChatGroq(
     max_retries=2,
 )
 
+logger = logging.getLogger(__name__)
+
+# Caps concurrent Groq calls made through the async path
+_llm_slots = asyncio.Semaphore(settings.llm_max_concurrency)
+
 SYSTEM_PROMPT = """You propose concise, role-aware dashboard widgets.
 Input includes: domain, intent, columns, and sample stats.
 Output must be a JSON list of widget proposals:
 [{ "title": str, "chart": "line|bar|area|pie|funnel|treemap|table",
    "x": "field_name", "y": "field_or_agg", "group_by": "field_or_null",
    "explanation": str }]
+When a "draft" list is given, improve it for the intent: reorder, retitle,
+drop or swap widgets. Keep its fields unless the data clearly supports others.
 Follow only what data supports. Do not invent fields."""
 
 
-def propose_widgets(domain: str, intent: str, columns: List[str], hints: Dict) -> List[Dict]:
+class LLMUnavailable(RuntimeError):
+    """The LLM did not refine the draft (error, timeout or unparseable answer)"""
+
+
+def _keep_draft(draft: List[Dict], fallback: bool, reason: str) -> List[Dict]:
+    """Heuristic draft in place of a refinement, or LLMUnavailable when the caller must know"""
+    if not fallback:
+        raise LLMUnavailable(reason)
+    logger.warning("%s, keeping heuristic proposals", reason)
+    return draft
+
+
+def _cache_key(domain: str, intent: str, columns: List[str], hints: Dict, draft: List[Dict]) -> str:
+    return make_key(domain, intent, columns, {**hints, "draft": draft}, namespace=f"{settings.groq_model}:{SYSTEM_PROMPT}")
+
+
+def _messages(domain: str, intent: str, columns: List[str], hints: Dict, draft: List[Dict]) -> list:
     user = {
         "domain": domain,
         "intent": intent,
         "columns": columns,
         "hints": hints,
+        "draft": draft,
     }
-    msgs = [
+    return [
         SystemMessage(content=SYSTEM_PROMPT),
         HumanMessage(content=f"DATA:\n{user}")
     ]
-    resp = _llm.invoke(msgs)
+
+
+def _parse_proposals(resp) -> Optional[List[Dict]]:
     text = getattr(resp, "content", str(resp))
     # crude fence removal
     text = re.sub(r"^```json|```$", "", text.strip(), flags=re.M)
@@ -46,25 +75,80 @@ def propose_widgets(domain: str, intent: str, columns: List[str], hints: Dict) -
             return out
     except Exception:
         pass
+    return None
+
+
+@timed("llm.propose_widgets")
+def propose_widgets(
+    domain: str,
+    intent: str,
+    columns: List[str],
+    hints: Dict,
+    draft: Optional[List[Dict]] = None,
+    fallback: bool = True,
+) -> List[Dict]:
+    """
+    Ask the LLM to refine ``draft`` (the heuristic proposals).
+
+    The draft defaults to ``recommend_from_hints(hints)`` and is returned
+    unchanged when the LLM fails or answers with something unparseable;
+    with ``fallback=False`` LLMUnavailable is raised instead.
+    """
+    if draft is None:
+        draft = recommend_from_hints(hints, domain, intent)
+    cache_key = _cache_key(domain, intent, columns, hints, draft)
+    cached = proposal_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        resp = _llm.invoke(_messages(domain, intent, columns, hints, draft))
+    except Exception as e:
+        return _keep_draft(draft, fallback, f"LLM call failed: {e}")
+    out = _parse_proposals(resp)
+    if out is not None:
+        proposal_cache.set(cache_key, out)
+        return out
+    return _keep_draft(draft, fallback, "LLM answer was not a proposal list")
+
+
+@timed("llm.propose_widgets")
+async def apropose_widgets(
+    domain: str,
+    intent: str,
+    columns: List[str],
+    hints: Dict,
+    draft: Optional[List[Dict]] = None,
+    fallback: bool = True,
+) -> List[Dict]:
+    """
+    Non-blocking variant of ``propose_widgets``.
+
+    At most ``LLM_MAX_CONCURRENCY`` calls are in flight at once and each is
+    bounded by ``LLM_TIMEOUT_SECONDS``; a timed-out or failed call returns the
+    heuristic draft (or raises LLMUnavailable with ``fallback=False``).
+    Cancelling the awaiting task cancels the request.
+    """
+    if draft is None:
+        draft = recommend_from_hints(hints, domain, intent)
+    cache_key = _cache_key(domain, intent, columns, hints, draft)
+    cached = proposal_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    async with _llm_slots:
+        try:
+            resp = await asyncio.wait_for(
+                _llm.ainvoke(_messages(domain, intent, columns, hints, draft)),
+                timeout=settings.llm_timeout_seconds,
+            )
+        except asyncio.TimeoutError:
+            return _keep_draft(draft, fallback, f"LLM call timed out after {settings.llm_timeout_seconds}s")
+        except Exception as e:
+            return _keep_draft(draft, fallback, f"LLM call failed: {e}")
 
-    # fallback simple rules
-    base = []
-    if hints.get("has_date") and hints.get("measures"):
-        base.append({
-            "title": "Monthly Trend",
-            "chart": "line",
-            "x": hints.get("date_field", "date"),
-            "y": f"SUM({hints['measures'][0]})",
-            "group_by": None,
-            "explanation": "Trend over time"
-        })
-    if hints.get("categories") and hints.get("measures"):
-        base.append({
-            "title": "Top Categories",
-            "chart": "bar",
-            "x": hints["categories"][0],
-            "y": f"SUM({hints['measures'][0]})",
-            "group_by": None,
-            "explanation": "Top contributors"
-        })
-    return base[:3]
+    out = _parse_proposals(resp)
+    if out is not None:
+        proposal_cache.set(cache_key, out)
+        return out
+    return _keep_draft(draft, fallback, "LLM answer was not a proposal list")
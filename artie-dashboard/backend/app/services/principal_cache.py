@@ -0,0 +1,182 @@
+"""
+Authenticated principals without a database round-trip per request.
+
+``get_current_user`` used to load the ``User`` row for every API call. It
+now resolves the token subject to a ``Principal`` (a plain copy of the
+fields endpoints read) in one of two ways:
+
+* from a short-TTL, LRU-bounded cache keyed by subject, filled from the
+  database on a miss;
+* when ``AUTH_STATELESS_CLAIMS`` is on, straight from the signed claims of
+  the access token (``uid``, ``role``, ...), with no lookup at all.
+
+Updating or deleting a user's role, active flag or identity invalidates
+their cache entry through a SQLAlchemy mapper event, and marks tokens
+issued before the change as stale, so those tokens are checked against
+the database again instead of trusted. Both only reach this process;
+other workers pick up the change within the cache TTL, or when the
+access token expires on the stateless path.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.auth import ACCESS_TOKEN_EXPIRE_MINUTES
+from backend.app.core.config import settings
+from backend.app.core.telemetry import timed
+from backend.app.models import User
+
+# Token claims that carry a full principal (besides ``sub``)
+CLAIMS = ("uid", "username", "name", "role", "superuser")
+
+# Changes to these columns alter what a request is allowed to do
+_WATCHED = ("email", "username", "full_name", "role", "is_active", "is_superuser")
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user, detached from any session"""
+    id: int
+    email: str
+    username: str
+    full_name: Optional[str]
+    role: str
+    is_active: bool
+    is_superuser: bool = False
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            username=user.username,
+            full_name=user.full_name,
+            role=user.role,
+            is_active=bool(user.is_active),
+            is_superuser=bool(user.is_superuser),
+        )
+
+
+def principal_claims(user: User) -> Dict[str, Any]:
+    """Access-token claims from which a Principal can be rebuilt without the database"""
+    return {
+        "sub": user.email,
+        "uid": user.id,
+        "username": user.username,
+        "name": user.full_name,
+        "role": user.role,
+        "superuser": bool(user.is_superuser),
+    }
+
+
+_lock = threading.Lock()
+_principals: "OrderedDict[str, tuple]" = OrderedDict()  # subject -> (expires_at, Principal)
+# subject -> time of the last change; tokens issued before it are not trusted
+_changed: Dict[str, float] = {}
+_stats = {"hits": 0, "misses": 0, "stateless": 0, "invalidations": 0}
+
+
+def invalidate(subject: str) -> None:
+    """Forget the cached principal for ``subject`` and distrust its earlier tokens"""
+    now = time.time()
+    horizon = now - ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    with _lock:
+        _principals.pop(subject, None)
+        _changed[subject] = now
+        # Tokens older than their own lifetime are rejected anyway
+        for s in [s for s, t in _changed.items() if t < horizon]:
+            del _changed[s]
+        _stats["invalidations"] += 1
+
+
+def clear() -> None:
+    with _lock:
+        _principals.clear()
+        _changed.clear()
+
+
+def _changed_since(subject: str, issued_at: Optional[float]) -> bool:
+    with _lock:
+        changed = _changed.get(subject)
+    # ``iat`` has one-second resolution: a token issued in the same second as a change is distrusted
+    return changed is not None and (issued_at is None or issued_at <= changed)
+
+
+def from_claims(payload: Dict[str, Any]) -> Optional[Principal]:
+    """
+    Principal built from signed token claims, or None when they are missing or predate a change.
+
+    ``is_active`` is not a claim: inactive users are never issued tokens, and
+    deactivating a user invalidates them, so tokens issued before that are
+    sent back to the database here instead of being trusted.
+    """
+    if not settings.auth_stateless_claims or any(c not in payload for c in CLAIMS):
+        return None
+    subject = payload["sub"]
+    if _changed_since(subject, payload.get("iat")):
+        return None
+    with _lock:
+        _stats["stateless"] += 1
+    return Principal(
+        id=payload["uid"],
+        email=subject,
+        username=payload["username"],
+        full_name=payload["name"],
+        role=payload["role"],
+        is_active=True,
+        is_superuser=bool(payload["superuser"]),
+    )
+
+
+async def get_principal(db: AsyncSession, subject: str) -> Optional[Principal]:
+    """Cached principal for a token subject, loaded from the database on a miss"""
+    now = time.monotonic()
+    with _lock:
+        entry = _principals.get(subject)
+        if entry is not None and entry[0] > now:
+            _principals.move_to_end(subject)
+            _stats["hits"] += 1
+            return entry[1]
+        _stats["misses"] += 1
+
+    started = time.time()
+    with timed("auth.user_lookup"):
+        user = (await db.execute(select(User).where(User.email == subject))).scalars().first()
+    if user is None:
+        return None
+    principal = Principal.from_user(user)
+    if settings.auth_principal_cache_ttl_seconds > 0:
+        with _lock:
+            if _changed.get(subject, 0) >= started:  # changed while we were reading it
+                return principal
+            _principals[subject] = (now + settings.auth_principal_cache_ttl_seconds, principal)
+            _principals.move_to_end(subject)
+            while len(_principals) > settings.auth_principal_cache_entries:
+                _principals.popitem(last=False)
+    return principal
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return dict(_stats, entries=len(_principals))
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target: User) -> None:
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in _WATCHED):
+        return
+    invalidate(target.email)
+    old_email = state.attrs.email.history.deleted
+    if old_email:
+        invalidate(old_email[0])
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target: User) -> None:
+    invalidate(target.email)
@@ -0,0 +1,162 @@
+"""
+Column profiling.
+
+``profile_dataset`` computes dtypes, null counts, approximate cardinality,
+min/max and a date-likeness score for every column from mergeable per-part
+sketches (``column_sketch``), each computed by one vectorized DuckDB
+aggregate, plus a small uniform row sample (``sampling``) for previews. The
+result is cached per dataset and shared by hint inference, widget proposal,
+the heuristic widgets and the upload preview.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from backend.app.core.config import settings
+from backend.app.core.telemetry import timed
+from backend.app.services import column_sketch, dataset_registry, sampling
+from backend.app.services.duckdb_pool import pool
+
+NUMERIC_TYPES = (
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT",
+    "FLOAT", "REAL", "DOUBLE", "DECIMAL",
+)
+TEMPORAL_TYPES = ("DATE", "TIMESTAMP", "TIME")
+ID_NAMES = ["id", "uuid"]
+
+# Share of non-null text values that must parse as timestamps for a column to count as a date
+DATE_SCORE_THRESHOLD = 0.9
+
+_cache: "OrderedDict[str, Tuple[Dict, pd.DataFrame]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _is_numeric(dtype: str) -> bool:
+    return dtype.upper().startswith(NUMERIC_TYPES)
+
+
+def _is_temporal(dtype: str) -> bool:
+    return dtype.upper().startswith(TEMPORAL_TYPES)
+
+
+def _is_id(name: str) -> bool:
+    lc = str(name).lower()
+    return lc in ID_NAMES or lc.endswith("_id")
+
+
+def _classify(name: str, dtype: str, date_score: float) -> str:
+    if _is_temporal(dtype) or date_score >= DATE_SCORE_THRESHOLD:
+        return "date"
+    if _is_id(name):
+        return "id"
+    if _is_numeric(dtype):
+        return "measure"
+    return "category"
+
+
+@timed("profile.scan")
+def _scan(dataset_id: str, sample_rows: int) -> Tuple[Dict, pd.DataFrame]:
+    view = dataset_registry.view(dataset_id)
+    with pool.cursor() as con:
+        schema = [(r[0], r[1]) for r in con.execute(f"DESCRIBE SELECT * FROM {view}").fetchall()]
+        # Per-part sketches are stored beside the Parquet, so only new parts are scanned
+        sketch = column_sketch.table_sketch(con, dataset_id)
+        if sampling.sample_method() == "head":
+            sample = con.execute(f"SELECT * FROM {view} LIMIT {int(sample_rows)}").fetch_df()
+        elif sampling.approximated(sketch["rows"]):
+            # Approximate queries need the stored per-part reservoirs anyway; sampling them is cheap
+            scan, _, _ = sampling.table_sample(con, dataset_id, sample_rows)
+            sample = con.execute(f"SELECT * FROM {scan}").fetch_df()
+        else:
+            sample = con.execute(sampling.reservoir(view, sample_rows)).fetch_df()
+
+    row_count = sketch["rows"]
+    columns: List[Dict] = []
+    for name, dtype in schema:
+        col = sketch["columns"].get(name) or {"non_null": 0, "min": None, "max": None, "date_hits": 0, "hll": None}
+        non_null = col["non_null"]
+        if _is_temporal(dtype):
+            date_score = 1.0
+        else:
+            date_score = col["date_hits"] / non_null if non_null and dtype.upper() == "VARCHAR" else 0.0
+        distinct = column_sketch.distinct_estimate(col["hll"]) if col["hll"] else 0
+        columns.append({
+            "name": name,
+            "dtype": dtype,
+            "kind": _classify(name, dtype, date_score),
+            "null_count": row_count - non_null,
+            # HLL can overshoot on small inputs; never report more distincts than values
+            "distinct_estimate": min(distinct, non_null),
+            "min": col["min"],
+            "max": col["max"],
+            "date_score": round(date_score, 3),
+        })
+
+    profile = {"dataset_id": dataset_id, "row_count": row_count, "columns": columns}
+    return profile, sample
+
+
+def _cached(dataset_id: str, sample_rows: int) -> Tuple[Dict, pd.DataFrame]:
+    with _cache_lock:
+        if dataset_id in _cache:
+            _cache.move_to_end(dataset_id)
+            return _cache[dataset_id]
+    entry = _scan(dataset_id, sample_rows)
+    with _cache_lock:
+        _cache[dataset_id] = entry
+        _cache.move_to_end(dataset_id)
+        while len(_cache) > settings.profile_cache_entries:
+            _cache.popitem(last=False)
+    return entry
+
+
+def profile_dataset(dataset_id: str, sample_rows: int = 200) -> Dict:
+    """Column profile for a dataset (computed once, then served from cache)"""
+    return _cached(dataset_id, sample_rows)[0]
+
+
+def dataset_sample(dataset_id: str, sample_rows: int = 200) -> pd.DataFrame:
+    """
+    Uniform reservoir sample of ``sample_rows`` rows, drawn alongside the profile
+    (the first rows instead when ``PROFILE_SAMPLE_METHOD`` is ``head``)
+    """
+    return _cached(dataset_id, sample_rows)[1]
+
+
+def invalidate_profile(dataset_id: Optional[str] = None) -> None:
+    """Drop the cached profile for one dataset, or all of them"""
+    with _cache_lock:
+        if dataset_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(dataset_id, None)
+
+
+def columns_of_kind(profile: Dict, kind: str) -> List[str]:
+    return [c["name"] for c in profile["columns"] if c["kind"] == kind]
+
+
+def hints_from_profile(profile: Dict) -> Dict:
+    """Widget-proposal hints (same shape as the old sample-based hints)"""
+    dates = sorted(
+        (c for c in profile["columns"] if c["kind"] == "date"),
+        key=lambda c: c["date_score"],
+        reverse=True,
+    )
+    date_field = dates[0]["name"] if dates else None
+    if date_field is None:
+        for c in profile["columns"]:
+            lc = str(c["name"]).lower()
+            if "date" in lc or "time" in lc:
+                date_field = c["name"]
+                break
+    return {
+        "has_date": date_field is not None,
+        "date_field": date_field,
+        "measures": columns_of_kind(profile, "measure")[:3],
+        "categories": columns_of_kind(profile, "category")[:3],
+        "row_count": profile["row_count"],
+    }
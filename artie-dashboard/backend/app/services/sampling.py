@@ -0,0 +1,102 @@
+"""
+Uniform row samples of stored tables.
+
+Head samples (``LIMIT n``) are biased: sorted exports show one month or one
+region, and categories that first appear late are missed. ``table_sample``
+instead draws a uniform random sample across all parts of a table:
+
+* every part larger than ``APPROX_SAMPLE_ROWS`` keeps a reservoir sample of
+  that many rows beside it (``part-NNNNN.sample``, Parquet), built with one
+  scan the first time it is needed; smaller parts are sampled directly;
+* each part contributes rows in proportion to its row count (read from its
+  sketch), so appending a partition never requires rescanning old parts.
+
+Approximate widget queries aggregate over it (see ``aggregation``), so the
+stored reservoirs are only built for tables large enough to be approximated
+(``approximated``). The profiler's small preview sample comes from
+``table_sample`` for those tables and from a direct ``reservoir`` otherwise.
+"""
+import os
+from pathlib import Path
+from typing import Tuple
+
+from backend.app.core.config import settings
+from backend.app.services import column_sketch, dataset_store
+from backend.app.services.streaming_ingest import sql_str
+
+SAMPLE_METHODS = ("reservoir", "head")
+SAMPLE_SUFFIX = ".sample"
+
+# Fixed seed so repeated queries over the same parts see the same sample
+SEED = 42
+
+
+def sample_method() -> str:
+    """``PROFILE_SAMPLE_METHOD``, checked against ``SAMPLE_METHODS``"""
+    method = settings.profile_sample_method.lower()
+    if method not in SAMPLE_METHODS:
+        raise ValueError(
+            f"Unsupported PROFILE_SAMPLE_METHOD: {settings.profile_sample_method!r} "
+            f"(expected one of {', '.join(SAMPLE_METHODS)})"
+        )
+    return method
+
+
+# Fail at startup: a typo would otherwise quietly fall back to reservoir sampling
+sample_method()
+
+
+def approximated(rows: int) -> bool:
+    """Whether widget queries over a table of ``rows`` rows may be answered from samples"""
+    return settings.approx_queries and rows >= settings.approx_min_rows
+
+
+def sample_path(part: Path) -> Path:
+    return part.with_name(part.stem + SAMPLE_SUFFIX)
+
+
+def reservoir(scan: str, rows: int) -> str:
+    """SELECT of a uniform sample of ``rows`` rows from a table expression"""
+    return f"SELECT * FROM {scan} USING SAMPLE reservoir({int(rows)} ROWS) REPEATABLE ({SEED})"
+
+
+def _part_source(con, part: Path, rows: int) -> str:
+    """Table expression to sample ``part`` from: the part itself, or its stored reservoir"""
+    scan = f"read_parquet({sql_str(str(part))})"
+    if rows <= settings.approx_sample_rows:
+        return scan
+    path = sample_path(part)
+    if not path.exists():
+        tmp = path.with_name(path.name + ".tmp")
+        con.execute(
+            f"COPY ({reservoir(scan, settings.approx_sample_rows)}) "
+            f"TO {sql_str(str(tmp))} (FORMAT PARQUET, COMPRESSION ZSTD)"
+        )
+        os.replace(tmp, path)
+    return f"read_parquet({sql_str(str(path))})"
+
+
+def table_sample(con, dataset_id: str, rows: int, table: str = dataset_store.DEFAULT_TABLE) -> Tuple[str, int, int]:
+    """
+    A uniform sample of about ``rows`` rows of a table.
+
+    Returns (DuckDB table expression, rows in the sample, rows in the table).
+    Tables no larger than ``rows`` are returned whole.
+    """
+    parts = sorted(dataset_store.table_dir(dataset_id, table).glob("*.parquet"))
+    if not parts:
+        raise FileNotFoundError(f"Dataset not found: {dataset_id}/{table}")
+    counts = [column_sketch.part_sketch(con, part)["rows"] for part in parts]
+    total = sum(counts)
+    if total <= rows:
+        return dataset_store.scan_expr(dataset_id, table), total, total
+
+    selects, taken = [], 0
+    for part, count in zip(parts, counts):
+        # Proportional allocation keeps the combined sample uniform across parts;
+        # a stored reservoir holds at most APPROX_SAMPLE_ROWS rows
+        k = min(round(rows * count / total), settings.approx_sample_rows)
+        if k:
+            selects.append(f"SELECT * FROM ({reservoir(_part_source(con, part, count), k)})")
+            taken += k
+    return f"({' UNION ALL BY NAME '.join(selects)})", taken, total
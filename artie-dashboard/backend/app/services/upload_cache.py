@@ -0,0 +1,105 @@
+"""
+Content-addressed cache for repeated uploads.
+
+Uploads are hashed (SHA-256) while they stream to disk. The hash maps to the
+dataset that was parsed from those bytes, and ``(hash, domain, intent)`` maps
+to the widget proposals generated for it, so re-uploading the same monthly
+extract skips parsing and the LLM round-trip entirely. Both maps are LRU
+bounded, and the raw ``tmp/uploads`` spool is trimmed to a byte quota.
+"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from backend.app.core.config import settings
+from backend.app.services import dataset_store
+
+_lock = threading.Lock()
+_datasets: "OrderedDict[str, str]" = OrderedDict()
+_results: "OrderedDict[Tuple[str, str, str], Dict]" = OrderedDict()
+
+
+def _result_key(content_hash: str, domain: str, intent: str) -> Tuple[str, str, str]:
+    return content_hash, domain.strip().lower(), intent.strip().lower()
+
+
+def _put(store: OrderedDict, key, value, limit: int) -> None:
+    with _lock:
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > limit:
+            store.popitem(last=False)
+
+
+def get_dataset(content_hash: str) -> Optional[str]:
+    """Dataset previously parsed from these bytes, if it is still on disk"""
+    with _lock:
+        dataset_id = _datasets.get(content_hash)
+        if dataset_id is None:
+            return None
+        _datasets.move_to_end(content_hash)
+    if not dataset_store.exists(dataset_id):
+        forget_dataset(dataset_id)
+        return None
+    return dataset_id
+
+
+def put_dataset(content_hash: str, dataset_id: str) -> None:
+    _put(_datasets, content_hash, dataset_id, settings.upload_cache_entries)
+
+
+def get_result(content_hash: str, domain: str, intent: str) -> Optional[Dict]:
+    """Stored upload result for the same bytes, domain and intent"""
+    key = _result_key(content_hash, domain, intent)
+    with _lock:
+        result = _results.get(key)
+        if result is None:
+            return None
+        _results.move_to_end(key)
+    if not dataset_store.exists(result["dataset_id"]):
+        forget_dataset(result["dataset_id"])
+        return None
+    return result
+
+
+def put_result(content_hash: str, domain: str, intent: str, result: Dict) -> None:
+    _put(_results, _result_key(content_hash, domain, intent), result, settings.upload_cache_entries)
+
+
+def forget_dataset(dataset_id: str) -> None:
+    """Drop every cache entry pointing at a dataset (e.g. after it was modified or deleted)"""
+    with _lock:
+        for h in [h for h, d in _datasets.items() if d == dataset_id]:
+            del _datasets[h]
+        for k in [k for k, r in _results.items() if r["dataset_id"] == dataset_id]:
+            del _results[k]
+
+
+def enforce_upload_quota(upload_dir: Path, max_bytes: Optional[int] = None) -> int:
+    """Delete least-recently-used raw uploads until the spool fits ``max_bytes``; returns files removed"""
+    max_bytes = settings.upload_dir_max_bytes if max_bytes is None else max_bytes
+    files = []
+    total = 0
+    for entry in os.scandir(upload_dir):
+        if entry.is_file():
+            st = entry.stat()
+            files.append((max(st.st_atime, st.st_mtime), st.st_size, entry.path))
+            total += st.st_size
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def stats() -> Dict:
+    with _lock:
+        return {"datasets": len(_datasets), "results": len(_results)}
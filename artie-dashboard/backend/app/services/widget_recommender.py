@@ -0,0 +1,196 @@
+"""
+Deterministic widget recommender.
+
+Builds a full set of widget proposals from a column profile in a few
+milliseconds, without any network call: time-series charts for date ×
+measure pairs, breakdowns for categories whose cardinality suits a bar or
+pie, and a summary table. Measures that move almost in lockstep with one
+already charted are skipped so the set stays diverse. The output uses the
+same proposal shape as the LLM, which may optionally refine it.
+"""
+import re
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+MAX_WIDGETS = 6
+MAX_TREND_MEASURES = 2
+MAX_BREAKDOWN_CATEGORIES = 2
+
+# Cardinality bands for categorical charts
+PIE_MAX_DISTINCT = 6
+GROUP_MAX_DISTINCT = 8
+BAR_MAX_DISTINCT = 50
+
+# |r| at or above which a second measure adds nothing over the first
+REDUNDANT_CORRELATION = 0.9
+# |r| at or above which the relationship is worth mentioning
+NOTABLE_CORRELATION = 0.6
+
+
+def _tokens(text: str) -> set:
+    return {t for t in re.split(r"[^a-z0-9]+", str(text).lower()) if t}
+
+
+def _rank_by_intent(columns: List[Dict], domain: str, intent: str) -> List[Dict]:
+    """Stable sort putting columns named in the domain/intent first"""
+    wanted = _tokens(domain) | _tokens(intent)
+    return sorted(columns, key=lambda c: 0 if _tokens(c["name"]) & wanted else 1)
+
+
+def measure_correlations(sample: pd.DataFrame, measures: Iterable[str]) -> Dict[str, Dict[str, float]]:
+    """Pairwise Pearson correlations between measure columns of a sample"""
+    cols = [m for m in measures if m in sample.columns]
+    if len(cols) < 2:
+        return {}
+    corr = sample[cols].apply(pd.to_numeric, errors="coerce").corr()
+    out: Dict[str, Dict[str, float]] = {}
+    for a in cols:
+        for b in cols:
+            r = corr.at[a, b]
+            if a != b and pd.notna(r):
+                out.setdefault(a, {})[b] = round(float(r), 3)
+    return out
+
+
+def _pick_measures(measures: List[str], correlations: Dict[str, Dict[str, float]]) -> List[str]:
+    picked: List[str] = []
+    for m in measures:
+        if any(abs(correlations.get(m, {}).get(p, 0.0)) >= REDUNDANT_CORRELATION for p in picked):
+            continue
+        picked.append(m)
+    return picked
+
+
+def _related(measure: str, correlations: Dict[str, Dict[str, float]]) -> str:
+    best = max(correlations.get(measure, {}).items(), key=lambda kv: abs(kv[1]), default=None)
+    if best is None or abs(best[1]) < NOTABLE_CORRELATION:
+        return ""
+    return f"; moves with {best[0]} (r={best[1]:+.2f})"
+
+
+def recommend(
+    columns: List[Dict],
+    domain: str = "",
+    intent: str = "",
+    correlations: Optional[Dict[str, Dict[str, float]]] = None,
+    limit: int = MAX_WIDGETS,
+) -> List[Dict]:
+    """
+    Widget proposals from column descriptors.
+
+    Each descriptor needs ``name`` and ``kind`` (date / id / measure /
+    category); ``distinct_estimate``, ``min`` and ``date_score`` are used
+    when present.
+    """
+    correlations = correlations or {}
+    columns = _rank_by_intent(columns, domain, intent)
+
+    dates = sorted((c for c in columns if c["kind"] == "date"), key=lambda c: -c.get("date_score", 1.0))
+    date_field = dates[0]["name"] if dates else None
+    measure_cols = {c["name"]: c for c in columns if c["kind"] == "measure"}
+    measures = _pick_measures(list(measure_cols), correlations)
+    categories = [
+        c for c in columns
+        if c["kind"] == "category" and (c.get("distinct_estimate") is None or 2 <= c["distinct_estimate"] <= BAR_MAX_DISTINCT)
+    ]
+
+    props: List[Dict] = []
+
+    # Time series: one trend per (non-redundant) measure
+    if date_field:
+        for m in measures[:MAX_TREND_MEASURES]:
+            props.append({
+                "title": f"{m} over time",
+                "chart": "line",
+                "x": date_field,
+                "y": f"SUM({m})",
+                "group_by": None,
+                "explanation": f"Trend of total {m} by {date_field}{_related(m, correlations)}",
+            })
+        groupable = [c for c in categories if c.get("distinct_estimate") and c["distinct_estimate"] <= GROUP_MAX_DISTINCT]
+        if measures and groupable:
+            m, cat = measures[0], groupable[0]["name"]
+            props.append({
+                "title": f"{m} by {cat} over time",
+                "chart": "area",
+                "x": date_field,
+                "y": f"SUM({m})",
+                "group_by": cat,
+                "explanation": f"How each {cat} contributes to {m} over time",
+            })
+
+    # Breakdowns: bar for the top values, pie when there are few non-negative slices
+    for cat_col in categories[:MAX_BREAKDOWN_CATEGORIES]:
+        cat = cat_col["name"]
+        if not measures:
+            break
+        m = measures[0]
+        props.append({
+            "title": f"Top {cat} by {m}",
+            "chart": "bar",
+            "x": cat,
+            "y": f"SUM({m})",
+            "group_by": None,
+            "explanation": f"Largest contributors to {m} by {cat}",
+        })
+        distinct = cat_col.get("distinct_estimate")
+        min_value = measure_cols[m].get("min")
+        if distinct and distinct <= PIE_MAX_DISTINCT and (min_value is None or min_value >= 0):
+            props.append({
+                "title": f"{m} share by {cat}",
+                "chart": "pie",
+                "x": cat,
+                "y": f"SUM({m})",
+                "group_by": None,
+                "explanation": f"Share of {m} across {distinct} {cat} values",
+            })
+
+    # Second measure on the main category, if it is not a near-duplicate of the first
+    if len(measures) > 1 and categories:
+        m, cat = measures[1], categories[0]["name"]
+        props.append({
+            "title": f"Top {cat} by {m}",
+            "chart": "bar",
+            "x": cat,
+            "y": f"SUM({m})",
+            "group_by": None,
+            "explanation": f"Largest contributors to {m} by {cat}{_related(m, correlations)}",
+        })
+
+    props = props[:max(limit - 1, 1)]
+    # Always close with the raw rows so every dataset gets at least one widget
+    props.append({
+        "title": f"{domain} Data Summary".strip(),
+        "chart": "table",
+        "x": None,
+        "y": None,
+        "group_by": None,
+        "explanation": f"Analysis for: {intent}" if intent else "Raw records",
+    })
+    return props[:limit]
+
+
+def recommend_from_profile(
+    profile: Dict,
+    sample: Optional[pd.DataFrame] = None,
+    domain: str = "",
+    intent: str = "",
+) -> List[Dict]:
+    """Proposals for a profiled dataset; the sample (if given) supplies correlations"""
+    correlations = {}
+    if sample is not None:
+        measures = [c["name"] for c in profile["columns"] if c["kind"] == "measure"]
+        correlations = measure_correlations(sample, measures)
+    return recommend(profile["columns"], domain=domain, intent=intent, correlations=correlations)
+
+
+def recommend_from_hints(hints: Dict, domain: str = "", intent: str = "") -> List[Dict]:
+    """Proposals from the coarse hints dict used by the chat endpoint"""
+    columns = []
+    date_field = hints.get("date_field") if hints.get("has_date") else None
+    if date_field:
+        columns.append({"name": date_field, "kind": "date"})
+    columns += [{"name": m, "kind": "measure"} for m in hints.get("measures", [])]
+    columns += [{"name": c, "kind": "category"} for c in hints.get("categories", []) if c != date_field]
+    return recommend(columns, domain=domain, intent=intent)
@@ -0,0 +1,93 @@
+"""
+Payload size and encode time for the tabular response formats.
+
+Compares the legacy preview path (pandas → to_json → json.loads → json.dumps)
+with row JSON built from Arrow, orjson columnar JSON and Arrow IPC, on a
+synthetic ERP-like table produced by DuckDB.
+
+    cd artie-dashboard
+    python -m backend.benchmarks.bench_serialization --rows 1000 100000 1000000 --json out.json
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import duckdb
+import numpy as np
+
+from backend.app.services.columnar import encode_arrow, encode_columnar_json, table_rows
+
+SYNTHETIC_SQL = """
+SELECT
+    i AS invoice_id,
+    DATE '2023-01-01' + CAST(i % 730 AS INTEGER) AS invoice_date,
+    'C' || CAST(i % 5000 AS VARCHAR) AS customer,
+    ['North', 'South', 'East', 'West'][1 + i % 4] AS region,
+    ROUND(random() * 10000, 2) AS amount,
+    CAST(i % 50 AS INTEGER) AS qty
+FROM range({rows}) t(i)
+"""
+
+
+def _legacy_rows(table) -> bytes:
+    df = table.to_pandas()
+    df = df.replace({np.nan: None})
+    rows = json.loads(df.to_json(orient="records", date_format="iso"))
+    return json.dumps(rows).encode()
+
+
+def _arrow_rows(table) -> bytes:
+    return json.dumps(table_rows(table)).encode()
+
+
+ENCODERS: Dict[str, Callable] = {
+    "legacy_row_json": _legacy_rows,
+    "row_json": _arrow_rows,
+    "columnar_json": encode_columnar_json,
+    "arrow_ipc": encode_arrow,
+}
+
+
+def bench(rows: int, repeat: int) -> List[Dict]:
+    table = duckdb.sql(SYNTHETIC_SQL.format(rows=int(rows))).fetch_arrow_table()
+    results = []
+    for name, encode in ENCODERS.items():
+        timings = []
+        size = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            size = len(encode(table))
+            timings.append(time.perf_counter() - start)
+        results.append({
+            "rows": rows,
+            "format": name,
+            "bytes": size,
+            "median_ms": round(statistics.median(timings) * 1000, 2),
+            "min_ms": round(min(timings) * 1000, 2),
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'rows':>9}  {'format':<16} {'bytes':>12} {'median ms':>10} {'min ms':>10}")
+    for rows in args.rows:
+        for r in bench(rows, args.repeat):
+            results.append(r)
+            print(f"{r['rows']:>9}  {r['format']:<16} {r['bytes']:>12} {r['median_ms']:>10} {r['min_ms']:>10}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
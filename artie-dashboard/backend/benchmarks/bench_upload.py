@@ -0,0 +1,396 @@
+"""
+Upload pipeline benchmark on synthetic ERP datasets.
+
+Generates sales, general-ledger and inventory tables as CSV/TSV/XLSX/PDF/DOCX,
+runs them through the elas-erp upload pipeline exactly as ``/api/upload``
+does (save, parse, profile, propose, preview; Groq replaced by a stub, so the
+heuristic widgets are used) and reports end-to-end and per-stage p50/p99
+latency, per-stage row throughput and peak RSS. Every case runs in a fresh
+process so peak memory belongs to that case alone. Inputs are seeded, so two
+runs on different commits see identical files.
+
+The pipeline lives in ``elas-erp/backend/app``, which is deployed over this
+backend; run from a checkout where both are combined:
+
+    python -m backend.benchmarks.bench_upload --rows 1000 50000 --json after.json --baseline before.json
+
+XLSX needs openpyxl, PDF needs reportlab and DOCX needs python-docx; formats
+whose writer is missing are reported as skipped.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+DATASETS = ("sales", "gl", "inventory")
+FORMATS = ("csv", "tsv", "xlsx", "pdf", "docx")
+DOCUMENT_FORMATS = ("pdf", "docx")
+
+REGIONS = np.array(["North", "South", "East", "West", "Central"])
+PRODUCTS = np.array([f"P-{i:04d}" for i in range(250)])
+ACCOUNTS = np.array(["1000 Cash", "1200 Receivables", "1400 Inventory", "2000 Payables",
+                     "4000 Revenue", "5000 COGS", "6100 Salaries", "6200 Rent", "6300 Travel"])
+COST_CENTERS = np.array([f"CC-{i:02d}" for i in range(12)])
+WAREHOUSES = np.array(["WH-AMS", "WH-CHI", "WH-DAL", "WH-SIN"])
+CATEGORIES = np.array(["Electronics", "Office", "Home", "Industrial", "Grocery"])
+
+
+# ---------------------------------------------------------------- datasets
+
+def make_frame(kind: str, rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D")
+    if kind == "sales":
+        qty = rng.integers(1, 50, rows)
+        price = rng.gamma(2.0, 40.0, rows).round(2)
+        return pd.DataFrame({
+            "invoice_id": np.arange(1, rows + 1),
+            "invoice_date": dates.strftime("%Y-%m-%d"),
+            "customer": np.char.add("C", rng.integers(0, 5000, rows).astype(str)),
+            "region": rng.choice(REGIONS, rows),
+            "product": rng.choice(PRODUCTS, rows),
+            "quantity": qty,
+            "unit_price": price,
+            "amount": (qty * price).round(2),
+        })
+    if kind == "gl":
+        value = rng.lognormal(6, 1.2, rows).round(2)
+        is_debit = rng.random(rows) < 0.5
+        return pd.DataFrame({
+            "entry_id": np.arange(1, rows + 1),
+            "posting_date": dates.strftime("%Y-%m-%d"),
+            "account": rng.choice(ACCOUNTS, rows),
+            "cost_center": rng.choice(COST_CENTERS, rows),
+            "debit": np.where(is_debit, value, 0.0),
+            "credit": np.where(is_debit, 0.0, value),
+            "memo": np.char.add("JE batch ", rng.integers(0, 400, rows).astype(str)),
+        })
+    if kind == "inventory":
+        return pd.DataFrame({
+            "sku": rng.choice(PRODUCTS, rows),
+            "warehouse": rng.choice(WAREHOUSES, rows),
+            "category": rng.choice(CATEGORIES, rows),
+            "on_hand": rng.integers(0, 2000, rows),
+            "reorder_point": rng.integers(20, 300, rows),
+            "unit_cost": rng.gamma(2.0, 15.0, rows).round(2),
+            "last_counted": dates.strftime("%Y-%m-%d"),
+        })
+    raise ValueError(f"unknown dataset {kind!r}")
+
+
+def _write_pdf(df: pd.DataFrame, path: Path) -> None:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+
+    cells = [list(df.columns)] + df.astype(str).values.tolist()
+    # Ruled cells, like a printed statement: pdfplumber's default table finder follows the lines
+    table = Table(cells, repeatRows=1, style=TableStyle([("GRID", (0, 0), (-1, -1), 0.25, colors.black)]))
+    SimpleDocTemplate(str(path), pagesize=landscape(A4)).build([table])
+
+
+def _write_docx(df: pd.DataFrame, path: Path) -> None:
+    import docx
+
+    document = docx.Document()
+    table = document.add_table(rows=len(df) + 1, cols=len(df.columns))
+    for cell, name in zip(table.rows[0].cells, df.columns):
+        cell.text = str(name)
+    for row, values in zip(table.rows[1:], df.astype(str).itertuples(index=False)):
+        for cell, value in zip(row.cells, values):
+            cell.text = value
+    document.save(str(path))
+
+
+def write_file(df: pd.DataFrame, fmt: str, path: Path) -> None:
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    elif fmt == "tsv":
+        df.to_csv(path, index=False, sep="\t")
+    elif fmt == "xlsx":
+        df.to_excel(path, index=False)
+    elif fmt == "pdf":
+        _write_pdf(df, path)
+    elif fmt == "docx":
+        _write_docx(df, path)
+    else:
+        raise ValueError(f"unknown format {fmt!r}")
+
+
+def prepare_inputs(case: Dict[str, Any], workdir: Path) -> List[str]:
+    """One file per iteration, each from its own seed so no upload hits a cache"""
+    paths = []
+    for i in range(case["warmup"] + case["iterations"]):
+        seed = case["seed"] + i
+        path = workdir / f"{case['dataset']}_{case['rows']}_{seed}.{case['format']}"
+        if not path.exists():
+            tmp = path.with_name("partial_" + path.name)
+            write_file(make_frame(case["dataset"], case["rows"], seed), case["format"], tmp)
+            tmp.replace(path)
+        paths.append(str(path))
+    return paths
+
+
+# ---------------------------------------------------------------- measuring
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile; with few samples p99 is simply the slowest run"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class _StubReply:
+    content = "stubbed"  # not a proposal list, so the pipeline keeps the heuristic widgets
+
+
+class _StubLLM:
+    """Stands in for ChatGroq; ``latency`` simulates the model round trip"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def invoke(self, messages):
+        time.sleep(self.latency)
+        return _StubReply()
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.latency)
+        return _StubReply()
+
+
+async def _upload(path: str, domain: str) -> Dict[str, Any]:
+    """One upload through the same calls the ``/api/upload`` endpoint makes"""
+    from starlette.datastructures import UploadFile
+
+    from backend.app.services.upload_pipeline import (
+        StageTracker,
+        check_upload_filename,
+        run_upload_pipeline,
+        save_upload,
+    )
+
+    tracker = StageTracker()
+    with open(path, "rb") as f:
+        file = UploadFile(f, filename=Path(path).name)
+        file_ext = check_upload_filename(file.filename)
+        fpath, content_hash = await save_upload(file, tracker)
+    return await run_upload_pipeline(fpath, file_ext, content_hash, domain, "benchmark", tracker)
+
+
+async def _upload_all(case: Dict[str, Any], paths: List[str]) -> Dict[str, Any]:
+    from fastapi import HTTPException
+
+    from backend.app.core.telemetry import stage_seconds
+
+    totals: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors: List[str] = []
+    for i, path in enumerate(paths):
+        before = stage_seconds.totals()
+        start = time.perf_counter()
+        try:
+            await _upload(path, case["dataset"])
+        except HTTPException as e:
+            errors.append(f"{e.status_code}: {str(e.detail)[:200]}")
+            continue
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {str(e)[:200]}")
+            continue
+        elapsed = time.perf_counter() - start
+        if i < case["warmup"]:
+            continue
+        totals.append(elapsed)
+        for (name, status), (count, total) in stage_seconds.totals().items():
+            prev_count, prev_total = before.get((name, status), (0, 0.0))
+            if count > prev_count:
+                stages.setdefault(name, []).append(total - prev_total)
+    return {"totals": totals, "stages": stages, "errors": errors}
+
+
+def run_case(case: Dict[str, Any], paths: List[str]) -> Dict[str, Any]:
+    """Upload every input once through the pipeline and summarise the timings"""
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ.setdefault("LOG_TO_STDERR", "false")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from backend.app.core.concurrency import shutdown_process_pool
+    from backend.app import models  # noqa: F401  (registers every table)
+    from backend.app.database import Base, engine
+    from backend.app.services import llm_service
+
+    # The pipeline registers every dataset; those writes are part of what is measured
+    Base.metadata.create_all(bind=engine)
+    llm_service._llm = _StubLLM(case["llm_latency"])
+    baseline_rss = _peak_rss_mb()
+    try:
+        measured = asyncio.run(_upload_all(case, paths))
+    finally:
+        shutdown_process_pool()
+    totals, stages, errors = measured["totals"], measured["stages"], measured["errors"]
+
+    rows = case["rows"]
+    file_bytes = os.path.getsize(paths[-1])
+    p50 = percentile(totals, 50)
+    return {
+        **{k: case[k] for k in ("dataset", "format", "rows", "iterations")},
+        "file_bytes": file_bytes,
+        "ok": len(totals),
+        "errors": errors[:3],
+        "p50_ms": _ms(p50),
+        "p99_ms": _ms(percentile(totals, 99)),
+        "rows_per_s": round(rows / p50) if p50 else None,
+        "mb_per_s": round(file_bytes / p50 / 1e6, 2) if p50 else None,
+        "stages": {
+            name: {
+                "p50_ms": _ms(percentile(values, 50)),
+                "p99_ms": _ms(percentile(values, 99)),
+                "rows_per_s": round(rows / percentile(values, 50)) if percentile(values, 50) else None,
+            }
+            for name, values in sorted(stages.items())
+        },
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def _run_isolated(case: Dict[str, Any], paths: List[str]) -> Dict[str, Any]:
+    # Not multiprocessing.Pool: its workers are daemonic and could not start the
+    # process pool that Excel and document ingestion use
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_case, case, paths).result()
+
+
+# ---------------------------------------------------------------- reporting
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _case_key(r: Dict[str, Any]) -> tuple:
+    return (r["dataset"], r["format"], r["rows"])
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """Cases whose p50 latency or peak RSS grew by more than ``tolerance``"""
+    previous = {_case_key(r): r for r in baseline if "p50_ms" in r}
+    regressions = []
+    for r in results:
+        old = previous.get(_case_key(r))
+        if old is None:
+            continue
+        for metric in ("p50_ms", "peak_rss_mb"):
+            new_value, old_value = r.get(metric), old.get(metric)
+            if new_value and old_value and new_value > old_value * (1 + tolerance):
+                regressions.append(
+                    f"{r['dataset']}/{r['format']}/{r['rows']}: {metric} {old_value} -> {new_value}"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--datasets", nargs="+", choices=DATASETS, default=list(DATASETS))
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 50_000])
+    parser.add_argument("--max-document-rows", type=int, default=5_000,
+                        help="row cap for PDF/DOCX inputs, which are slow to generate")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the stubbed LLM takes")
+    parser.add_argument("--workdir", help="where generated inputs are kept (default: a temp dir)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run cases in this process; faster, but peak RSS accumulates")
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs baseline")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="bench_upload_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    print(f"{'dataset':<10} {'format':<6} {'rows':>8} {'bytes':>12} {'p50 ms':>10} {'p99 ms':>10} {'rows/s':>10} {'peak MB':>8}")
+    for dataset in args.datasets:
+        for fmt in args.formats:
+            for rows in args.rows:
+                if fmt in DOCUMENT_FORMATS:
+                    rows = min(rows, args.max_document_rows)
+                case = {
+                    "dataset": dataset, "format": fmt, "rows": rows, "seed": args.seed,
+                    "iterations": args.iterations, "warmup": args.warmup,
+                    "llm_latency": args.llm_latency,
+                }
+                if any(_case_key(r) == _case_key(case) for r in results):
+                    continue
+                try:
+                    paths = prepare_inputs(case, workdir)
+                except ImportError as e:
+                    results.append({**case, "skipped": f"writer unavailable: {e.name}"})
+                    print(f"{dataset:<10} {fmt:<6} {rows:>8}  skipped ({e.name} not installed)")
+                    continue
+                r = run_case(case, paths) if args.in_process else _run_isolated(case, paths)
+                results.append(r)
+                print(f"{dataset:<10} {fmt:<6} {rows:>8} {r['file_bytes']:>12} {r['p50_ms']!s:>10} "
+                      f"{r['p99_ms']!s:>10} {r['rows_per_s']!s:>10} {r['peak_rss_mb']!s:>8}")
+                for error in r["errors"]:
+                    print(f"    error {error}")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("json_path", "baseline")},
+        },
+        "results": results,
+    }
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
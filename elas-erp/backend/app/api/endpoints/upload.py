@@ -1,207 +1,142 @@
-import os, uuid, shutil, json
-from typing import List, Dict, Any
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
-import duckdb
-import numpy as np
-import pandas as pd
-from datetime import datetime
-from pathlib import Path
-from backend.app.services.dashboard_generator import generate_quick_viz
-from backend.app.services.file_parsers import parse_file, validate_dataframe
+import asyncio, json, logging
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from backend.app.core.config import settings
+from backend.app.services.upload_jobs import job_queue
+from backend.app.services.upload_pipeline import (
+    StageTracker,
+    check_upload_filename,
+    check_upload_mode,
+    run_upload_pipeline,
+    save_upload,
+)
 
 router = APIRouter()
 
-# Create uploads directory using absolute path
-ROOT_DIR = Path(__file__).parent.parent.parent.parent  # Go up to project root
-UPLOAD_DIR = ROOT_DIR / "app" / "tmp" / "uploads"
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+logger = logging.getLogger(__name__)
 
-# Log file in PROJECT ROOT
-GROQ_LOG_FILE = ROOT_DIR / "GROQ_DEBUG.log"
 
-
-def log_upload_info(message: str):
-    """Write upload info to Groq debug log file in project root"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(GROQ_LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {message}\n")
+def _log_request(file: UploadFile, domain: str, intent: str, message: str):
+    logger.info(message, extra={"upload_filename": file.filename, "domain": domain, "intent": intent})
 
 
 @router.post("/upload")
 async def upload_file(
+    request: Request,
     file: UploadFile = File(...),
     domain: str = Form(...),
     intent: str = Form(...),
+    mode: str = Form("create"),
+    dataset_id: Optional[str] = Form(None),
+    key: Optional[str] = Form(None),
 ):
-    log_upload_info("\n" + "="*80)
-    log_upload_info("📤 NEW UPLOAD REQUEST")
-    log_upload_info("="*80)
-    log_upload_info(f"📁 File: {file.filename}")
-    log_upload_info(f"🏢 Domain: {domain}")
-    log_upload_info(f"🎯 Intent: {intent}")
-    
-    print("\n" + "="*80)
-    print("📤 UPLOAD ENDPOINT CALLED")
-    print("="*80)
-    print(f"📁 File: {file.filename}")
-    print(f"🏢 Domain: {domain}")
-    print(f"🎯 Intent: {intent}")
-    
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="No filename provided")
-    
-    # Get file extension
-    file_ext = file.filename.lower().split('.')[-1] if '.' in file.filename else ''
-    supported_exts = ['csv', 'tsv', 'txt', 'xlsx', 'xls', 'pdf', 'docx', 'doc']
-    
-    if file_ext not in supported_exts:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Unsupported file type: .{file_ext}. Supported: {', '.join(supported_exts)}"
-        )
-    
-    log_upload_info(f"📎 File type: {file_ext.upper()}")
-    print(f"📎 File type: {file_ext.upper()}")
-
-    fpath = str(UPLOAD_DIR / f"{uuid.uuid4()}_{file.filename}")
-    with open(fpath, "wb") as out:
-        shutil.copyfileobj(file.file, out)
-    
-    log_upload_info(f"💾 Saved to: {fpath}")
-    print(f"💾 Saved to: {fpath}")
-    
-    # Parse file using appropriate parser
-    try:
-        log_upload_info(f"\n🔄 Parsing {file_ext.upper()} file...")
-        print(f"\n🔄 Parsing {file_ext.upper()} file...")
-        
-        df_parsed, file_type_detected = parse_file(fpath)
-        validate_dataframe(df_parsed, min_rows=1, min_cols=1)
-        
-        log_upload_info(f"✅ Successfully parsed as {file_type_detected}")
-        log_upload_info(f"📊 Data shape: {df_parsed.shape[0]} rows × {df_parsed.shape[1]} columns")
-        print(f"✅ Successfully parsed as {file_type_detected}")
-        print(f"📊 Data shape: {df_parsed.shape[0]} rows × {df_parsed.shape[1]} columns")
-        
-        # Save parsed data as temporary CSV for DuckDB
-        temp_csv_path = fpath.rsplit('.', 1)[0] + '_parsed.csv'
-        df_parsed.to_csv(temp_csv_path, index=False)
-        fpath = temp_csv_path  # Use parsed CSV for downstream processing
-        
-        # Log preview
-        preview_df = df_parsed.head(5)
-        log_upload_info(f"\n📊 PARSED DATA PREVIEW (first 5 rows):")
-        log_upload_info("-"*80)
-        log_upload_info(preview_df.to_string())
-        log_upload_info("-"*80)
-        
-    except Exception as e:
-        error_msg = str(e)
-        log_upload_info(f"❌ Parsing failed: {error_msg}")
-        print(f"❌ Parsing failed: {error_msg}")
-        raise HTTPException(status_code=400, detail=f"Failed to parse file: {error_msg}")
-
-    # Generate widget proposals
-    log_upload_info("\n🤖 Calling generate_quick_viz...")
-    print("\n🤖 Calling generate_quick_viz...")
-    
-    # Try AI generation with fallback to mock widgets
-    try:
-        widgets, groq_input, groq_response = generate_quick_viz(csv_path=fpath, domain=domain, intent=intent)
-        log_upload_info(f"✅ Generated {len(widgets)} widgets")
-        print(f"✅ Generated {len(widgets)} widgets")
-    except Exception as ai_error:
-        log_upload_info(f"⚠️ AI widget generation failed: {ai_error}")
-        print(f"⚠️ AI widget generation failed: {ai_error}")
-        print("📊 Using fallback mock widgets...")
-        
-        # Fallback: Create basic widgets based on columns
-        widgets = []
-        groq_input = {"domain": domain, "intent": intent, "columns": df_parsed.columns.tolist()}
-        groq_response = "AI unavailable - using fallback widgets"
-        
-        numeric_cols = df_parsed.select_dtypes(include=['number']).columns.tolist()
-        text_cols = df_parsed.select_dtypes(include=['object']).columns.tolist()
-        
-        # Create a summary table widget
-        widgets.append({
-            "type": "table",
-            "title": f"{domain} Data Summary",
-            "subtitle": f"Analysis for: {intent}",
-            "config": {
-                "columns": df_parsed.columns.tolist()[:5],  # First 5 columns
-                "pageSize": 10
-            }
-        })
-        
-        # If we have numeric columns, create a bar chart
-        if len(numeric_cols) >= 1:
-            widgets.append({
-                "type": "bar",
-                "title": f"{numeric_cols[0]} Overview",
-                "subtitle": f"Distribution of {numeric_cols[0]}",
-                "config": {
-                    "xField": text_cols[0] if text_cols else numeric_cols[0],
-                    "yField": numeric_cols[0],
-                    "limit": 10
-                }
-            })
-        
-        # If we have 2+ numeric columns, create a line chart
-        if len(numeric_cols) >= 2:
-            widgets.append({
-                "type": "line",
-                "title": f"{numeric_cols[0]} vs {numeric_cols[1]}",
-                "subtitle": "Trend comparison",
-                "config": {
-                    "xField": text_cols[0] if text_cols else numeric_cols[0],
-                    "yField": numeric_cols[1],
-                    "limit": 20
-                }
-            })
-        
-        log_upload_info(f"✅ Created {len(widgets)} fallback widgets")
-        print(f"✅ Created {len(widgets)} fallback widgets")
-
-    # Return a small preview sample so the client can render Vega-Lite immediately
-    preview_rows: List[Dict[str, Any]] = []
+    """
+    Parse, profile and propose widgets for an upload.
+
+    ``mode`` is "create" (a new dataset), "append" (add the file's rows to
+    ``dataset_id``) or "upsert" (replace rows of ``dataset_id`` whose
+    comma-separated ``key`` columns match, then append).
+    """
+    _log_request(file, domain, intent, "upload received")
+
+    file_ext = check_upload_filename(file.filename)
+    mode, target_dataset_id, keys = check_upload_mode(mode, dataset_id, key)
+
+    tracker = StageTracker()
+    fpath, content_hash = await save_upload(file, tracker)
+    response_data = await run_upload_pipeline(
+        fpath, file_ext, content_hash, domain, intent, tracker, request=request,
+        mode=mode, target_dataset_id=target_dataset_id, keys=keys,
+    )
+    return JSONResponse(response_data)
+
+
+@router.post("/upload/jobs", status_code=202)
+async def create_upload_job(
+    file: UploadFile = File(...),
+    domain: str = Form(...),
+    intent: str = Form(...),
+    mode: str = Form("create"),
+    dataset_id: Optional[str] = Form(None),
+    key: Optional[str] = Form(None),
+):
+    """
+    Store the file and process it in the background.
+
+    Returns 202 with the job id; poll ``status_url`` or subscribe to
+    ``events_url`` (Server-Sent Events) for per-stage progress. ``mode``,
+    ``dataset_id`` and ``key`` work as for ``POST /upload``.
+    """
+    _log_request(file, domain, intent, "upload job submitted")
+
+    file_ext = check_upload_filename(file.filename)
+    mode, target_dataset_id, keys = check_upload_mode(mode, dataset_id, key)
+    job = job_queue.create(file.filename, domain, intent)
+
+    # The request body is only readable while the request is open, so the
+    # save stage runs here and everything after it runs on the job queue
     try:
-        print("\n📊 Loading preview data with DuckDB...")
-        con = duckdb.connect()
-        # read_csv_auto also handles TSV/TXT
-        df = con.execute(f"SELECT * FROM read_csv_auto('{fpath}') LIMIT 200").fetch_df()
-        
-        # Convert to JSON-serializable format (handle NaN, Timestamp, etc.)
-        df = df.replace({np.nan: None})  # Replace NaN with None
-        preview_rows = json.loads(df.to_json(orient="records", date_format="iso"))
-        
-        print(f"✅ Loaded {len(preview_rows)} preview rows")
-        if preview_rows:
-            print(f"📋 Columns: {list(preview_rows[0].keys())}")
-    except Exception as e:
-        # ignore preview failure; widgets can still be shown with empty data
-        print(f"⚠️ Preview failed: {e}")
-        import traceback
-        traceback.print_exc()
-        preview_rows = []
-
-    response_data = {
-        "dataset_id": os.path.basename(fpath),
-        "widgets": widgets,
-        "preview": preview_rows,
-        "domain": domain,
-        "intent": intent,
-        "groq_input": groq_input,
-        "groq_response": groq_response,
+        fpath, content_hash = await save_upload(file, job.tracker)
+    except BaseException as e:  # also cancellation when the client goes away
+        job_queue.fail(job, str(getattr(e, "detail", "") or e) or type(e).__name__)
+        raise
+    job_queue.submit(job, lambda: run_upload_pipeline(
+        fpath, file_ext, content_hash, domain, intent, job.tracker,
+        mode=mode, target_dataset_id=target_dataset_id, keys=keys, on_refined=job.touch,
+    ))
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/upload/jobs/{job.id}",
+        "events_url": f"/api/upload/jobs/{job.id}/events",
     }
-    
-    print("\n📦 Response summary:")
-    print(f"   - Dataset ID: {response_data['dataset_id']}")
-    print(f"   - Widgets: {len(response_data['widgets'])}")
-    print(f"   - Preview rows: {len(response_data['preview'])}")
-    print(f"   - Groq input: {len(str(groq_input))} chars")
-    print(f"   - Groq response: {len(groq_response)} chars")
-    print("="*80 + "\n")
-    
-    return JSONResponse(response_data)
+
+
+def _get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
+
+
+@router.get("/upload/jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """Current status, per-stage timings and (once finished) the upload result"""
+    return _get_job(job_id).to_dict()
+
+
+@router.get("/upload/jobs/{job_id}/events")
+async def upload_job_events(job_id: str, request: Request):
+    """
+    Server-Sent Events stream of job progress; ends with a ``done`` event.
+
+    Once the job succeeds its result (with heuristic widgets) is sent right
+    away; while the LLM refines those widgets the events stay ``progress``,
+    and ``done`` carries the final widgets.
+    """
+    job = _get_job(job_id)
+
+    def finished() -> bool:
+        return job.done and (job.result or {}).get("refinement") != "pending"
+
+    async def events():
+        last_version = -1
+        while True:
+            if job.version != last_version:
+                last_version = job.version
+                ended = finished()
+                payload = json.dumps(job.to_dict(include_result=job.done), default=str)
+                yield f"event: {'done' if ended else 'progress'}\ndata: {payload}\n\n"
+                if ended:
+                    break
+            if await request.is_disconnected():
+                break
+            await asyncio.sleep(settings.upload_job_poll_seconds)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
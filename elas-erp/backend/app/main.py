@@ -3,11 +3,23 @@ from fastapi.middleware.cors import CORSMiddleware
 
 # ✅ FIX: import from backend.app...  (package-absolute)
 from backend.app.core.config import settings
-from backend.app.api.endpoints import upload, upload_simple, chat, business, documents, ai, dashboard, widgets, dashboards
+from backend.app.core.concurrency import shutdown_process_pool
+from backend.app.core.log import configure_logging, request_id_middleware, shutdown_logging
+from backend.app.core.telemetry import shutdown_tracing, timing_middleware
+from backend.app.database import dispose_async_engine
+from backend.app.api.endpoints import upload, upload_simple, chat, business, documents, ai, dashboard, widgets, dashboards, metrics, datasets
 # Auth endpoints - PostgreSQL is now set up!
 from backend.app.api.endpoints import auth
 
+configure_logging()
+
 app = FastAPI(title=settings.app_name)
+app.add_event_handler("shutdown", shutdown_process_pool)
+app.add_event_handler("shutdown", dispose_async_engine)
+app.add_event_handler("shutdown", shutdown_tracing)
+app.add_event_handler("shutdown", shutdown_logging)
+app.middleware("http")(timing_middleware)
+app.middleware("http")(request_id_middleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,4 +42,7 @@ app.include_router(ai.router, prefix="/api", tags=["ai"])
 app.include_router(dashboard.router, prefix="/api", tags=["dashboard"])
 app.include_router(widgets.router, tags=["widgets"])
 app.include_router(dashboards.router, tags=["dashboards"])
+app.include_router(metrics.router, prefix="/api", tags=["metrics"])
+app.include_router(metrics.prometheus_router, tags=["metrics"])
+app.include_router(datasets.router, prefix="/api", tags=["datasets"])
 
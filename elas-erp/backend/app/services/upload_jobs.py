@@ -0,0 +1,165 @@
+"""
+Background upload jobs.
+
+``POST /api/upload/jobs`` stores the file and returns immediately; parsing,
+profiling and widget proposal run on a small pool of asyncio workers inside
+the API process. Clients poll the job or subscribe to its SSE stream.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from backend.app.core.config import settings
+from backend.app.core.log import request_id_var
+from backend.app.core.telemetry import register_gauge
+from backend.app.services.upload_pipeline import StageTracker
+
+FINISHED = ("succeeded", "failed")
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJob:
+    """State of one background upload; ``version`` increases on every change"""
+
+    def __init__(self, filename: str, domain: str, intent: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.domain = domain
+        self.intent = intent
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.version = 0
+        # Correlation id of the submitting request, reused while the job runs
+        self.request_id = request_id_var.get()
+        self.tracker = StageTracker(on_change=self.touch)
+
+    def touch(self) -> None:
+        self.version += 1
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        out = {
+            "job_id": self.id,
+            "filename": self.filename,
+            "domain": self.domain,
+            "intent": self.intent,
+            "status": self.status,
+            "stages": self.tracker.to_dict(),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if include_result:
+            out["result"] = self.result
+        return out
+
+
+class LocalJobQueue:
+    """
+    In-process job queue backed by ``asyncio.Queue``.
+
+    Workers are started lazily on the running loop. Job state lives in memory
+    and is lost on restart; only the newest ``max_jobs`` jobs are kept.
+    """
+
+    def __init__(self, workers: int, max_jobs: int):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, UploadJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: list = []
+
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._queue is not None and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def create(self, filename: str, domain: str, intent: str) -> UploadJob:
+        job = UploadJob(filename, domain, intent)
+        self.jobs[job.id] = job
+        # Drop the oldest finished jobs once over the limit
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].done:
+                del self.jobs[job_id]
+        return job
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        return self.jobs.get(job_id)
+
+    def fail(self, job: UploadJob, error: str) -> None:
+        """Finish a job that never reached the queue (e.g. its upload could not be saved)"""
+        job.error = error
+        job.status = "failed"
+        job.finished_at = time.time()
+        job.touch()
+
+    def submit(self, job: UploadJob, work: Callable[[], Awaitable[Dict[str, Any]]]) -> None:
+        self._ensure_workers()
+        self._queue.put_nowait((job, work))
+        job.touch()
+
+    async def _worker(self) -> None:
+        while True:
+            job, work = await self._queue.get()
+            token = request_id_var.set(job.request_id)
+            job.status = "running"
+            job.started_at = time.time()
+            job.touch()
+            try:
+                job.result = await work()
+                job.status = "succeeded"
+            except HTTPException as e:
+                job.error = str(e.detail)
+                job.status = "failed"
+            except Exception as e:
+                logger.exception("upload job crashed", extra={"job_id": job.id})
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job.touch()
+                logger.info("upload job finished", extra={
+                    "job_id": job.id,
+                    "status": job.status,
+                    "seconds": round(job.finished_at - job.started_at, 4),
+                })
+                request_id_var.reset(token)
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        statuses = [job.status for job in self.jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "succeeded": statuses.count("succeeded"),
+            "failed": statuses.count("failed"),
+        }
+
+
+job_queue = LocalJobQueue(settings.upload_job_workers, settings.upload_job_history)
+register_gauge(
+    "upload_jobs",
+    "Upload jobs currently tracked, by status",
+    lambda: {(("status", k),): v for k, v in job_queue.stats().items() if k != "workers"},
+)
@@ -0,0 +1,426 @@
+"""
+Upload processing pipeline shared by the synchronous ``/api/upload`` endpoint
+and the background upload jobs.
+
+Stages: save → parse → [append] → profile → propose → preview. Each stage
+runs inside ``StageTracker.stage`` so callers can observe per-stage status and
+timings. In append/upsert mode the file is parsed into a staging dataset and
+the append stage moves it into the target dataset as a new partition.
+
+The propose stage only builds the heuristic widgets. With
+``LLM_REFINE_WIDGETS`` on, the LLM refines them in a background task after
+the response is ready: the refined widgets replace the heuristic ones in the
+returned result (seen by upload jobs) and fill the upload result cache.
+"""
+import asyncio, logging, os, uuid, time
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import pyarrow as pa
+from fastapi import HTTPException, Request, UploadFile
+
+from backend.app.core.concurrency import cancel_on_disconnect, run_blocking
+from backend.app.core.config import settings
+from backend.app.core.telemetry import timed
+from backend.app.services import dataset_registry, dataset_store, upload_cache
+from backend.app.services.columnar import table_rows
+from backend.app.services.dataset_append import APPEND_MODES, SchemaMismatch, append_dataset
+from backend.app.services.dashboard_generator import agenerate_quick_viz
+from backend.app.services.document_ingest import DOCUMENT_EXTS, ingest_document
+from backend.app.services.dtype_optimizer import maybe_optimize
+from backend.app.services.excel_ingest import EXCEL_EXTS, ingest_workbook
+from backend.app.services.file_parsers import parse_file, validate_dataframe
+from backend.app.services.profiler import dataset_sample, profile_dataset
+from backend.app.services.streaming_ingest import (
+    STREAMABLE_EXTS,
+    save_upload_stream,
+    stream_delimited_to_parquet,
+)
+
+# Create uploads directory using absolute path
+ROOT_DIR = Path(__file__).parent.parent.parent  # Go up to project root
+UPLOAD_DIR = ROOT_DIR / "app" / "tmp" / "uploads"
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+SUPPORTED_EXTS = ['csv', 'tsv', 'txt', 'xlsx', 'xls', 'pdf', 'docx', 'doc']
+
+logger = logging.getLogger(__name__)
+
+# Refinements still running; holding them keeps the tasks from being collected
+_refinements: Set[asyncio.Task] = set()
+
+
+class StageTracker:
+    """Per-stage status and timings for one upload; ``on_change`` fires on every update"""
+
+    def __init__(self, on_change: Optional[Callable[[], None]] = None):
+        self.stages: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.on_change = on_change
+
+    def _set(self, name: str, **fields) -> None:
+        self.stages.setdefault(name, {"status": "pending", "seconds": None})
+        self.stages[name].update(fields)
+        if self.on_change:
+            self.on_change()
+
+    def record(self, name: str, seconds: float, status: str = "done") -> None:
+        self._set(name, status=status, seconds=round(seconds, 4))
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        self._set(name, status="running", started_at=time.time())
+        start = time.perf_counter()
+        try:
+            with timed(f"upload.{name}"):
+                yield
+        except BaseException:
+            self._set(name, status="failed", seconds=round(time.perf_counter() - start, 4))
+            raise
+        self._set(name, status="done", seconds=round(time.perf_counter() - start, 4))
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: dict(info) for name, info in self.stages.items()}
+
+
+def check_upload_filename(filename: Optional[str]) -> str:
+    """Validate the uploaded file name and return its lower-case extension"""
+    if not filename:
+        raise HTTPException(status_code=400, detail="No filename provided")
+
+    # Get file extension
+    file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
+
+    if file_ext not in SUPPORTED_EXTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: .{file_ext}. Supported: {', '.join(SUPPORTED_EXTS)}"
+        )
+    return file_ext
+
+
+def check_upload_mode(
+    mode: Optional[str], dataset_id: Optional[str], key: Optional[str]
+) -> Tuple[str, Optional[str], Optional[List[str]]]:
+    """Validate the upload mode fields; returns (mode, target dataset, upsert key columns)"""
+    mode = (mode or "create").strip().lower()
+    if mode == "create":
+        return mode, None, None
+    if mode not in APPEND_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported upload mode: {mode}")
+    if not dataset_id:
+        raise HTTPException(status_code=400, detail=f"mode={mode} needs a dataset_id")
+    if not dataset_store.exists(dataset_id):
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    keys = [k.strip() for k in (key or "").split(",") if k.strip()] or None
+    if mode == "upsert" and not keys:
+        raise HTTPException(status_code=400, detail="mode=upsert needs key columns")
+    return mode, dataset_id, keys
+
+
+async def save_upload(file: UploadFile, tracker: StageTracker) -> Tuple[str, str]:
+    """Spool the upload into ``UPLOAD_DIR``; returns (path, sha256)"""
+    async with tracker.stage("save"):
+        fpath = str(UPLOAD_DIR / f"{uuid.uuid4()}_{file.filename}")
+        bytes_written, content_hash = await save_upload_stream(file, fpath)
+
+    logger.info("upload saved", extra={"path": fpath, "bytes": bytes_written, "sha256": content_hash})
+    return fpath, content_hash
+
+
+@timed("upload.preview_rows")
+def _preview_rows(dataset_id: str) -> List[Dict[str, Any]]:
+    """JSON-ready preview rows from the dataset's profile sample"""
+    try:
+        df = dataset_sample(dataset_id)
+
+        # Straight from the columns to JSON-safe rows; no to_json/json.loads round trip
+        preview_rows = table_rows(pa.Table.from_pandas(df, preserve_index=False))
+        logger.debug("preview built", extra={"dataset_id": dataset_id, "rows": len(preview_rows)})
+        return preview_rows
+    except Exception:
+        # ignore preview failure; widgets can still be shown with empty data
+        logger.warning("preview failed", extra={"dataset_id": dataset_id}, exc_info=True)
+        return []
+
+
+async def _refine_widgets(
+    result: Dict[str, Any], content_hash: str, cache: bool, on_refined: Optional[Callable[[], None]]
+) -> None:
+    """Replace the heuristic widgets in ``result`` with LLM-refined ones"""
+    dataset_id, domain, intent = result["dataset_id"], result["domain"], result["intent"]
+    try:
+        # Without the fallback a failed LLM call raises instead of returning the draft
+        widgets, groq_input, groq_response = await agenerate_quick_viz(
+            dataset_id=dataset_id, domain=domain, intent=intent, refine=True, fallback=False
+        )
+    except Exception as e:
+        # Nothing is cached, so the next upload of the same file tries again
+        logger.warning("widget refinement failed, keeping heuristic widgets: %s", e, extra={"dataset_id": dataset_id})
+        result["refinement"] = "failed"
+    else:
+        result.update(widgets=widgets, groq_input=groq_input, groq_response=groq_response, refinement="done")
+        logger.info("widgets refined", extra={"dataset_id": dataset_id, "widgets": len(widgets)})
+        if cache:
+            upload_cache.put_result(content_hash, domain, intent, {
+                "dataset_id": dataset_id,
+                "widgets": widgets,
+                "groq_input": groq_input,
+                "groq_response": groq_response,
+            })
+    if on_refined:
+        on_refined()
+
+
+def _start_refinement(
+    result: Dict[str, Any], content_hash: str, cache: bool, on_refined: Optional[Callable[[], None]]
+) -> None:
+    task = asyncio.create_task(_refine_widgets(result, content_hash, cache, on_refined))
+    _refinements.add(task)
+    task.add_done_callback(_refinements.discard)
+
+
+async def run_upload_pipeline(
+    fpath: str,
+    file_ext: str,
+    content_hash: str,
+    domain: str,
+    intent: str,
+    tracker: StageTracker,
+    request: Optional[Request] = None,
+    mode: str = "create",
+    target_dataset_id: Optional[str] = None,
+    keys: Optional[List[str]] = None,
+    on_refined: Optional[Callable[[], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Parse, profile and propose widgets for a saved upload.
+
+    When ``request`` is given the widget proposal is abandoned if that client
+    disconnects; background jobs pass None and always run to completion.
+    ``mode`` "append" or "upsert" (see ``check_upload_mode``) extends
+    ``target_dataset_id`` instead of creating a dataset.
+
+    The result holds heuristic widgets. While ``refinement`` is "pending" an
+    LLM refinement is running and will update the result in place, then call
+    ``on_refined``; it ends "done" or "failed" ("off" when disabled).
+    """
+    appending = mode in APPEND_MODES
+
+    # Same bytes, domain and intent as an earlier upload: serve the stored result
+    cached_result = None if appending else upload_cache.get_result(content_hash, domain, intent)
+    if cached_result is not None:
+        await run_blocking(os.remove, fpath)
+        logger.info("upload result cache hit", extra={"dataset_id": cached_result["dataset_id"]})
+        async with tracker.stage("preview"):
+            preview_rows = await run_blocking(_preview_rows, cached_result["dataset_id"])
+            profile = await run_blocking(profile_dataset, cached_result["dataset_id"])
+        return {
+            **cached_result,
+            "preview": preview_rows,
+            "domain": domain,
+            "intent": intent,
+            "ingest": None,
+            "profile": profile,
+            "cached": True,
+            "refinement": None,
+            "stages": tracker.to_dict(),
+        }
+
+    # Same bytes under a different intent (or before a restart): reuse the parsed dataset
+    dataset_id = None if appending else upload_cache.get_dataset(content_hash)
+    if dataset_id is None and not appending:
+        dataset_id = await run_blocking(dataset_registry.find_by_hash, content_hash)
+        if dataset_id is not None:
+            upload_cache.put_dataset(content_hash, dataset_id)
+    reused = dataset_id is not None
+    ingest_stats = None
+    append_stats = None
+
+    # Parse file using appropriate parser
+    try:
+        async with tracker.stage("parse"):
+            if dataset_id is not None:
+                await run_blocking(os.remove, fpath)
+                logger.info("reusing parsed dataset", extra={"dataset_id": dataset_id})
+            elif file_ext in STREAMABLE_EXTS:
+
+                # Delimited text streams straight into the dataset store without a DataFrame
+                dataset_id = dataset_store.new_dataset_id()
+                parquet_path = str(dataset_store.next_part_path(dataset_id))
+                with timed("upload.parquet_write", file_ext=file_ext):
+                    ingest_stats = await run_blocking(stream_delimited_to_parquet, fpath, parquet_path)
+                sample_df = await run_blocking(dataset_sample, dataset_id)
+                with timed("upload.validate_dataframe"):
+                    validate_dataframe(sample_df, min_rows=1, min_cols=1)
+                upload_cache.put_dataset(content_hash, dataset_id)
+
+                logger.info("upload streamed to parquet", extra={
+                    "dataset_id": dataset_id,
+                    "rows": ingest_stats["rows"],
+                    "columns": len(ingest_stats["columns"]),
+                    "rows_per_sec": ingest_stats["rows_per_sec"],
+                    "peak_rss_mb": ingest_stats["peak_rss_mb"],
+                })
+            elif file_ext in EXCEL_EXTS:
+
+                # One table per sheet, parsed in parallel worker processes
+                dataset_id = dataset_store.new_dataset_id()
+                with timed("upload.parse_excel", file_ext=file_ext):
+                    ingest_stats = await run_blocking(ingest_workbook, fpath, dataset_id)
+                sample_df = await run_blocking(dataset_sample, dataset_id)
+                with timed("upload.validate_dataframe"):
+                    validate_dataframe(sample_df, min_rows=1, min_cols=1)
+                upload_cache.put_dataset(content_hash, dataset_id)
+
+                logger.info("workbook parsed", extra={
+                    "dataset_id": dataset_id,
+                    "sheets": len(ingest_stats["sheets"]),
+                    "tables": ingest_stats["tables"],
+                    "rows": ingest_stats["rows"],
+                    "seconds": ingest_stats["seconds"],
+                })
+            elif file_ext in DOCUMENT_EXTS:
+
+                # Pages / tables are extracted in worker processes; unchanged ones come from cache
+                dataset_id = dataset_store.new_dataset_id()
+                with timed("upload.parse_document", file_ext=file_ext):
+                    ingest_stats = await run_blocking(ingest_document, fpath, file_ext, dataset_id)
+                sample_df = await run_blocking(dataset_sample, dataset_id)
+                with timed("upload.validate_dataframe"):
+                    validate_dataframe(sample_df, min_rows=1, min_cols=1)
+                upload_cache.put_dataset(content_hash, dataset_id)
+
+                logger.info("document tables extracted", extra={
+                    "dataset_id": dataset_id,
+                    "units": ingest_stats["units"],
+                    "cached_units": ingest_stats["cached_units"],
+                    "tables": len(ingest_stats["tables"]),
+                    "rows": ingest_stats["rows"],
+                    "seconds": ingest_stats["seconds"],
+                })
+            else:
+                with timed("upload.parse_file", file_ext=file_ext):
+                    df_parsed, file_type_detected = await run_blocking(parse_file, fpath)
+                with timed("upload.validate_dataframe"):
+                    validate_dataframe(df_parsed, min_rows=1, min_cols=1)
+
+                with timed("upload.optimize_dtypes"):
+                    df_parsed, memory = await run_blocking(maybe_optimize, df_parsed)
+                ingest_stats = {
+                    "rows": int(df_parsed.shape[0]),
+                    "columns": int(df_parsed.shape[1]),
+                    "memory": memory,
+                }
+
+                logger.info("upload parsed", extra={
+                    "file_type": file_type_detected,
+                    "rows": df_parsed.shape[0],
+                    "columns": df_parsed.shape[1],
+                    "memory": memory and {k: memory[k] for k in ("bytes_before", "bytes_after")},
+                })
+
+                # Persist once as typed Parquet; downstream readers never re-sniff types
+                dataset_id = dataset_store.new_dataset_id()
+                with timed("upload.parquet_write", file_ext=file_ext):
+                    await run_blocking(dataset_store.write_dataframe, dataset_id, df_parsed)
+                upload_cache.put_dataset(content_hash, dataset_id)
+
+        # The parsed file becomes a new partition of the target dataset
+        if appending:
+            async with tracker.stage("append"):
+                try:
+                    append_stats = await run_blocking(
+                        append_dataset, target_dataset_id, dataset_id, mode, keys
+                    )
+                except SchemaMismatch as e:
+                    await run_blocking(dataset_registry.delete, dataset_id)
+                    raise HTTPException(status_code=400, detail=f"Schema does not match dataset: {e}")
+            dataset_id = target_dataset_id
+
+        # One profiling scan feeds hints, heuristic widgets and the preview
+        async with tracker.stage("profile"):
+            profile = await run_blocking(profile_dataset, dataset_id)
+            sample_df = await run_blocking(dataset_sample, dataset_id)
+            if appending:
+                await run_blocking(dataset_registry.refresh, dataset_id, profile)
+            elif not reused:
+                # Saved files are named "<uuid>_<original name>"
+                await run_blocking(
+                    dataset_registry.register, dataset_id,
+                    name=Path(fpath).name.split("_", 1)[-1], source_type=file_ext,
+                    content_hash=content_hash, profile=profile,
+                )
+
+        # Rendering the sample is only worth it when someone reads debug output
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("parsed data preview\n%s", sample_df.head(5).to_string())
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = str(e)
+        if append_stats is not None:
+            # The target already holds the new rows; this is not a problem with the file
+            logger.error("profiling failed after append: %s", error_msg, extra={"dataset_id": dataset_id})
+            raise HTTPException(
+                status_code=500, detail=f"Rows were appended to dataset {dataset_id} but profiling failed: {error_msg}"
+            )
+        logger.warning("parsing failed: %s", error_msg, extra={"file_ext": file_ext})
+        raise HTTPException(status_code=400, detail=f"Failed to parse file: {error_msg}")
+
+    # Heuristic widgets only; the LLM never holds up the response
+    refine = settings.llm_refine_widgets
+    async with tracker.stage("propose"):
+        viz = agenerate_quick_viz(dataset_id=dataset_id, domain=domain, intent=intent, refine=False)
+        if request is not None:
+            widgets, groq_input, groq_response = await cancel_on_disconnect(request, viz)
+        else:
+            widgets, groq_input, groq_response = await viz
+        logger.info("widgets generated", extra={"dataset_id": dataset_id, "widgets": len(widgets)})
+
+        # Only final widgets are cached: refined ones once the refinement succeeds,
+        # heuristic ones when refinement is off. Appends are not cached at all,
+        # since the uploaded bytes no longer describe the whole dataset.
+        if not refine and not appending:
+            upload_cache.put_result(content_hash, domain, intent, {
+                "dataset_id": dataset_id,
+                "widgets": widgets,
+                "groq_input": groq_input,
+                "groq_response": groq_response,
+            })
+
+    # Return a small preview sample so the client can render Vega-Lite immediately
+    async with tracker.stage("preview"):
+        preview_rows = await run_blocking(_preview_rows, dataset_id)
+
+    response_data = {
+        "dataset_id": dataset_id,
+        "widgets": widgets,
+        "preview": preview_rows,
+        "domain": domain,
+        "intent": intent,
+        "groq_input": groq_input,
+        "groq_response": groq_response,
+        "ingest": ingest_stats,
+        "append": append_stats,
+        "profile": profile,
+        "cached": False,
+        "refinement": "pending" if refine else "off",
+        "stages": tracker.to_dict(),
+    }
+    if refine:
+        _start_refinement(response_data, content_hash, not appending, on_refined)
+
+    await run_blocking(upload_cache.enforce_upload_quota, UPLOAD_DIR)
+    await run_blocking(dataset_registry.enforce_disk_quota, keep={dataset_id})
+
+    logger.info("upload processed", extra={
+        "dataset_id": dataset_id,
+        "widgets": len(widgets),
+        "preview_rows": len(preview_rows),
+        "stages": {name: info["seconds"] for name, info in tracker.stages.items()},
+    })
+
+    return response_data